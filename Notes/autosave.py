@@ -0,0 +1,355 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import tkinter as tk
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from formatting import Span
+from store import NoteStore
+
+# Пауза во вводе (мс), после которой изменения записываются в базу
+IDLE_MS = 1500
+
+# Как часто (мс) при вводе несохраненные изменения попадают в журнал,
+# не дожидаясь записи в базу после паузы IDLE_MS
+JOURNAL_MS = 300
+
+# Для больших заметок журнал пополняется реже: интервал растет на
+# JOURNAL_MS за каждые JOURNAL_CHARS символов текста
+JOURNAL_CHARS = 64 * 1024
+
+# Период (мс) опроса результатов фоновой записи
+POLL_MS = 100
+
+# Пауза (с) перед повторной попыткой записи после ошибки
+RETRY_SECONDS = 5.0
+
+
+class Snapshot(NamedTuple):
+    """Состояние редактора для записи: key — ключ черновика или заметки."""
+    key: str
+    note_id: Optional[int]
+    title: str
+    content: str
+    spans: List[Span]
+    category_id: int
+
+
+class Checkpoint(NamedTuple):
+    """Снимок, который нужно только дописать в журнал, без записи в базу."""
+    snapshot: Snapshot
+
+
+class SaveResult(NamedTuple):
+    """Итог записи снимка: note_id — id заметки (в том числе только что созданной)."""
+    key: str
+    note_id: int
+    title: str
+    category_id: int
+
+
+class AutoSaver:
+    """Автосохранение заметки в фоновом потоке.
+
+    Изменения отмечаются через mark_dirty, а после паузы IDLE_MS снимок
+    редактора уходит потоку записи. Тот объединяет накопившиеся снимки
+    (последний снимок каждой заметки побеждает) и пишет их одной
+    транзакцией через собственное хранилище. Журнал рядом с базой
+    хранит последний снимок каждой заметки, еще не записанной в базу, и
+    перезаписывается целиком через временный файл, так что его размер
+    зависит от размера заметок, а не от длительности ввода; когда все
+    снимки записаны, журнал удаляется. Чтобы правки не терялись при сбое
+    во время паузы IDLE_MS, при вводе снимок попадает в журнал (без
+    записи в базу) раз в JOURNAL_MS, для больших заметок — реже (см.
+    JOURNAL_CHARS). При запуске незаписанные снимки из журнала
+    применяются функцией replay_journal.
+    """
+
+    def __init__(self, root: tk.Misc, open_store: Callable[[], NoteStore], journal_path: str,
+                 capture: Callable[[], Optional[Snapshot]],
+                 on_saved: Callable[[SaveResult], None],
+                 on_error: Callable[[Exception], None],
+                 idle_ms: int = IDLE_MS, journal_ms: int = JOURNAL_MS):
+        self.root = root
+        self.open_store = open_store
+        self.journal_path = journal_path
+        self.capture = capture
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self.idle_ms = idle_ms
+        self.journal_ms = journal_ms
+        self.dirty = False
+        self._after_id: Optional[str] = None
+        self._journal_id: Optional[str] = None
+        self._checkpointed: Optional[Snapshot] = None  # Последний снимок, переданный для журнала
+        self._journal_chars = 0  # Размер текста последнего снимка (для интервала журнала)
+        self._poll_id: Optional[str] = None
+        self._pending = 0  # Снимков, итог записи которых еще не доставлен в поток Tk
+        self._unwritten = 0  # Снимков, еще не записанных в базу (под _written)
+        self._written = threading.Condition()
+        self._queue: "queue.Queue[Union[Snapshot, Checkpoint, None]]" = queue.Queue()
+        self._results: "queue.Queue[Tuple[List[SaveResult], Optional[Exception], int]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="autosave-writer", daemon=True)
+        self._writer.start()
+
+    def mark_dirty(self) -> None:
+        """Отметка изменения; запись откладывается до паузы во вводе, а
+        журнал пополняется не позже чем через journal_ms (для больших
+        заметок — пропорционально дольше)."""
+        self.dirty = True
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        self._after_id = self.root.after(self.idle_ms, self.flush)
+        if self._journal_id is None:
+            delay = self.journal_ms * (1 + self._journal_chars // JOURNAL_CHARS)
+            self._journal_id = self.root.after(delay, self.checkpoint)
+
+    def checkpoint(self) -> None:
+        """Передача снимка несохраненных изменений потоку записи только для
+        журнала; снимок, совпадающий с предыдущим, не передается."""
+        self._journal_id = None
+        if not self.dirty:
+            return
+        snapshot = self.capture()
+        if snapshot is None:
+            return
+        self._journal_chars = len(snapshot.content)
+        if snapshot != self._checkpointed:
+            self._checkpointed = snapshot
+            self._queue.put(Checkpoint(snapshot))
+
+    def _cancel_checkpoint(self) -> None:
+        if self._journal_id is not None:
+            self.root.after_cancel(self._journal_id)
+            self._journal_id = None
+
+    @property
+    def idle(self) -> bool:
+        """Нет ни несохраненных изменений, ни снимков, итог записи которых еще не получен."""
+        return not self.dirty and self._pending == 0
+
+    def reset(self) -> None:
+        """Сброс признака изменений (после загрузки или удаления заметки)."""
+        self.dirty = False
+        self._cancel_checkpoint()
+        self._checkpointed = None
+        self._journal_chars = 0
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def flush(self, force: bool = False) -> bool:
+        """Немедленная передача снимка на запись.
+
+        Без force снимок делается, только если есть несохраненные
+        изменения. Возвращает False, если редактор нечего или нельзя
+        сохранить (например, пустой заголовок).
+        """
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._cancel_checkpoint()
+        if not (self.dirty or force):
+            return True
+        snapshot = self.capture()
+        if snapshot is None:
+            return False
+        self.dirty = False
+        self._checkpointed = snapshot
+        self._journal_chars = len(snapshot.content)
+        self._pending += 1
+        with self._written:
+            self._unwritten += 1
+        self._queue.put(snapshot)
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_MS, self._poll)
+        return True
+
+    def wait(self, timeout: float = 1.0) -> bool:
+        """Ожидание записи переданных снимков (перед повторным чтением заметки из базы)."""
+        with self._written:
+            return self._written.wait_for(lambda: self._unwritten == 0, timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Остановка потока записи с ожиданием уже переданных снимков."""
+        self.reset()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._queue.put(None)
+        self._writer.join(timeout)
+
+    def _poll(self) -> None:
+        """Доставка итогов записи в поток Tk."""
+        self._poll_id = None
+        while True:
+            try:
+                results, error, count = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if error is not None:
+                self.on_error(error)
+                continue
+            self._pending -= count
+            for result in results:
+                self.on_saved(result)
+        if self._pending:
+            self._poll_id = self.root.after(POLL_MS, self._poll)
+
+    # Поток записи
+
+    def _write_loop(self) -> None:
+        """Цикл потока записи: объединение снимков и запись пачкой."""
+        store: Optional[NoteStore] = None
+        batch: Dict[str, Snapshot] = {}  # Незаписанные снимки по ключу, в порядке поступления
+        created: Dict[str, int] = {}  # Ключ черновика -> id созданной заметки
+        journal: Dict[str, Snapshot] = {}  # Последний снимок каждой заметки, еще не записанной в базу
+        consumed = 0  # Снимков из очереди, вошедших в batch
+        stopping = False
+        while not stopping:
+            items: List[Union[Snapshot, Checkpoint, None]] = []
+            try:
+                items.append(self._queue.get(timeout=RETRY_SECONDS if batch else None))
+            except queue.Empty:
+                pass
+            # Всё, что уже накопилось в очереди, записывается той же транзакцией
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            changed = False  # Изменилось ли содержимое журнала
+            for item in items:
+                if item is None:
+                    stopping = True
+                    continue
+                changed = True
+                if isinstance(item, Checkpoint):
+                    journal[item.snapshot.key] = item.snapshot
+                else:
+                    consumed += 1
+                    batch.pop(item.key, None)
+                    batch[item.key] = item
+                    journal[item.key] = item
+            if batch:
+                try:
+                    if changed:
+                        _write_journal(self.journal_path, journal, created)
+                    if store is None:
+                        store = self.open_store()
+                    results = _write_snapshots(store, list(batch.values()), created)
+                except (sqlite3.Error, OSError) as e:
+                    self._results.put(([], e, 0))
+                    continue
+                # Снимок, пришедший для журнала после записанного, остается в журнале
+                for key, snapshot in batch.items():
+                    if journal.get(key) is snapshot:
+                        del journal[key]
+                batch.clear()
+                changed = True
+                self._results.put((results, None, consumed))
+                with self._written:
+                    self._unwritten -= consumed
+                    self._written.notify_all()
+                consumed = 0
+            if changed:
+                try:
+                    _write_journal(self.journal_path, journal, created)
+                except OSError as e:
+                    self._results.put(([], e, 0))
+        if store is not None:
+            store.close()
+
+
+def _write_snapshots(store: NoteStore, snapshots: List[Snapshot],
+                     created: Dict[str, int]) -> List[SaveResult]:
+    """Запись снимков одной транзакцией.
+
+    created дополняется id созданных черновиков только после фиксации,
+    чтобы откат не оставил ссылок на несуществующие заметки.
+    """
+    results = []
+    new_created = dict(created)
+    with store.transaction():
+        for snapshot in snapshots:
+            note_id = snapshot.note_id or new_created.get(snapshot.key)
+            if note_id is None:
+                note_id = store.create_note(snapshot.title, snapshot.content, snapshot.category_id,
+                                            snapshot.spans)
+                new_created[snapshot.key] = note_id
+            elif not store.update_note(note_id, snapshot.title, snapshot.content, snapshot.category_id,
+                                       snapshot.spans):
+                # Заметка удалена, пока снимок ждал записи
+                continue
+            results.append(SaveResult(snapshot.key, note_id, snapshot.title, snapshot.category_id))
+    created.update(new_created)
+    return results
+
+
+def _write_journal(path: str, snapshots: Dict[str, Snapshot], created: Dict[str, int]) -> None:
+    """Перезапись журнала снимками незаписанных заметок через временный файл с fsync.
+
+    Первой строкой идет отметка с id уже созданных черновиков из
+    журнала, чтобы при восстановлении не создать их повторно. Без
+    снимков журнал удаляется.
+    """
+    if not snapshots:
+        _clear_journal(path)
+        return
+    committed = [(key, created[key]) for key in snapshots if key in created]
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        if committed:
+            f.write(json.dumps({"committed": committed}, ensure_ascii=False) + "\n")
+        for snapshot in snapshots.values():
+            f.write(json.dumps({"snapshot": snapshot._asdict()}, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def _clear_journal(path: str) -> None:
+    """Удаление журнала после записи всех снимков."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def replay_journal(store: NoteStore, path: str) -> int:
+    """Применение незафиксированных снимков из журнала автосохранения.
+
+    Отметка о фиксации означает, что снимки перечисленных в ней заметок
+    до неё записаны; из неё же берутся id уже созданных черновиков, чтобы
+    не создать их повторно. Снимки, попавшие только в журнал (пока шла
+    пауза перед записью), восстанавливаются так же. Оборванная последняя
+    строка (журнал прежнего формата, дописываемый в конец) пропускается.
+    Возвращает количество восстановленных заметок.
+    """
+    if not os.path.exists(path):
+        return 0
+    pending: Dict[str, Snapshot] = {}
+    created: Dict[str, int] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if "committed" in record:
+                # Отметка закрывает только записанные снимки: снимки других
+                # заметок могли попасть в журнал без записи в базу
+                for key, note_id in record["committed"]:
+                    created[key] = note_id
+                    pending.pop(key, None)
+            elif "snapshot" in record:
+                data = record["snapshot"]
+                data["spans"] = [tuple(span) for span in data["spans"]]
+                snapshot = Snapshot(**data)
+                pending.pop(snapshot.key, None)
+                pending[snapshot.key] = snapshot
+    restored = _write_snapshots(store, list(pending.values()), created) if pending else []
+    _clear_journal(path)
+    return len(restored)
@@ -0,0 +1,192 @@
+"""Нагрузочные замеры слоя данных NoteStore на синтетических базах.
+
+Пример запуска:
+    python benchmark.py --sizes 10000 100000 1000000 --ops 200
+
+Базы генерируются один раз и переиспользуются (см. --db-dir); замеры,
+изменяющие данные, выполняются на временной копии, так что корпус от
+запуска к запуску не меняется. Результаты печатаются таблицей
+перцентилей и, при необходимости, сохраняются в JSON для сравнения
+между версиями.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from typing import Callable, Dict, List
+
+from store import NoteStore
+
+OPERATIONS = ("list", "search", "load", "save", "delete")
+PERCENTILES = (50, 90, 99)
+CATEGORY_COUNT = 20
+BATCH_SIZE = 10000
+
+
+def make_vocabulary(rng: random.Random, size: int = 5000) -> List[str]:
+    """Словарь псевдослов для генерации текста."""
+    letters = "абвгдежзиклмнопрстуфхцчшэюяabcdefghijklmnoprstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def generate_corpus(path: str, size: int, body_words: int, seed: int) -> None:
+    """Создание базы с size заметками, распределенными по категориям."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    # Частоты слов по закону Ципфа, как в естественном тексте
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocabulary))))
+    store = NoteStore(path)
+    try:
+        category_ids = [store.add_category(f"Категория {i}") for i in range(CATEGORY_COUNT)]
+        created = 0
+        while created < size:
+            batch = min(BATCH_SIZE, size - created)
+            notes = []
+            for _ in range(batch):
+                words = rng.choices(vocabulary, cum_weights=cum_weights, k=body_words + 5)
+                notes.append((" ".join(words[:5]), " ".join(words[5:]), rng.choice(category_ids)))
+            store.bulk_create(notes)
+            created += batch
+            print(f"  сгенерировано {created}/{size}", file=sys.stderr, end="\r")
+        print(file=sys.stderr)
+    finally:
+        store.close()
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(samples)
+    rank = math.ceil(p / 100.0 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def measure(operation: Callable[[], object], count: int) -> List[float]:
+    """Время выполнения операции count раз, в миллисекундах."""
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        operation()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+
+def copy_database(source: str, target: str) -> None:
+    """Согласованная копия базы (с учетом WAL) через backup API."""
+    src = sqlite3.connect(source)
+    try:
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+def remove_database(path: str) -> None:
+    """Удаление файла базы вместе с файлами WAL и shm."""
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def run_benchmark(path: str, ops: int, seed: int) -> Dict[str, List[float]]:
+    """Замеры всех операций на готовой базе."""
+    rng = random.Random(seed)
+    store = NoteStore(path)
+    try:
+        category_ids = [store.category_id(name) for name in store.categories()]
+        max_id = store.conn.execute("SELECT max(id) FROM notes").fetchone()[0] or 1
+        vocabulary = [row[0].split()[0] for row in store.conn.execute(
+            "SELECT title FROM notes ORDER BY random() LIMIT 200")]
+
+        def list_page() -> None:
+            category_id = rng.choice(category_ids)
+            page = store.list_notes(category_id, limit=100)
+            if page:
+                store.list_notes(category_id, (page[-1][2], page[-1][0]), 100)
+
+        def search() -> None:
+            word = rng.choice(vocabulary)
+            store.search(word[:max(3, len(word) - 2)], limit=100)
+
+        def load() -> None:
+            store.get_note(rng.randint(1, max_id))
+
+        def save() -> None:
+            note_id = rng.randint(1, max_id)
+            note = store.get_note(note_id)
+            if note is not None:
+                title, content, category_id, spans = note
+                store.update_note(note_id, title, content + " правка", category_id, spans)
+
+        scratch_ids: List[int] = []
+        category_id = category_ids[0]
+        for i in range(ops):
+            scratch_ids.append(store.create_note(f"временная {i}", "удаляемая заметка", category_id))
+
+        def delete() -> None:
+            store.delete_note(scratch_ids.pop())
+
+        return {
+            "list": measure(list_page, ops),
+            "search": measure(search, ops),
+            "load": measure(load, ops),
+            "save": measure(save, ops),
+            "delete": measure(delete, ops),
+        }
+    finally:
+        store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замеры задержек NoteStore на синтетических базах")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="количество заметок в базах")
+    parser.add_argument("--ops", type=int, default=200, help="повторов каждой операции")
+    parser.add_argument("--body-words", type=int, default=60, help="слов в тексте заметки")
+    parser.add_argument("--db-dir", default="bench_data", help="каталог для сгенерированных баз")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора")
+    parser.add_argument("--json", help="файл для сохранения результатов")
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    report = {}
+    print(f"{'заметок':>9} {'операция':<8} " + " ".join(f"{'p%d' % p:>9}" for p in PERCENTILES) + f" {'max':>9}")
+    for size in args.sizes:
+        path = os.path.join(args.db_dir, f"bench_{size}_{args.body_words}_{args.seed}.db")
+        if not os.path.exists(path):
+            print(f"Генерация базы на {size} заметок...", file=sys.stderr)
+            # Генерация во временный файл, чтобы прерванный запуск не оставил неполную базу
+            generate_corpus(path + ".partial", size, args.body_words, args.seed)
+            os.replace(path + ".partial", path)
+        # Сохранение и удаление меняют базу: замеры идут на копии, чтобы
+        # каждый запуск работал с одним и тем же исходным корпусом
+        work_path = path + ".run"
+        copy_database(path, work_path)
+        try:
+            results = run_benchmark(work_path, args.ops, args.seed)
+        finally:
+            remove_database(work_path)
+        report[size] = {}
+        for name in OPERATIONS:
+            samples = results[name]
+            stats = {f"p{p}": percentile(samples, p) for p in PERCENTILES}
+            stats["max"] = max(samples)
+            report[size][name] = stats
+            print(f"{size:>9} {name:<8} " + " ".join(f"{stats['p%d' % p]:>7.2f}мс" for p in PERCENTILES)
+                  + f" {stats['max']:>7.2f}мс")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import codecs
+import sqlite3
+import zlib
+from typing import Iterator, Optional, Tuple
+
+# Тела заметок от этого размера (в байтах UTF-8) хранятся сжатыми в note_bodies
+LARGE_NOTE_BYTES = 256 * 1024
+
+# Размер порции при чтении сжатого тела и при выдаче распакованного текста
+CHUNK_BYTES = 64 * 1024
+
+COMPRESSION_LEVEL = 6
+
+
+def split_body(content: str) -> Tuple[Optional[str], Optional[bytes], int]:
+    """Разделение тела заметки по месту хранения.
+
+    Возвращает (текст для notes.content, сжатые данные для note_bodies,
+    размер в байтах). Для небольших заметок сжатых данных нет, для больших
+    notes.content остается NULL.
+    """
+    if len(content) * 4 < LARGE_NOTE_BYTES:
+        return content, None, len(content)
+    encoded = content.encode("utf-8")
+    if len(encoded) < LARGE_NOTE_BYTES:
+        return content, None, len(encoded)
+    return None, zlib.compress(encoded, COMPRESSION_LEVEL), len(encoded)
+
+
+def write_body(conn: sqlite3.Connection, note_id: int, content: str,
+               compressed: Optional[bytes], size: int, index_fts: bool) -> None:
+    """Запись (или удаление) сжатого тела после записи строки notes.
+
+    Триггеры FTS индексируют notes.content, которое у больших заметок
+    NULL, поэтому полный текст таких заметок передается в индекс явно.
+    """
+    # Без INSERT OR REPLACE: при замене строки триггеры удаления не срабатывают,
+    # и category_stats не учли бы размер прежнего тела
+    conn.execute("DELETE FROM note_bodies WHERE note_id = ?", (note_id,))
+    if compressed is None:
+        return
+    conn.execute("INSERT INTO note_bodies (note_id, data, size) VALUES (?, ?, ?)",
+                 (note_id, compressed, size))
+    if index_fts:
+        conn.execute("UPDATE notes_fts SET content = ? WHERE rowid = ?", (content, note_id))
+
+
+def iter_body(conn: sqlite3.Connection, note_id: int, chunk_bytes: int = CHUNK_BYTES) -> Iterator[str]:
+    """Потоковая распаковка сжатого тела заметки порциями текста.
+
+    Данные читаются через инкрементальный ввод-вывод BLOB (Python 3.11+),
+    так что в памяти одновременно находится лишь одна порция.
+    """
+    decompressor = zlib.decompressobj()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(data: bytes) -> Iterator[str]:
+        while data:
+            text = decoder.decode(decompressor.decompress(data, chunk_bytes))
+            data = decompressor.unconsumed_tail
+            if text:
+                yield text
+
+    if hasattr(conn, "blobopen"):
+        try:
+            blob = conn.blobopen("note_bodies", "data", note_id, readonly=True)
+        except sqlite3.OperationalError:
+            return
+        with blob:
+            while True:
+                data = blob.read(chunk_bytes)
+                if not data:
+                    break
+                yield from feed(data)
+    else:
+        row = conn.execute("SELECT data FROM note_bodies WHERE note_id = ?", (note_id,)).fetchone()
+        if row is None:
+            return
+        view = memoryview(row[0])
+        for start in range(0, len(view), chunk_bytes):
+            yield from feed(view[start:start + chunk_bytes])
+    tail = decoder.decode(decompressor.flush(), final=True)
+    if tail:
+        yield tail
+
+
+def read_body(conn: sqlite3.Connection, note_id: int) -> Optional[str]:
+    """Полный текст сжатого тела заметки или None, если его нет."""
+    row = conn.execute("SELECT data FROM note_bodies WHERE note_id = ?", (note_id,)).fetchone()
+    if row is None:
+        return None
+    return zlib.decompress(row[0]).decode("utf-8")
@@ -0,0 +1,339 @@
+"""Пакетные выгрузка и загрузка всех заметок базы.
+
+Форматы:
+    jsonl     — одна заметка на строку JSON;
+    markdown  — каталог с подкаталогом на каждую категорию и файлом .md
+                на каждую заметку (служебные поля во front matter);
+    zip       — то же дерево Markdown внутри zip-архива.
+
+Выгрузка читает базу курсором порциями, загрузка разбирает файлы в пуле
+процессов и вставляет заметки через executemany одной транзакцией.
+Модуль загружается вместе с интерфейсом, поэтому zipfile и пул процессов
+импортируются при первом использовании.
+"""
+import json
+import os
+import re
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from database import now_ms
+from formatting import Span
+from store import ExportRow, ImportRow, NoteStore
+
+FORMATS = ("jsonl", "markdown", "zip")
+
+# Заметок (или файлов) в одной порции, передаваемой процессу разбора
+PARSE_BATCH_SIZE = 500
+
+# Период (с) вызова обработчика прогресса
+PROGRESS_SECONDS = 0.5
+
+# Категория для файлов Markdown, лежащих в корне дерева
+DEFAULT_CATEGORY = "Общее"
+
+FRONT_MATTER = "---"
+UNSAFE_NAME_CHARS = re.compile(r'[\x00-\x1f\\/:*?"<>|]')
+MAX_NAME_LENGTH = 80
+
+# Обработчик прогресса: (обработано заметок, прошло секунд)
+Progress = Callable[[int, float], None]
+
+
+class NoteRecord(NamedTuple):
+    """Заметка в переносимом виде: категория хранится по имени."""
+    title: str
+    content: str
+    category: str
+    spans: List[Span]
+    created_at: int
+    updated_at: int
+
+
+class ProgressMeter:
+    """Подсчет обработанных заметок с вызовом обработчика не чаще PROGRESS_SECONDS."""
+
+    def __init__(self, progress: Optional[Progress]):
+        self.progress = progress
+        self.count = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def add(self, count: int = 1) -> None:
+        """Учет обработанных заметок."""
+        self.count += count
+        now = time.perf_counter()
+        if self.progress is not None and now - self._reported >= PROGRESS_SECONDS:
+            self._reported = now
+            self.progress(self.count, now - self.started)
+
+    def finish(self) -> float:
+        """Итоговый вызов обработчика; возвращает затраченное время."""
+        elapsed = time.perf_counter() - self.started
+        if self.progress is not None:
+            self.progress(self.count, elapsed)
+        return elapsed
+
+
+def detect_format(path: str) -> str:
+    """Формат по пути: каталог — markdown, иначе по расширению."""
+    if os.path.isdir(path) or not os.path.splitext(path)[1]:
+        return "markdown"
+    if path.lower().endswith(".zip"):
+        return "zip"
+    return "jsonl"
+
+
+def safe_name(name: str, fallback: str) -> str:
+    """Имя файла или каталога без недопустимых символов."""
+    name = UNSAFE_NAME_CHARS.sub("_", name).strip(" .")[:MAX_NAME_LENGTH].rstrip(" .")
+    return name or fallback
+
+
+# Выгрузка
+
+def export_notes(store: NoteStore, path: str, fmt: Optional[str] = None,
+                 category_id: Optional[int] = None, progress: Optional[Progress] = None) -> int:
+    """Выгрузка всех заметок (или одной категории); возвращает количество заметок.
+
+    Файл пишется во временный путь и переименовывается по завершении,
+    чтобы прерванная выгрузка не оставила неполный файл.
+    """
+    fmt = fmt or detect_format(path)
+    meter = ProgressMeter(progress)
+    rows = store.iter_notes(category_id)
+    if fmt == "markdown":
+        _export_markdown_tree(rows, path, meter)
+    else:
+        partial = path + ".partial"
+        try:
+            if fmt == "zip":
+                _export_zip(rows, partial, meter)
+            else:
+                with open(partial, "w", encoding="utf-8", newline="\n") as f:
+                    _export_jsonl(rows, f, meter)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+    meter.finish()
+    return meter.count
+
+
+def _export_jsonl(rows: Iterable[ExportRow], f: TextIO, meter: ProgressMeter) -> None:
+    """Запись заметок построчно в JSONL."""
+    for _, title, content, category, spans, created_at, updated_at in rows:
+        record = NoteRecord(title, content, category, spans, created_at, updated_at)
+        f.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+        meter.add()
+
+
+def _markdown_entries(rows: Iterable[ExportRow]) -> Iterator[Tuple[str, str]]:
+    """Пары (относительный путь файла, текст Markdown) для дерева заметок."""
+    folders: Dict[str, str] = {}
+    for note_id, title, content, category, spans, created_at, updated_at in rows:
+        folder = folders.get(category)
+        if folder is None:
+            folder = safe_name(category, "category")
+            # Разные категории могут дать одинаковое безопасное имя
+            if folder in folders.values():
+                folder = f"{folder} ({len(folders)})"
+            folders[category] = folder
+        name = f"{note_id:06d} {safe_name(title, 'note')}.md"
+        record = NoteRecord(title, content, category, spans, created_at, updated_at)
+        yield f"{folder}/{name}", format_markdown(record)
+
+
+def _export_markdown_tree(rows: Iterable[ExportRow], root: str, meter: ProgressMeter) -> None:
+    """Запись заметок файлами .md в каталоги категорий."""
+    for relative, text in _markdown_entries(rows):
+        path = os.path.join(root, *relative.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(text)
+        meter.add()
+
+
+def _export_zip(rows: Iterable[ExportRow], path: str, meter: ProgressMeter) -> None:
+    """Запись дерева Markdown в zip-архив по одному файлу."""
+    import zipfile
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for relative, text in _markdown_entries(rows):
+            archive.writestr(relative, text.encode("utf-8"))
+            meter.add()
+
+
+def format_markdown(record: NoteRecord) -> str:
+    """Текст файла Markdown: front matter со служебными полями и тело заметки."""
+    lines = [FRONT_MATTER]
+    for key in ("title", "category", "created_at", "updated_at", "spans"):
+        lines.append(f"{key}: {json.dumps(getattr(record, key), ensure_ascii=False)}")
+    lines.append(FRONT_MATTER)
+    return "\n".join(lines) + "\n" + record.content
+
+
+def parse_markdown(text: str, category: str, stem: str) -> NoteRecord:
+    """Разбор файла Markdown.
+
+    Файлы без front matter (созданные не этой программой) тоже
+    принимаются: заголовком служит первая строка "# ...", а при её
+    отсутствии — имя файла.
+    """
+    fields: Dict[str, object] = {}
+    content = text
+    if text.startswith(FRONT_MATTER + "\n"):
+        end = text.find("\n" + FRONT_MATTER + "\n", len(FRONT_MATTER))
+        if end != -1:
+            for line in text[len(FRONT_MATTER) + 1:end].split("\n"):
+                key, sep, value = line.partition(": ")
+                if sep:
+                    fields[key] = json.loads(value)
+            content = text[end + len(FRONT_MATTER) + 2:]
+    title = fields.get("title")
+    if title is None:
+        first, _, rest = content.partition("\n")
+        if first.startswith("# "):
+            title, content = first[2:].strip(), rest.lstrip("\n")
+        else:
+            title = re.sub(r"^\d+ ", "", stem)
+    timestamp = now_ms()
+    created_at = int(fields.get("created_at") or timestamp)
+    return NoteRecord(str(title), content, str(fields.get("category") or category),
+                      [tuple(span) for span in fields.get("spans") or ()],
+                      created_at, int(fields.get("updated_at") or created_at))
+
+
+# Загрузка (разбор выполняется в дочерних процессах, поэтому функции разбора
+# находятся на уровне модуля и принимают только сериализуемые данные)
+
+def _parse_jsonl_batch(lines: List[str]) -> List[NoteRecord]:
+    """Разбор порции строк JSONL."""
+    records = []
+    timestamp = now_ms()
+    for line in lines:
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        created_at = int(data.get("created_at") or timestamp)
+        records.append(NoteRecord(data["title"], data.get("content") or "",
+                                  data.get("category") or DEFAULT_CATEGORY,
+                                  [tuple(span) for span in data.get("spans") or ()],
+                                  created_at, int(data.get("updated_at") or created_at)))
+    return records
+
+
+def _parse_markdown_batch(files: List[Tuple[str, str]]) -> List[NoteRecord]:
+    """Разбор порции файлов Markdown: пары (относительный путь, текст)."""
+    records = []
+    for relative, text in files:
+        parts = relative.split("/")
+        category = parts[-2] if len(parts) > 1 else DEFAULT_CATEGORY
+        stem = os.path.splitext(parts[-1])[0]
+        records.append(parse_markdown(text, category, stem))
+    return records
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    """Разбиение потока на списки по size элементов."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_jsonl(path: str) -> Iterator[List[str]]:
+    """Порции строк файла JSONL."""
+    with open(path, encoding="utf-8") as f:
+        yield from _batched(f, PARSE_BATCH_SIZE)
+
+
+def _read_markdown_tree(root: str) -> Iterator[List[Tuple[str, str]]]:
+    """Порции файлов .md из дерева каталогов (по одному уровню категорий)."""
+    def files() -> Iterator[Tuple[str, str]]:
+        for directory, subdirs, names in os.walk(root):
+            subdirs.sort()
+            for name in sorted(names):
+                if not name.lower().endswith(".md"):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, root).replace(os.sep, "/")
+                with open(path, encoding="utf-8") as f:
+                    yield relative, f.read()
+    return _batched(files(), PARSE_BATCH_SIZE)
+
+
+def _read_zip(path: str) -> Iterator[List[Tuple[str, str]]]:
+    """Порции файлов .md из zip-архива."""
+    import zipfile
+
+    def files() -> Iterator[Tuple[str, str]]:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(".md"):
+                    continue
+                yield info.filename, archive.read(info).decode("utf-8")
+    return _batched(files(), PARSE_BATCH_SIZE)
+
+
+def _parse_all(batches: Iterable[list], parse: Callable[[list], List[NoteRecord]],
+               workers: int) -> Iterator[List[NoteRecord]]:
+    """Разбор порций в пуле процессов с сохранением порядка.
+
+    Одновременно в работе не больше 2 * workers порций, поэтому чтение
+    файла не опережает вставку и память остается ограниченной.
+    """
+    if workers <= 1:
+        for batch in batches:
+            yield parse(batch)
+        return
+    import multiprocessing
+    from concurrent.futures import Future, ProcessPoolExecutor
+    # spawn: fork процесса с потоками (интерфейс, фоновые соединения) небезопасен
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        window: Deque[Future] = deque()
+        for batch in batches:
+            window.append(pool.submit(parse, batch))
+            if len(window) >= 2 * workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def import_notes(store: NoteStore, path: str, fmt: Optional[str] = None,
+                 progress: Optional[Progress] = None, workers: Optional[int] = None) -> int:
+    """Загрузка заметок из файла или каталога одной транзакцией; возвращает количество.
+
+    Недостающие категории создаются. При ошибке разбора или записи
+    транзакция откатывается целиком.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt == "jsonl":
+        batches, parse = _read_jsonl(path), _parse_jsonl_batch
+    elif fmt == "zip":
+        batches, parse = _read_zip(path), _parse_markdown_batch
+    else:
+        batches, parse = _read_markdown_tree(path), _parse_markdown_batch
+    if workers is None:
+        workers = os.cpu_count() or 1
+    meter = ProgressMeter(progress)
+
+    def rows() -> Iterator[ImportRow]:
+        for records in _parse_all(batches, parse, workers):
+            for record in records:
+                category_id = store.category_id(record.category)
+                if category_id is None:
+                    category_id = store.add_category(record.category)
+                yield (record.title, record.content, category_id, record.spans,
+                       record.created_at, record.updated_at)
+            meter.add(len(records))
+
+    count = store.bulk_insert(rows())
+    meter.finish()
+    return count
@@ -0,0 +1,163 @@
+import queue
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from formatting import Span, TagIndices, span_indices
+from store import NoteStore
+
+# Предельный суммарный размер кэша заметок (байт)
+CACHE_BYTES = 32 * 1024 * 1024
+
+# Сколько соседних заметок выше и ниже выбранной подгружать заранее
+PREFETCH_NEIGHBORS = 2
+
+# Примерный размер одного индекса Tk вида "строка.столбец" в списке (байт)
+INDEX_BYTES = 64
+
+
+class CachedNote(NamedTuple):
+    """Заметка, готовая к показу: текст и заранее вычисленные индексы форматирования."""
+    title: str
+    content: str
+    category_id: int
+    spans: List[Span]
+    indices: TagIndices
+
+
+def make_cached_note(title: str, content: str, category_id: int, spans: List[Span]) -> CachedNote:
+    """Заметка для кэша с индексами форматирования, вычисленными по тексту."""
+    return CachedNote(title, content, category_id, spans, span_indices(spans, content))
+
+
+def note_size(note: CachedNote) -> int:
+    """Оценка занимаемой заметкой памяти."""
+    indices = sum(len(tag_indices) for tag_indices in note.indices.values())
+    return sys.getsizeof(note.content) + sys.getsizeof(note.title) + indices * INDEX_BYTES
+
+
+class NoteCache:
+    """LRU-кэш заметок, ограниченный суммарным размером в байтах.
+
+    Кэш общий для потока Tk и фоновой подгрузки, поэтому операции
+    выполняются под блокировкой. Каждое invalidate увеличивает
+    generation: подгрузка, начатая до него, не может положить в кэш
+    устаревшую версию заметки.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.generation = 0
+        self._notes: "OrderedDict[int, CachedNote]" = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, note_id: int) -> bool:
+        with self._lock:
+            return note_id in self._notes
+
+    def get(self, note_id: int) -> Optional[CachedNote]:
+        """Заметка из кэша (с отметкой использования) или None."""
+        with self._lock:
+            note = self._notes.get(note_id)
+            if note is not None:
+                self._notes.move_to_end(note_id)
+            return note
+
+    def put(self, note_id: int, note: CachedNote, generation: Optional[int] = None) -> None:
+        """Добавление заметки с вытеснением давно не использованных.
+
+        generation передает фоновая подгрузка: если с начала чтения
+        заметки что-то было инвалидировано или заметка уже в кэше, она
+        не добавляется.
+        """
+        size = note_size(note)
+        with self._lock:
+            if generation is not None and (generation != self.generation or note_id in self._notes):
+                return
+            self._remove(note_id)
+            if size > self.max_bytes:
+                return
+            self._notes[note_id] = note
+            self._sizes[note_id] = size
+            self.size += size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._notes))
+                self._remove(oldest)
+
+    def invalidate(self, note_id: int) -> None:
+        """Удаление заметки из кэша (после сохранения или удаления)."""
+        with self._lock:
+            self.generation += 1
+            self._remove(note_id)
+
+    def clear(self) -> None:
+        """Очистка кэша."""
+        with self._lock:
+            self.generation += 1
+            self._notes.clear()
+            self._sizes.clear()
+            self.size = 0
+
+    def _remove(self, note_id: int) -> None:
+        """Удаление записи без блокировки (вызывается под _lock)."""
+        if self._notes.pop(note_id, None) is not None:
+            self.size -= self._sizes.pop(note_id)
+
+
+class Prefetcher:
+    """Фоновая подгрузка заметок в кэш.
+
+    Поток со своим хранилищем читает заметки, декодирует тело и заранее
+    переводит форматирование в индексы Tk. Новый запрос заменяет еще не
+    выполненный: при быстром листании подгружаются только соседи
+    последней выбранной заметки.
+    """
+
+    def __init__(self, open_store: Callable[[], NoteStore], cache: NoteCache):
+        self.open_store = open_store
+        self.cache = cache
+        self._queue: "queue.Queue[Optional[List[int]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="note-prefetch", daemon=True)
+        self._thread.start()
+
+    def request(self, note_ids: Sequence[int]) -> None:
+        """Подгрузка заметок в указанном порядке (если их еще нет в кэше)."""
+        # Невыполненные запросы устарели
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put([note_id for note_id in note_ids if note_id not in self.cache])
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Остановка потока подгрузки."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        """Цикл потока подгрузки."""
+        store: Optional[NoteStore] = None
+        while True:
+            note_ids = self._queue.get()
+            if note_ids is None:
+                break
+            for note_id in note_ids:
+                if not self._queue.empty():
+                    break  # Пришел более свежий запрос
+                generation = self.cache.generation
+                try:
+                    if store is None:
+                        store = self.open_store()
+                    note = store.get_note(note_id)
+                except sqlite3.Error:
+                    # Подгрузка — лишь оптимизация: при ошибке заметка будет прочитана при выборе
+                    continue
+                if note is not None:
+                    self.cache.put(note_id, make_cached_note(*note), generation)
+        if store is not None:
+            store.close()
@@ -0,0 +1,114 @@
+"""Журнал изменений заметок для нескольких окон и скриптов над одной базой.
+
+Триггеры notes пишут в note_changes номер изменения (seq), id заметки
+и вид изменения. Каждый экземпляр приложения опрашивает PRAGMA
+data_version (она меняется, только когда базу изменило другое
+соединение) и при её изменении читает записи журнала после своей
+отметки seq, так что применяются только изменившиеся заметки.
+"""
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional
+
+# Период (мс) опроса PRAGMA data_version
+CHANGE_POLL_MS = 500
+
+# Сколько последних записей журнала хранится; отставший сильнее экземпляр перечитывает всё
+CHANGELOG_KEEP = 50_000
+
+# Виды изменений в note_changes
+CHANGE_INSERT = 0
+CHANGE_UPDATE = 1
+CHANGE_DELETE = 2
+
+CHANGE_TRIGGERS = {
+    "note_changes_ai": f"""
+        CREATE TRIGGER note_changes_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO note_changes (note_id, kind) VALUES (new.id, {CHANGE_INSERT});
+        END
+    """,
+    "note_changes_au": f"""
+        CREATE TRIGGER note_changes_au AFTER UPDATE OF title, content, category_id, format, updated_at
+        ON notes BEGIN
+            INSERT INTO note_changes (note_id, kind) VALUES (new.id, {CHANGE_UPDATE});
+        END
+    """,
+    "note_changes_ad": f"""
+        CREATE TRIGGER note_changes_ad AFTER DELETE ON notes BEGIN
+            INSERT INTO note_changes (note_id, kind) VALUES (old.id, {CHANGE_DELETE});
+        END
+    """,
+}
+
+SQL_LAST_SEQ = "SELECT coalesce(max(seq), 0) FROM note_changes"
+SQL_FIRST_SEQ = "SELECT min(seq) FROM note_changes"
+SQL_CHANGES = "SELECT seq, note_id, kind FROM note_changes WHERE seq > ? ORDER BY seq"
+SQL_CHANGED_NOTE = "SELECT title, category_id, updated_at FROM notes WHERE id = ?"
+SQL_TRIM = "DELETE FROM note_changes WHERE seq <= ?"
+
+
+class NoteChange(NamedTuple):
+    """Текущее состояние изменившейся заметки; title равен None, если заметка удалена."""
+    note_id: int
+    title: Optional[str]
+    category_id: Optional[int]
+    updated_at: Optional[int]
+
+    @property
+    def deleted(self) -> bool:
+        return self.title is None
+
+
+class ChangeFeed:
+    """Чтение журнала изменений после отметки seq этого экземпляра.
+
+    Соединение должно использоваться только из потока опроса (потока Tk).
+    Свои записи через другие соединения (автосохранение) тоже попадают в
+    журнал: применять их повторно безопасно.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.watermark = conn.execute(SQL_LAST_SEQ).fetchone()[0]
+        self.data_version = self._data_version()
+        first = conn.execute(SQL_FIRST_SEQ).fetchone()[0]
+        self.trimmed_at = self.watermark if first is None else first - 1  # seq, до которого журнал очищен
+
+    @property
+    def trim_due(self) -> bool:
+        """Журнал вырос вдвое против CHANGELOG_KEEP (очистка выполняется пореже)."""
+        return self.watermark - self.trimmed_at >= 2 * CHANGELOG_KEEP
+
+    def _data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll(self) -> Optional[List[NoteChange]]:
+        """Изменения после прошлого опроса, по одному на заметку, в порядке изменения.
+
+        Пустой список — изменений нет. None — журнал уже очищен дальше
+        отметки этого экземпляра, и данные нужно перечитать целиком.
+        """
+        data_version = self._data_version()
+        if data_version == self.data_version:
+            return []
+        self.data_version = data_version
+        first = self.conn.execute(SQL_FIRST_SEQ).fetchone()[0]
+        if first is not None and first > self.watermark + 1:
+            self.watermark = self.conn.execute(SQL_LAST_SEQ).fetchone()[0]
+            return None
+        latest: Dict[int, int] = {}  # id заметки -> seq последнего изменения
+        for seq, note_id, _ in self.conn.execute(SQL_CHANGES, (self.watermark,)):
+            latest.pop(note_id, None)
+            latest[note_id] = seq
+            self.watermark = seq
+        changes = []
+        for note_id in latest:
+            # Берется текущее состояние заметки, а не вид изменения: между ними её могли изменить еще раз
+            row = self.conn.execute(SQL_CHANGED_NOTE, (note_id,)).fetchone()
+            changes.append(NoteChange(note_id, *row) if row is not None else NoteChange(note_id, None, None, None))
+        return changes
+
+    def trim(self) -> int:
+        """Удаление старых записей журнала (вызывается внутри транзакции записи)."""
+        last = self.conn.execute(SQL_LAST_SEQ).fetchone()[0]
+        self.trimmed_at = max(last - CHANGELOG_KEEP, 0)
+        return self.conn.execute(SQL_TRIM, (last - CHANGELOG_KEEP,)).rowcount
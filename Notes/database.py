@@ -0,0 +1,435 @@
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Callable, List
+
+from bodies import LARGE_NOTE_BYTES, split_body, write_body
+from changes import CHANGE_TRIGGERS
+from instrumentation import ProfiledConnection, profiler
+from search import FTS_TRIGGERS, fts5_available
+from sync import STATE_NODE, track_untracked
+
+# Триггеры category_stats; у старой категории время изменения пересчитывается
+# по индексу idx_notes_category_updated
+CATEGORY_STATS_TRIGGERS = [
+    """
+    CREATE TRIGGER category_stats_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO category_stats (category_id, note_count, total_bytes, last_updated)
+        VALUES (new.category_id, 1, coalesce(length(CAST(new.content AS BLOB)), 0), new.updated_at)
+        ON CONFLICT (category_id) DO UPDATE SET
+            note_count = note_count + 1,
+            total_bytes = total_bytes + excluded.total_bytes,
+            last_updated = max(last_updated, excluded.last_updated);
+    END
+    """,
+    """
+    CREATE TRIGGER category_stats_ad AFTER DELETE ON notes BEGIN
+        UPDATE category_stats SET
+            note_count = note_count - 1,
+            total_bytes = total_bytes - coalesce(length(CAST(old.content AS BLOB)), 0),
+            last_updated = coalesce((SELECT max(updated_at) FROM notes WHERE category_id = old.category_id), 0)
+        WHERE category_id = old.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER category_stats_au AFTER UPDATE OF category_id, content, updated_at ON notes BEGIN
+        UPDATE category_stats SET
+            note_count = note_count - 1,
+            total_bytes = total_bytes - coalesce(length(CAST(old.content AS BLOB)), 0)
+                - coalesce((SELECT size FROM note_bodies WHERE note_id = old.id), 0),
+            last_updated = coalesce((SELECT max(updated_at) FROM notes WHERE category_id = old.category_id), 0)
+        WHERE category_id = old.category_id;
+        INSERT INTO category_stats (category_id, note_count, total_bytes, last_updated)
+        VALUES (new.category_id, 1,
+                coalesce(length(CAST(new.content AS BLOB)), 0)
+                + coalesce((SELECT size FROM note_bodies WHERE note_id = new.id), 0),
+                new.updated_at)
+        ON CONFLICT (category_id) DO UPDATE SET
+            note_count = note_count + 1,
+            total_bytes = total_bytes + excluded.total_bytes,
+            last_updated = max(last_updated, excluded.last_updated);
+    END
+    """,
+    """
+    CREATE TRIGGER category_stats_bodies_ai AFTER INSERT ON note_bodies BEGIN
+        UPDATE category_stats SET total_bytes = total_bytes + new.size
+        WHERE category_id = (SELECT category_id FROM notes WHERE id = new.note_id);
+    END
+    """,
+    """
+    CREATE TRIGGER category_stats_bodies_ad AFTER DELETE ON note_bodies BEGIN
+        UPDATE category_stats SET total_bytes = total_bytes - old.size
+        WHERE category_id = (SELECT category_id FROM notes WHERE id = old.note_id);
+    END
+    """,
+]
+
+# Размер кэша страниц SQLite на соединение (отрицательное значение — в КиБ)
+CACHE_SIZE_KIB = -16000
+
+# Сколько (мс) ждать блокировки записи, занятой другим соединением или процессом
+BUSY_TIMEOUT_MS = 5000
+
+# Повторные попытки начать запись после истечения BUSY_TIMEOUT_MS и начальная пауза между ними (с)
+WRITE_RETRIES = 3
+WRITE_RETRY_DELAY = 0.2
+
+
+def now_ms() -> int:
+    """Текущее время в миллисекундах Unix-времени (формат столбцов *_at)."""
+    return int(time.time() * 1000)
+
+
+def connect(path: str, **kwargs: Any) -> sqlite3.Connection:
+    """Открытие соединения с базой заметок и настройка прагм.
+
+    WAL позволяет читать базу из фоновых потоков и других процессов, пока
+    идет запись, а при WAL режим synchronous=NORMAL не теряет целостность
+    при сбое. busy_timeout заставляет запись ждать чужую блокировку вместо
+    немедленной ошибки «database is locked». При включенном
+    профилировании запросы соединения замеряются.
+    """
+    if profiler.enabled:
+        kwargs.setdefault("factory", ProfiledConnection)
+    conn = sqlite3.connect(path, **kwargs)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = {CACHE_SIZE_KIB}")
+    return conn
+
+
+def is_locked(error: sqlite3.Error) -> bool:
+    """Ошибка из-за блокировки базы другим соединением."""
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+def begin_immediate(conn: sqlite3.Connection) -> None:
+    """Начало транзакции записи с повторами, если база дольше BUSY_TIMEOUT_MS занята.
+
+    Блокировка записи берется сразу (BEGIN IMMEDIATE), поэтому после
+    начала транзакции её запросы уже не получают «database is locked» и
+    повторять нужно только начало.
+    """
+    delay = WRITE_RETRY_DELAY
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if attempt == WRITE_RETRIES or not is_locked(e):
+                raise
+        time.sleep(delay)
+        delay *= 2
+
+
+def _iso_to_epoch_ms(value: Any) -> int:
+    """Преобразование прежней отметки времени ISO 8601 в миллисекунды."""
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except ValueError:
+        return 0
+
+
+def _migration_base_schema(conn: sqlite3.Connection) -> None:
+    """Исходная схема: категории, заметки и категория по умолчанию."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT,
+            category_id INTEGER,
+            created_at TEXT,
+            updated_at TEXT,
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", ("Общее",))
+
+
+def _migration_epoch_timestamps(conn: sqlite3.Connection) -> None:
+    """Перевод created_at/updated_at из текста ISO в целые миллисекунды.
+
+    Таблица пересоздается (SQLite не меняет тип столбца на месте), id и
+    счетчик AUTOINCREMENT сохраняются, триггеры полнотекстового индекса
+    создаются заново, чтобы не перестраивать сам индекс.
+    """
+    conn.create_function("iso_to_epoch_ms", 1, _iso_to_epoch_ms)
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'notes'").fetchone()
+    sequence = row[0] if row else 0
+    triggers = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'notes'"
+    )]
+    conn.execute("""
+        CREATE TABLE notes_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT,
+            category_id INTEGER,
+            created_at INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO notes_new (id, title, content, category_id, created_at, updated_at)
+        SELECT id, title, content, category_id, iso_to_epoch_ms(created_at), iso_to_epoch_ms(updated_at)
+        FROM notes
+    """)
+    conn.execute("DROP TABLE notes")
+    conn.execute("ALTER TABLE notes_new RENAME TO notes")
+    conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'notes'", (sequence,))
+    for name in triggers:
+        if name in FTS_TRIGGERS:
+            conn.execute(FTS_TRIGGERS[name])
+
+
+def _migration_notes_index(conn: sqlite3.Connection) -> None:
+    """Индекс для списка заметок категории, отсортированного по времени изменения."""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_notes_category_updated
+        ON notes (category_id, updated_at DESC, id DESC)
+    """)
+
+
+def _migration_format_spans(conn: sqlite3.Connection) -> None:
+    """Столбец с упакованными диапазонами форматирования (см. formatting.pack_spans)."""
+    conn.execute("ALTER TABLE notes ADD COLUMN format BLOB")
+
+
+def _migration_note_bodies(conn: sqlite3.Connection) -> None:
+    """Отдельная таблица для сжатых тел больших заметок.
+
+    Уже сохраненные большие заметки переносятся в неё, чтобы чтение
+    списка и поиск не затрагивали их тела.
+    """
+    conn.execute("""
+        CREATE TABLE note_bodies (
+            note_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER note_bodies_ad AFTER DELETE ON notes BEGIN
+            DELETE FROM note_bodies WHERE note_id = old.id;
+        END
+    """)
+    index_fts = fts5_available(conn) and conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'"
+    ).fetchone() is not None
+    large = conn.execute("""
+        SELECT id FROM notes WHERE length(CAST(content AS BLOB)) >= ?
+    """, (LARGE_NOTE_BYTES,)).fetchall()
+    for (note_id,) in large:
+        content = conn.execute("SELECT content FROM notes WHERE id = ?", (note_id,)).fetchone()[0]
+        _, compressed, size = split_body(content)
+        conn.execute("UPDATE notes SET content = NULL WHERE id = ?", (note_id,))
+        write_body(conn, note_id, content, compressed, size, index_fts)
+
+
+def _migration_note_revisions(conn: sqlite3.Connection) -> None:
+    """История версий заметок: полные версии и разницы (см. history.py)."""
+    conn.execute("""
+        CREATE TABLE note_revisions (
+            note_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            kind INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            format BLOB,
+            PRIMARY KEY (note_id, revision)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TRIGGER note_revisions_ad AFTER DELETE ON notes BEGIN
+            DELETE FROM note_revisions WHERE note_id = old.id;
+        END
+    """)
+
+
+def _migration_category_stats(conn: sqlite3.Connection) -> None:
+    """Агрегаты по категориям (число заметок, объем текста, время изменения), поддерживаемые триггерами.
+
+    Объем складывается из встроенного текста (триггеры notes) и сжатых
+    тел (триггеры note_bodies, размер несжатый). Тело удаляемой заметки
+    учитывается тем же триггером, что удаляет его из note_bodies: после
+    удаления строки notes её категорию уже не найти.
+    """
+    conn.execute("""
+        CREATE TABLE category_stats (
+            category_id INTEGER PRIMARY KEY,
+            note_count INTEGER NOT NULL DEFAULT 0,
+            total_bytes INTEGER NOT NULL DEFAULT 0,
+            last_updated INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        INSERT INTO category_stats (category_id, note_count, total_bytes, last_updated)
+        SELECT category_id, count(*),
+               sum(coalesce(length(CAST(content AS BLOB)), 0)
+                   + coalesce((SELECT size FROM note_bodies WHERE note_id = notes.id), 0)),
+               max(updated_at)
+        FROM notes GROUP BY category_id
+    """)
+    for sql in CATEGORY_STATS_TRIGGERS:
+        conn.execute(sql)
+    conn.execute("DROP TRIGGER note_bodies_ad")
+    conn.execute("""
+        CREATE TRIGGER note_bodies_ad AFTER DELETE ON notes BEGIN
+            UPDATE category_stats
+            SET total_bytes = total_bytes - coalesce((SELECT size FROM note_bodies WHERE note_id = old.id), 0)
+            WHERE category_id = old.category_id;
+            DELETE FROM note_bodies WHERE note_id = old.id;
+        END
+    """)
+
+
+def _migration_note_minhash(conn: sqlite3.Connection) -> None:
+    """Кэш сигнатур MinHash для поиска похожих заметок (см. duplicates.py).
+
+    updated_at — время изменения заметки, по которой посчитана сигнатура:
+    при расхождении с notes.updated_at сигнатура считается заново.
+    """
+    conn.execute("""
+        CREATE TABLE note_minhash (
+            note_id INTEGER PRIMARY KEY,
+            updated_at INTEGER NOT NULL,
+            signature BLOB NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER note_minhash_ad AFTER DELETE ON notes BEGIN
+            DELETE FROM note_minhash WHERE note_id = old.id;
+        END
+    """)
+
+
+def _migration_note_changes(conn: sqlite3.Connection) -> None:
+    """Журнал изменений заметок для других экземпляров приложения (см. changes.py)."""
+    conn.execute("""
+        CREATE TABLE note_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL,
+            kind INTEGER NOT NULL
+        )
+    """)
+    for sql in CHANGE_TRIGGERS.values():
+        conn.execute(sql)
+
+
+def _migration_sync(conn: sqlite3.Connection) -> None:
+    """Версии заметок и журнал отправки для синхронизации (см. sync.py).
+
+    Узел получает случайный id; уже существующие заметки ставятся в
+    журнал отправки, чтобы попасть на сервер при первой синхронизации.
+    Удаление заметки в обход NoteStore.delete_note отвязывает её uid, и
+    новая заметка с тем же id не унаследует чужую версию.
+    """
+    conn.execute("CREATE TABLE sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("""
+        CREATE TABLE note_sync (
+            uid TEXT PRIMARY KEY,
+            note_id INTEGER UNIQUE,
+            hlc INTEGER NOT NULL,
+            node TEXT NOT NULL,
+            synced_hlc INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE sync_outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL,
+            hlc INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_sync_outbox_uid ON sync_outbox (uid, seq)")
+    conn.execute("""
+        CREATE TABLE sync_conflicts (
+            uid TEXT PRIMARY KEY,
+            hlc INTEGER NOT NULL,
+            node TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            detected_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER note_sync_ad AFTER DELETE ON notes BEGIN
+            UPDATE note_sync SET note_id = NULL WHERE note_id = old.id;
+        END
+    """)
+    conn.execute("INSERT INTO sync_state (key, value) VALUES (?, lower(hex(randomblob(8))))", (STATE_NODE,))
+    track_untracked(conn)
+
+
+def _migration_sync_base(conn: sqlite3.Connection) -> None:
+    """Узел версии, подтвержденной сервером: вместе с synced_hlc она
+    отправляется как base правки (см. sync_server.py).
+
+    Для уже синхронизированных заметок узел известен, только если с тех
+    пор их не меняли; иначе сервер сверяет одну версию HLC.
+    """
+    conn.execute("ALTER TABLE note_sync ADD COLUMN synced_node TEXT")
+    conn.execute("UPDATE note_sync SET synced_node = node WHERE synced_hlc = hlc")
+
+
+def _migration_revision_digest(conn: sqlite3.Connection) -> None:
+    """Хэш содержимого версии: по нему запись истории замечает изменение
+    notes в обход NoteStore.update_note (см. history.record_revision)."""
+    conn.execute("ALTER TABLE note_revisions ADD COLUMN digest BLOB")
+
+
+# Миграции по порядку; номер версии схемы = индекс миграции + 1
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_base_schema,
+    _migration_epoch_timestamps,
+    _migration_notes_index,
+    _migration_format_spans,
+    _migration_note_bodies,
+    _migration_note_revisions,
+    _migration_category_stats,
+    _migration_note_minhash,
+    _migration_note_changes,
+    _migration_sync,
+    _migration_sync_base,
+    _migration_revision_digest,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Приведение схемы базы к SCHEMA_VERSION по PRAGMA user_version.
+
+    Каждая миграция выполняется в отдельной транзакции вместе с обновлением
+    user_version, так что прерванный запуск не оставляет схему в
+    промежуточном состоянии. Возвращает итоговую версию схемы.
+    """
+    while True:
+        begin_immediate(conn)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise sqlite3.DatabaseError(
+                    f"версия схемы базы ({version}) новее поддерживаемой ({SCHEMA_VERSION})"
+                )
+            if version == SCHEMA_VERSION:
+                conn.rollback()
+                return version
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
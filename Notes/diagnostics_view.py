@@ -0,0 +1,132 @@
+import tkinter as tk
+from datetime import datetime
+from tkinter import ttk, messagebox, filedialog
+from typing import Optional
+
+from instrumentation import Profiler
+
+# Период (мс) обновления открытого окна диагностики
+REFRESH_MS = 1000
+
+# Столбцы таблицы операций: ключ сводки и заголовок
+OPERATION_COLUMNS = (
+    ("count", "вызовов"),
+    ("total_ms", "всего, мс"),
+    ("avg_ms", "среднее, мс"),
+    ("p50_ms", "p50, мс"),
+    ("p95_ms", "p95, мс"),
+    ("max_ms", "макс., мс"),
+)
+
+
+def format_time(timestamp: float) -> str:
+    """Время события для списков окна."""
+    return datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+
+
+class DiagnosticsDialog:
+    """Окно диагностики: время операций, медленные запросы и зависания интерфейса."""
+
+    def __init__(self, parent: tk.Misc, profiler: Profiler):
+        self.profiler = profiler
+        self.window = tk.Toplevel(parent)
+        self.window.title("Диагностика")
+        self.window.geometry("1000x650")
+        self.window.transient(parent)
+        self.refresh_after: Optional[str] = None
+
+        self.summary_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.summary_var).pack(anchor="w", padx=5, pady=5)
+
+        notebook = ttk.Notebook(self.window)
+        notebook.pack(fill="both", expand=True, padx=5)
+
+        operations_frame = ttk.Frame(notebook)
+        notebook.add(operations_frame, text="Операции")
+        self.operations = ttk.Treeview(operations_frame, columns=[key for key, _ in OPERATION_COLUMNS])
+        self.operations.heading("#0", text="операция")
+        self.operations.column("#0", width=400)
+        for key, heading in OPERATION_COLUMNS:
+            self.operations.heading(key, text=heading)
+            self.operations.column(key, width=90, anchor="e")
+        scrollbar = ttk.Scrollbar(operations_frame, orient="vertical", command=self.operations.yview)
+        self.operations.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.operations.pack(fill="both", expand=True)
+
+        queries_frame = ttk.Frame(notebook)
+        notebook.add(queries_frame, text="Медленные запросы")
+        self.queries = tk.Text(queries_frame, wrap="word", state="disabled")
+        scrollbar = ttk.Scrollbar(queries_frame, orient="vertical", command=self.queries.yview)
+        self.queries.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.queries.pack(fill="both", expand=True)
+
+        stalls_frame = ttk.Frame(notebook)
+        notebook.add(stalls_frame, text="Зависания интерфейса")
+        self.stalls = tk.Listbox(stalls_frame)
+        self.stalls.pack(fill="both", expand=True)
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(fill="x", padx=5, pady=5)
+        ttk.Button(buttons, text="Закрыть", command=self.close).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Экспорт в JSON...", command=self.export).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Сбросить", command=self.reset).pack(side="right", padx=5)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Перечитывание собранных данных; повторяется, пока окно открыто."""
+        data = self.profiler.snapshot()
+        self.summary_var.set(f"Сбор данных: {data['duration_s']:.0f} с, "
+                             f"операций: {len(data['operations'])}, "
+                             f"медленных запросов: {len(data['slow_queries'])}, "
+                             f"зависаний: {data['stall_count']}")
+
+        # Сначала операции с наибольшим суммарным временем
+        self.operations.delete(*self.operations.get_children())
+        for name, stats in sorted(data["operations"].items(), key=lambda item: -item[1]["total_ms"]):
+            values = [f"{stats[key]:.0f}" if key == "count" else f"{stats[key]:.2f}" for key, _ in OPERATION_COLUMNS]
+            self.operations.insert("", tk.END, text=name, values=values)
+
+        lines = []
+        for query in reversed(data["slow_queries"]):
+            lines.append(f"{format_time(query['time'])}  {query['ms']:.1f} мс\n{query['sql']}\n")
+            lines.extend(f"    {step}\n" for step in query["plan"])
+            lines.append("\n")
+        yview = self.queries.yview()[0]
+        self.queries.configure(state="normal")
+        self.queries.delete("1.0", tk.END)
+        self.queries.insert("1.0", "".join(lines))
+        self.queries.configure(state="disabled")
+        self.queries.yview_moveto(yview)
+
+        self.stalls.delete(0, tk.END)
+        self.stalls.insert(tk.END, *(f"{format_time(stall['time'])}  {stall['ms']:.0f} мс"
+                                     for stall in reversed(data["stalls"])))
+
+        self.refresh_after = self.window.after(REFRESH_MS, self.refresh)
+
+    def reset(self) -> None:
+        """Сброс собранных данных."""
+        self.profiler.reset()
+        self.window.after_cancel(self.refresh_after)
+        self.refresh()
+
+    def export(self) -> None:
+        """Сохранение собранных данных в JSON."""
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("Все файлы", "*.*")])
+        if not path:
+            return
+        try:
+            self.profiler.export_json(path)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить данные диагностики: {e}", parent=self.window)
+
+    def close(self) -> None:
+        """Закрытие окна и остановка обновления."""
+        if self.refresh_after is not None:
+            self.window.after_cancel(self.refresh_after)
+        self.window.destroy()
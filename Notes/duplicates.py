@@ -0,0 +1,282 @@
+"""Поиск похожих заметок по сигнатурам MinHash.
+
+Содержимое заметки разбивается на шинглы — тройки соседних слов, — и
+по ним строится сигнатура: похожесть двух заметок (мера Жаккара
+множеств шинглов) оценивается долей совпавших позиций сигнатур.
+Используется MinHash с одной перестановкой: каждый шингл хешируется
+один раз и попадает в одну из SIGNATURE_SIZE ячеек, в ячейке хранится
+минимум; пустые ячейки заполняются из соседних (densification).
+
+Сигнатуры считаются в пуле процессов и хранятся в note_minhash вместе с
+updated_at заметки, так что повторный поиск пересчитывает только
+измененные заметки. Кандидаты в похожие находятся без сравнения всех
+пар (LSH): сигнатура режется на полосы, заметки с совпавшей полосой
+попадают в одну корзину и сравниваются точно.
+"""
+import os
+from array import array
+from collections import deque
+from hashlib import blake2b
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from bodies import read_body
+from bulk import Progress, ProgressMeter
+from quickopen import WORD_RE, fold
+from store import NoteStore
+
+# Число ячеек сигнатуры (по 4 байта) и строк в одной полосе LSH: 16 полос по 4 строки
+# находят пары со сходством 0.8 с вероятностью ~0.9998, а пары со сходством 0.3 — ~0.12
+SIGNATURE_SIZE = 64
+BAND_ROWS = 4
+
+# Длина шингла в словах
+SHINGLE_WORDS = 3
+
+# Оценка сходства, начиная с которой заметки считаются похожими
+SIMILARITY = 0.8
+
+# Заметок в одной порции для пула процессов
+SIGNATURE_BATCH_SIZE = 200
+
+# Корзины LSH до этого размера сравниваются попарно, большие — с первой заметкой корзины
+MAX_PAIRWISE_BUCKET = 64
+
+# Смещение значения, заимствованного из соседней ячейки, на каждый шаг заимствования
+DENSIFY_OFFSET = 0x9E3779B1
+EMPTY_BIN = 1 << 32
+MASK32 = 0xFFFFFFFF
+BIN_BITS = SIGNATURE_SIZE.bit_length() - 1
+
+SQL_STALE = """
+    SELECT notes.id FROM notes LEFT JOIN note_minhash ON note_minhash.note_id = notes.id
+    WHERE note_minhash.updated_at IS NOT notes.updated_at
+"""
+SQL_NOTE_CONTENT = "SELECT updated_at, content FROM notes WHERE id = ?"
+SQL_SAVE_SIGNATURE = """
+    INSERT INTO note_minhash (note_id, updated_at, signature) VALUES (?, ?, ?)
+    ON CONFLICT (note_id) DO UPDATE SET updated_at = excluded.updated_at, signature = excluded.signature
+"""
+SQL_SIGNATURES = """
+    SELECT note_id, signature FROM note_minhash JOIN notes ON notes.id = note_minhash.note_id
+    WHERE note_minhash.updated_at = notes.updated_at AND length(signature) > 0
+"""
+SQL_NOTE_INFO = "SELECT title, category_id, updated_at, length(content) FROM notes WHERE id = ?"
+SQL_BODY_SIZE = "SELECT size FROM note_bodies WHERE note_id = ?"
+
+
+class DuplicateNote(NamedTuple):
+    """Заметка группы похожих и её сходство с первой заметкой группы."""
+    note_id: int
+    title: str
+    category_id: int
+    updated_at: int
+    size: int
+    similarity: float
+
+
+def shingle_hashes(text: str) -> List[int]:
+    """64-битные хеши шинглов текста (без учета регистра и пунктуации)."""
+    words = WORD_RE.findall(fold(text))
+    if len(words) < SHINGLE_WORDS:
+        grams = {" ".join(words)} if words else set()
+    else:
+        grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return [int.from_bytes(blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little") for gram in grams]
+
+
+def signature(text: str) -> bytes:
+    """Сигнатура MinHash текста; пустая для текста без слов."""
+    hashes = shingle_hashes(text)
+    if not hashes:
+        return b""
+    bins = [EMPTY_BIN] * SIGNATURE_SIZE
+    for h in hashes:
+        slot = h & (SIGNATURE_SIZE - 1)
+        value = (h >> BIN_BITS) & MASK32
+        if value < bins[slot]:
+            bins[slot] = value
+    result = array("I")
+    for slot in range(SIGNATURE_SIZE):
+        source, distance = slot, 0
+        while bins[source] == EMPTY_BIN:
+            source = (source + 1) % SIGNATURE_SIZE
+            distance += 1
+        result.append((bins[source] + distance * DENSIFY_OFFSET) & MASK32)
+    return result.tobytes()
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Оценка сходства по доле совпавших ячеек сигнатур."""
+    first, second = array("I", a), array("I", b)
+    return sum(x == y for x, y in zip(first, second)) / SIGNATURE_SIZE
+
+
+def _signature_batch(rows: List[Tuple[int, int, str]]) -> List[Tuple[int, int, bytes]]:
+    """Сигнатуры порции заметок (выполняется в процессе пула)."""
+    return [(note_id, updated_at, signature(content)) for note_id, updated_at, content in rows]
+
+
+def _signature_all(batches: Iterable[List[Tuple[int, int, str]]],
+                   workers: int) -> Iterator[List[Tuple[int, int, bytes]]]:
+    """Подсчет сигнатур порций в пуле процессов; в работе не больше 2 * workers порций."""
+    if workers <= 1:
+        for batch in batches:
+            yield _signature_batch(batch)
+        return
+    import multiprocessing
+    from concurrent.futures import Future, ProcessPoolExecutor
+    # spawn: fork процесса с потоками (интерфейс, фоновые соединения) небезопасен
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        window: Deque[Future] = deque()
+        for batch in batches:
+            window.append(pool.submit(_signature_batch, batch))
+            if len(window) >= 2 * workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def update_signatures(store: NoteStore, workers: Optional[int] = None,
+                      progress: Optional[Progress] = None) -> int:
+    """Пересчет сигнатур новых и измененных заметок; возвращает их количество.
+
+    Сигнатура сохраняется с updated_at прочитанной версии: если заметку
+    изменят во время подсчета, при следующем поиске она будет
+    пересчитана.
+    """
+    stale = [note_id for (note_id,) in store.conn.execute(SQL_STALE)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    meter = ProgressMeter(progress)
+
+    def batches() -> Iterator[List[Tuple[int, int, str]]]:
+        for start in range(0, len(stale), SIGNATURE_BATCH_SIZE):
+            batch = []
+            for note_id in stale[start:start + SIGNATURE_BATCH_SIZE]:
+                row = store.conn.execute(SQL_NOTE_CONTENT, (note_id,)).fetchone()
+                if row is None:
+                    continue  # Заметку удалили
+                updated_at, content = row
+                if content is None:
+                    content = read_body(store.conn, note_id) or ""
+                batch.append((note_id, updated_at, content))
+            yield batch
+
+    updated = 0
+    for results in _signature_all(batches(), workers):
+        with store.transaction():
+            store.conn.executemany(SQL_SAVE_SIGNATURE, results)
+        updated += len(results)
+        meter.add(len(results))
+    meter.finish()
+    return updated
+
+
+def find_clusters(signatures: Dict[int, bytes], threshold: float = SIMILARITY) -> List[List[int]]:
+    """Группы похожих заметок по сигнатурам (LSH и проверка кандидатов).
+
+    Группа — компонента связности пар со сходством не ниже threshold.
+    """
+    parent: Dict[int, int] = {}
+
+    def find(note_id: int) -> int:
+        root = note_id
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while note_id != root:
+            parent[note_id], note_id = root, parent.get(note_id, note_id)
+        return root
+
+    def union(a: int, b: int) -> None:
+        if find(a) != find(b) and similarity(signatures[a], signatures[b]) >= threshold:
+            parent[find(a)] = find(b)
+
+    band_bytes = BAND_ROWS * 4
+    for start in range(0, SIGNATURE_SIZE * 4, band_bytes):
+        buckets: Dict[bytes, List[int]] = {}
+        for note_id, packed in signatures.items():
+            buckets.setdefault(packed[start:start + band_bytes], []).append(note_id)
+        for members in buckets.values():
+            if len(members) <= MAX_PAIRWISE_BUCKET:
+                for i, a in enumerate(members):
+                    for b in members[i + 1:]:
+                        union(a, b)
+            else:
+                for b in members[1:]:
+                    union(members[0], b)
+
+    groups: Dict[int, List[int]] = {}
+    for note_id in set(parent).union(parent.values()):
+        groups.setdefault(find(note_id), []).append(note_id)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def find_duplicates(store: NoteStore, threshold: float = SIMILARITY, workers: Optional[int] = None,
+                    progress: Optional[Progress] = None) -> List[List[DuplicateNote]]:
+    """Группы похожих заметок, самые большие первыми.
+
+    Внутри группы первой идет последняя измененная заметка, у остальных
+    указано сходство с ней.
+    """
+    update_signatures(store, workers, progress)
+    signatures = {note_id: packed for note_id, packed in store.conn.execute(SQL_SIGNATURES)}
+    clusters = []
+    for members in find_clusters(signatures, threshold):
+        notes = []
+        for note_id in members:
+            row = store.conn.execute(SQL_NOTE_INFO, (note_id,)).fetchone()
+            if row is None:
+                continue
+            title, category_id, updated_at, size = row
+            if size is None:
+                body = store.conn.execute(SQL_BODY_SIZE, (note_id,)).fetchone()
+                size = body[0] if body else 0
+            notes.append(DuplicateNote(note_id, title, category_id, updated_at, size, 1.0))
+        if len(notes) < 2:
+            continue
+        notes.sort(key=lambda note: (note.updated_at, note.note_id), reverse=True)
+        first = signatures[notes[0].note_id]
+        clusters.append([notes[0]] + [note._replace(similarity=similarity(first, signatures[note.note_id]))
+                                      for note in notes[1:]])
+    clusters.sort(key=len, reverse=True)
+    return clusters
+
+
+def merge_contents(content: str, others: Iterable[str]) -> str:
+    """Содержимое с добавленными в конец строками других заметок, которых в нем нет.
+
+    Форматирование исходного текста не сдвигается: он остается в начале.
+    """
+    seen = {line.strip() for line in content.splitlines()}
+    added = []
+    for other in others:
+        for line in other.splitlines():
+            key = line.strip()
+            if key and key not in seen:
+                seen.add(key)
+                added.append(line)
+    if not added:
+        return content
+    return content + "\n\n" + "\n".join(added)
+
+
+def merge_notes(store: NoteStore, keep_id: int, other_ids: Sequence[int]) -> bool:
+    """Объединение заметок в keep_id и удаление остальных одной транзакцией.
+
+    Новые строки остальных заметок добавляются в конец оставляемой;
+    прежняя версия остается в её истории. False, если оставляемой
+    заметки нет.
+    """
+    with store.transaction():
+        kept = store.get_note(keep_id)
+        if kept is None:
+            return False
+        title, content, category_id, spans = kept
+        others = [note[1] for note in map(store.get_note, other_ids) if note is not None]
+        merged = merge_contents(content, others)
+        if merged != content:
+            store.update_note(keep_id, title, merged, category_id, spans)
+        for note_id in other_ids:
+            store.delete_note(note_id)
+    return True
@@ -0,0 +1,113 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from typing import Callable, Dict, List, Optional, Tuple
+
+from duplicates import DuplicateNote
+from history_view import format_timestamp
+
+# Обработчики: переход к заметке (id, id категории), объединение (оставляемая, остальные)
+# и удаление (id); последние два возвращают True при успехе
+OpenHandler = Callable[[int, int], None]
+MergeHandler = Callable[[int, List[int]], bool]
+DeleteHandler = Callable[[List[int]], bool]
+
+
+class DuplicatesDialog:
+    """Окно групп похожих заметок: переход, объединение группы или удаление копий."""
+
+    def __init__(self, parent: tk.Misc, clusters: List[List[DuplicateNote]], category_names: Dict[int, str],
+                 on_open: OpenHandler, on_merge: MergeHandler, on_delete: DeleteHandler):
+        self.on_open = on_open
+        self.on_merge = on_merge
+        self.on_delete = on_delete
+        self.clusters: Dict[str, List[DuplicateNote]] = {}  # Строка группы -> заметки
+        self.window = tk.Toplevel(parent)
+        self.window.title("Похожие заметки")
+        self.window.geometry("900x550")
+        self.window.transient(parent)
+
+        ttk.Label(self.window, text="Оставляется выделенная заметка группы, а если выделена сама группа — "
+                                    "последняя измененная (первая в группе).").pack(anchor="w", padx=5, pady=5)
+        frame = ttk.Frame(self.window)
+        frame.pack(fill="both", expand=True, padx=5)
+        self.tree = ttk.Treeview(frame, columns=("category", "updated", "size", "similarity"))
+        self.tree.heading("#0", text="заголовок")
+        self.tree.heading("category", text="категория")
+        self.tree.heading("updated", text="изменена")
+        self.tree.heading("size", text="символов")
+        self.tree.heading("similarity", text="сходство")
+        self.tree.column("#0", width=350)
+        for column in ("category", "updated", "size", "similarity"):
+            self.tree.column(column, width=120, anchor="e" if column in ("size", "similarity") else "w")
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(fill="both", expand=True)
+        self.tree.bind("<Double-Button-1>", lambda event: self.open_selected())
+
+        for number, notes in enumerate(clusters, start=1):
+            group = self.tree.insert("", tk.END, text=f"Группа {number}: {len(notes)} заметок", open=True)
+            self.clusters[group] = notes
+            for note in notes:
+                self.tree.insert(group, tk.END, iid=f"{group}:{note.note_id}", text=note.title, values=(
+                    category_names.get(note.category_id, "?"), format_timestamp(note.updated_at),
+                    note.size, f"{note.similarity:.0%}"))
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(fill="x", padx=5, pady=5)
+        ttk.Button(buttons, text="Закрыть", command=self.window.destroy).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Удалить остальные", command=self.delete_others).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Объединить группу", command=self.merge_group).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Открыть", command=self.open_selected).pack(side="right", padx=5)
+
+    def selection(self) -> Optional[Tuple[str, DuplicateNote]]:
+        """Группа выделенной строки и оставляемая заметка."""
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showwarning("Ошибка выбора", "Выберите группу или заметку!", parent=self.window)
+            return None
+        item = selected[0]
+        group = self.tree.parent(item) or item
+        notes = self.clusters[group]
+        if item == group:
+            return group, notes[0]
+        note_id = int(item.rsplit(":", 1)[1])
+        return group, next(note for note in notes if note.note_id == note_id)
+
+    def open_selected(self) -> None:
+        """Переход к выделенной заметке."""
+        selected = self.selection()
+        if selected is not None:
+            _, note = selected
+            self.on_open(note.note_id, note.category_id)
+
+    def merge_group(self) -> None:
+        """Объединение группы в оставляемую заметку."""
+        selected = self.selection()
+        if selected is None:
+            return
+        group, keep = selected
+        others = [note.note_id for note in self.clusters[group] if note.note_id != keep.note_id]
+        if not messagebox.askyesno("Подтверждение", f"Добавить новые строки {len(others)} заметок в «{keep.title}» "
+                                                    f"и удалить их?", parent=self.window):
+            return
+        if self.on_merge(keep.note_id, others):
+            self.remove_group(group)
+
+    def delete_others(self) -> None:
+        """Удаление всех заметок группы, кроме оставляемой."""
+        selected = self.selection()
+        if selected is None:
+            return
+        group, keep = selected
+        others = [note.note_id for note in self.clusters[group] if note.note_id != keep.note_id]
+        if not messagebox.askyesno("Подтверждение", f"Удалить {len(others)} заметок, оставив «{keep.title}»?",
+                                   parent=self.window):
+            return
+        if self.on_delete(others):
+            self.remove_group(group)
+
+    def remove_group(self, group: str) -> None:
+        """Удаление обработанной группы из списка."""
+        self.tree.delete(group)
+        del self.clusters[group]
@@ -0,0 +1,197 @@
+import re
+import sys
+import tkinter as tk
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Стили форматирования (битовые флаги, хранятся в базе)
+BOLD = 1
+ITALIC = 2
+UNDERLINE = 4
+
+# Теги Text, сохраняемые вместе с заметкой, и соответствующие им стили
+STYLE_TAGS: Dict[str, int] = {"bold": BOLD, "italic": ITALIC, "underline": UNDERLINE}
+
+# Разметка в тексте: *жирный*, _курсив_, ~подчеркнутый~ (в пределах строки)
+MARKUP_PATTERNS: List[Tuple["re.Pattern[str]", str]] = [
+    (re.compile(r"\*(.*?)\*"), "markup_bold"),
+    (re.compile(r"_(.*?)_"), "markup_italic"),
+    (re.compile(r"~(.*?)~"), "markup_underline"),
+]
+
+# Диапазон форматирования: (смещение в символах, длина, стиль)
+Span = Tuple[int, int, int]
+
+
+def pack_spans(spans: Sequence[Span]) -> Optional[bytes]:
+    """Упаковка диапазонов в BLOB: тройки uint32 (смещение, длина, стиль) little-endian."""
+    if not spans:
+        return None
+    packed = array("I")
+    for offset, length, style in spans:
+        packed.extend((offset, length, style))
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_spans(blob: Optional[bytes]) -> List[Span]:
+    """Распаковка BLOB, созданного pack_spans."""
+    if not blob:
+        return []
+    packed = array("I")
+    packed.frombytes(blob)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return [(packed[i], packed[i + 1], packed[i + 2]) for i in range(0, len(packed), 3)]
+
+
+def line_starts(text: str) -> array:
+    """Смещения начала каждой строки текста (для перевода индексов Tk)."""
+    starts = array("q", [0])
+    starts.extend(match.end() for match in re.finditer("\n", text))
+    return starts
+
+
+def offset_to_index(offset: int, starts: array) -> str:
+    """Смещение в символах -> индекс Tk вида "строка.столбец"."""
+    line = bisect_right(starts, offset)
+    return f"{line}.{offset - starts[line - 1]}"
+
+
+def index_to_offset(index: str, starts: array) -> int:
+    """Индекс Tk вида "строка.столбец" -> смещение в символах."""
+    line, column = map(int, str(index).split("."))
+    return starts[line - 1] + column
+
+
+def collect_spans(widget: tk.Text, text: str, start: int = 0, end: Optional[int] = None) -> List[Span]:
+    """Диапазоны сохраняемых тегов виджета в пределах [start, end) текста text.
+
+    text — содержимое виджета ("1.0" .. "end-1c"); смещения результата
+    отсчитываются от start, чтобы соответствовать обрезанному тексту.
+    """
+    if end is None:
+        end = len(text)
+    starts = line_starts(text)
+    spans: List[Span] = []
+    for tag, style in STYLE_TAGS.items():
+        ranges = widget.tag_ranges(tag)
+        for i in range(0, len(ranges), 2):
+            first = max(index_to_offset(ranges[i], starts), start)
+            last = min(index_to_offset(ranges[i + 1], starts), end)
+            if last > first:
+                spans.append((first - start, last - first, style))
+    spans.sort()
+    return spans
+
+
+# Индексы Tk для tag_add по каждому тегу: [начало, конец, начало, конец, ...]
+TagIndices = Dict[str, List[str]]
+
+
+def span_indices(spans: Sequence[Span], text: str) -> TagIndices:
+    """Перевод диапазонов в индексы Tk (можно вычислить заранее, вне потока Tk)."""
+    indices: TagIndices = {}
+    if not spans:
+        return indices
+    starts = line_starts(text)
+    for offset, length, style in spans:
+        for tag, tag_style in STYLE_TAGS.items():
+            if style & tag_style:
+                tag_indices = indices.setdefault(tag, [])
+                tag_indices.append(offset_to_index(offset, starts))
+                tag_indices.append(offset_to_index(offset + length, starts))
+    return indices
+
+
+def apply_indices(widget: tk.Text, indices: TagIndices) -> None:
+    """Применение готовых индексов: один вызов tag_add на каждый стиль."""
+    for tag, tag_indices in indices.items():
+        if tag_indices:
+            widget.tag_add(tag, *tag_indices)
+
+
+def apply_spans(widget: tk.Text, spans: Sequence[Span], text: str) -> None:
+    """Применение диапазонов к виджету: один вызов tag_add на каждый стиль."""
+    apply_indices(widget, span_indices(spans, text))
+
+
+class MarkupHighlighter:
+    """Подсветка разметки *жирный*, _курсив_, ~подчеркнутый~ по изменённым строкам.
+
+    Команда виджета Text подменяется прокси, который перехватывает
+    insert/delete/replace и запоминает затронутые строки; при простое они
+    размечаются заново, по одному вызову tag_add на каждый тег. Так правка
+    в большой заметке не приводит к разбору всего текста.
+    """
+
+    def __init__(self, widget: tk.Text):
+        self.widget = widget
+        self._dirty: Optional[Tuple[int, int]] = None  # Диапазон строк для повторной разметки
+        self._after_id: Optional[str] = None
+        self._orig = str(widget) + "_orig"
+        widget.tk.call("rename", str(widget), self._orig)
+        widget.tk.createcommand(str(widget), self._proxy)
+
+    def _line(self, index: str) -> int:
+        """Номер строки индекса виджета."""
+        return int(self.widget.tk.call(self._orig, "index", index).split(".")[0])
+
+    def _edit_line(self, index: str) -> int:
+        """Строка, с которой начинается правка по индексу.
+
+        Текст, вставляемый в "end" и дальше, Tk помещает перед завершающим
+        переводом строки, то есть в последнюю строку текста, а не после неё.
+        """
+        return min(self._line(index), self._line("end-1c"))
+
+    def _proxy(self, *args: str) -> str:
+        """Перехват команд виджета с отслеживанием изменённых строк."""
+        command = args[0] if args else ""
+        if command in ("insert", "replace"):
+            first = self._edit_line(args[1])
+            added = sum(chunk.count("\n") for chunk in args[2 if command == "insert" else 3::2])
+            result = self.widget.tk.call((self._orig,) + args)
+            self._mark_dirty(first, first + added)
+            return result
+        if command == "delete":
+            first = self._edit_line(args[1])
+            result = self.widget.tk.call((self._orig,) + args)
+            self._mark_dirty(first, first)
+            return result
+        result = self.widget.tk.call((self._orig,) + args)
+        if command == "edit" and len(args) > 1 and args[1] in ("undo", "redo"):
+            # Отмена может затронуть любой участок текста
+            self._mark_dirty(1, self._line("end"))
+        return result
+
+    def _mark_dirty(self, first: int, last: int) -> None:
+        """Добавление строк к диапазону повторной разметки."""
+        if self._dirty is not None:
+            first, last = min(first, self._dirty[0]), max(last, self._dirty[1])
+        self._dirty = (first, last)
+        if self._after_id is None:
+            self._after_id = self.widget.after_idle(self.refresh)
+
+    def refresh(self) -> None:
+        """Повторная разметка накопленного диапазона строк."""
+        self._after_id = None
+        if self._dirty is None:
+            return
+        first, last = self._dirty
+        self._dirty = None
+        last = min(last, self._line("end"))
+        start, end = f"{first}.0", f"{last}.end"
+        lines = self.widget.get(start, end).split("\n")
+        indices: Dict[str, List[str]] = {tag: [] for _, tag in MARKUP_PATTERNS}
+        for number, line in enumerate(lines, start=first):
+            for pattern, tag in MARKUP_PATTERNS:
+                for match in pattern.finditer(line):
+                    indices[tag].append(f"{number}.{match.start()}")
+                    indices[tag].append(f"{number}.{match.end()}")
+        for tag, tag_indices in indices.items():
+            self.widget.tag_remove(tag, start, end)
+            if tag_indices:
+                self.widget.tag_add(tag, *tag_indices)
@@ -0,0 +1,257 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+from difflib import SequenceMatcher
+from typing import Callable, List, Optional, Tuple, Union
+
+from bodies import COMPRESSION_LEVEL, read_body
+from database import begin_immediate, now_ms
+from formatting import Span, unpack_spans
+
+# Каждая N-я версия хранится целиком, остальные — разницей с предыдущей,
+# так что для восстановления любой версии применяется не больше N-1 разниц
+SNAPSHOT_EVERY = 20
+
+# Версии старше этого срока удаляются при уплотнении (последняя версия сохраняется всегда)
+RETENTION_MS = 90 * 24 * 60 * 60 * 1000
+
+# Наибольшее число хранимых версий одной заметки
+MAX_REVISIONS = 500
+
+# Виды записей note_revisions
+KIND_SNAPSHOT = 0
+KIND_DELTA = 1
+
+# Версия в списке истории: (номер, created_at, заголовок)
+RevisionRow = Tuple[int, int, str]
+
+# Операция разницы: [начало, конец) — строки предыдущей версии, str — новый текст
+DeltaOp = Union[List[int], str]
+
+
+def make_delta(old: str, new: str) -> bytes:
+    """Построчная разница между версиями, сжатая zlib.
+
+    Общие начало и конец отбрасываются до сравнения, поэтому правка в
+    одном месте большой заметки сравнивает лишь несколько строк.
+    """
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    ops: List[DeltaOp] = []
+    if prefix:
+        ops.append([0, prefix])
+    matcher = SequenceMatcher(None, a[prefix:len(a) - suffix], b[prefix:len(b) - suffix], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([prefix + i1, prefix + i2])
+        elif j2 > j1:
+            ops.append("".join(b[prefix + j1:prefix + j2]))
+    if suffix:
+        ops.append([len(a) - suffix, len(a)])
+    return zlib.compress(json.dumps(ops, ensure_ascii=False).encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def apply_delta(old: str, delta: bytes) -> str:
+    """Восстановление версии по предыдущей и разнице make_delta."""
+    lines = old.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(delta).decode("utf-8")):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(lines[op[0]:op[1]])
+    return "".join(parts)
+
+
+def _current_version(conn: sqlite3.Connection, note_id: int) -> Optional[Tuple[str, str, Optional[bytes], int]]:
+    """Текущая версия заметки из notes: (заголовок, содержимое, формат, updated_at)."""
+    row = conn.execute("SELECT title, content, format, updated_at FROM notes WHERE id = ?",
+                       (note_id,)).fetchone()
+    if row is None:
+        return None
+    title, content, spans, updated_at = row
+    if content is None:
+        content = read_body(conn, note_id) or ""
+    return title, content, spans, updated_at
+
+
+def content_digest(content: str) -> bytes:
+    """Хэш содержимого версии для сверки с notes без восстановления версии."""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+
+def _insert_revision(conn: sqlite3.Connection, note_id: int, revision: int, created_at: int,
+                     title: str, content: str, spans: Optional[bytes], previous: Optional[str]) -> None:
+    """Запись версии целиком или разницей с предыдущей."""
+    if previous is None or (revision - 1) % SNAPSHOT_EVERY == 0:
+        kind, data = KIND_SNAPSHOT, zlib.compress(content.encode("utf-8"), COMPRESSION_LEVEL)
+    else:
+        kind, data = KIND_DELTA, make_delta(previous, content)
+    conn.execute("""
+        INSERT INTO note_revisions (note_id, revision, created_at, title, kind, data, format, digest)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (note_id, revision, created_at, title, kind, data, spans, content_digest(content)))
+
+
+def record_revision(conn: sqlite3.Connection, note_id: int, title: str, content: str,
+                    spans: Optional[bytes], saved_at: int) -> None:
+    """Добавление версии заметки перед её обновлением (внутри транзакции записи).
+
+    Предыдущая версия берется из notes, а не восстанавливается из
+    истории. Если истории у заметки еще нет (заметка создана до появления
+    истории или загружена пакетно) или notes изменили в обход
+    NoteStore.update_note (хэш последней версии не совпадает с notes),
+    сначала целиком сохраняется текущая версия: иначе разница была бы
+    построена не от той версии, к которой её применит get_revision.
+    Повторное сохранение без изменений новой версии не создает.
+    """
+    current = _current_version(conn, note_id)
+    if current is None:
+        return
+    old_title, old_content, old_spans, updated_at = current
+    row = conn.execute("""
+        SELECT revision, digest FROM note_revisions WHERE note_id = ? ORDER BY revision DESC LIMIT 1
+    """, (note_id,)).fetchone()
+    if row is None:
+        last = 0
+    else:
+        last, digest = row
+        if digest is None:
+            # Версия записана до появления хэшей: сверяется восстановленное содержимое
+            digest = content_digest(get_revision(conn, note_id, last)[1])
+    if row is None or digest != content_digest(old_content):
+        last += 1
+        _insert_revision(conn, note_id, last, updated_at, old_title, old_content, old_spans, None)
+    if (title, content, spans) == (old_title, old_content, old_spans):
+        return
+    _insert_revision(conn, note_id, last + 1, saved_at, title, content, spans, old_content)
+
+
+def list_revisions(conn: sqlite3.Connection, note_id: int) -> List[RevisionRow]:
+    """Версии заметки, новые сверху."""
+    return conn.execute("""
+        SELECT revision, created_at, title FROM note_revisions
+        WHERE note_id = ? ORDER BY revision DESC
+    """, (note_id,)).fetchall()
+
+
+def get_revision(conn: sqlite3.Connection, note_id: int,
+                 revision: int) -> Optional[Tuple[str, str, List[Span]]]:
+    """Версия заметки: (заголовок, содержимое, форматирование) или None.
+
+    Читаются ближайшая предшествующая полная версия и разницы после неё.
+    """
+    rows = conn.execute("""
+        SELECT title, kind, data, format FROM note_revisions
+        WHERE note_id = ? AND revision <= ? AND revision >= (
+            SELECT max(revision) FROM note_revisions
+            WHERE note_id = ? AND revision <= ? AND kind = ?
+        )
+        ORDER BY revision
+    """, (note_id, revision, note_id, revision, KIND_SNAPSHOT)).fetchall()
+    if not rows:
+        return None
+    content = ""
+    for title, kind, data, spans in rows:
+        if kind == KIND_SNAPSHOT:
+            content = zlib.decompress(data).decode("utf-8")
+        else:
+            content = apply_delta(content, data)
+    return title, content, unpack_spans(spans)
+
+
+def compact_note_history(conn: sqlite3.Connection, note_id: int, cutoff: int,
+                         max_revisions: int = MAX_REVISIONS) -> int:
+    """Удаление старых версий одной заметки (внутри транзакции записи).
+
+    Сохраняются версии не старше cutoff, не больше max_revisions и
+    всегда последняя. Если первая оставшаяся версия хранится разницей,
+    она переписывается целиком, чтобы её можно было восстановить.
+    Возвращает количество удаленных версий.
+    """
+    rows = conn.execute("""
+        SELECT revision, kind, created_at FROM note_revisions
+        WHERE note_id = ? ORDER BY revision
+    """, (note_id,)).fetchall()
+    start = max(len(rows) - max_revisions, 0)
+    while start < len(rows) - 1 and rows[start][2] < cutoff:
+        start += 1
+    if start == 0:
+        return 0
+    first_kept, kind, _ = rows[start]
+    if kind == KIND_DELTA:
+        _, content, _ = get_revision(conn, note_id, first_kept)
+        conn.execute("UPDATE note_revisions SET kind = ?, data = ? WHERE note_id = ? AND revision = ?",
+                     (KIND_SNAPSHOT, zlib.compress(content.encode("utf-8"), COMPRESSION_LEVEL),
+                      note_id, first_kept))
+    return conn.execute("DELETE FROM note_revisions WHERE note_id = ? AND revision < ?",
+                        (note_id, first_kept)).rowcount
+
+
+def compact_history(conn: sqlite3.Connection, cutoff: int, max_revisions: int = MAX_REVISIONS,
+                    stop: Optional[threading.Event] = None) -> int:
+    """Уплотнение истории всех заметок, по одной транзакции на заметку.
+
+    conn должен работать в режиме автокоммита. Возвращает количество
+    удаленных версий.
+    """
+    note_ids = [note_id for (note_id,) in conn.execute("""
+        SELECT note_id FROM note_revisions GROUP BY note_id
+        HAVING count(*) > 1 AND (count(*) > ? OR min(created_at) < ?)
+    """, (max_revisions, cutoff))]
+    removed = 0
+    for note_id in note_ids:
+        if stop is not None and stop.is_set():
+            break
+        begin_immediate(conn)
+        try:
+            removed += compact_note_history(conn, note_id, cutoff, max_revisions)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return removed
+
+
+class HistoryCompactor:
+    """Фоновое уплотнение истории версий.
+
+    Поток со своим соединением уплотняет историю каждой заметки в
+    отдельной короткой транзакции, так что запись из интерфейса не ждет
+    окончания всей работы.
+    """
+
+    def __init__(self, open_connection: Callable[[], sqlite3.Connection],
+                 retention_ms: int = RETENTION_MS, max_revisions: int = MAX_REVISIONS):
+        self.open_connection = open_connection
+        self.retention_ms = retention_ms
+        self.max_revisions = max_revisions
+        self.removed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-compactor", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Уплотнение; при ошибке попытка повторится при следующем запуске."""
+        try:
+            conn = self.open_connection()
+            try:
+                self.removed = compact_history(conn, now_ms() - self.retention_ms, self.max_revisions, self._stop)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Остановка уплотнения (между заметками)."""
+        self._stop.set()
+        self._thread.join(timeout)
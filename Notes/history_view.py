@@ -0,0 +1,114 @@
+import sqlite3
+import tkinter as tk
+from datetime import datetime
+from tkinter import ttk, messagebox
+from typing import Callable, List, Optional
+
+from formatting import Span, apply_spans
+from history import RevisionRow
+from store import NoteStore
+
+# Обработчик восстановления версии: (заголовок, содержимое, форматирование)
+RestoreHandler = Callable[[str, str, List[Span]], None]
+
+
+def format_timestamp(timestamp: int) -> str:
+    """Время версии для списка истории."""
+    return datetime.fromtimestamp(timestamp / 1000).strftime("%d.%m.%Y %H:%M:%S")
+
+
+class HistoryDialog:
+    """Окно истории версий заметки: список версий, просмотр и восстановление."""
+
+    def __init__(self, parent: tk.Misc, store: NoteStore, note_id: int, title: str,
+                 on_restore: RestoreHandler):
+        self.store = store
+        self.note_id = note_id
+        self.on_restore = on_restore
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"История версий: {title}")
+        self.window.geometry("900x600")
+        self.window.transient(parent)
+        self.window.grab_set()  # Пока окно открыто, текущая заметка не меняется
+
+        paned = ttk.PanedWindow(self.window, orient="horizontal")
+        paned.pack(fill="both", expand=True, padx=5, pady=5)
+        list_frame = ttk.Frame(paned)
+        paned.add(list_frame, weight=1)
+        self.listbox = tk.Listbox(list_frame, width=40, exportselection=False)
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.listbox.yview)
+        self.listbox.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.listbox.bind("<<ListboxSelect>>", self.show_selected)
+
+        preview_frame = ttk.Frame(paned)
+        paned.add(preview_frame, weight=3)
+        self.preview = tk.Text(preview_frame, wrap="word", state="disabled")
+        self.preview.tag_configure("bold", font=("TkDefaultFont", 10, "bold"))
+        self.preview.tag_configure("italic", font=("TkDefaultFont", 10, "italic"))
+        self.preview.tag_configure("underline", font=("TkDefaultFont", 10, "underline"))
+        self.preview.pack(fill="both", expand=True)
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(fill="x", padx=5, pady=5)
+        ttk.Button(buttons, text="Закрыть", command=self.window.destroy).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Восстановить эту версию", command=self.restore).pack(side="right", padx=5)
+
+        self.revisions: List[RevisionRow] = []
+        self.load_revisions()
+
+    def load_revisions(self) -> None:
+        """Заполнение списка версий, новые сверху."""
+        try:
+            self.revisions = self.store.revisions(self.note_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить историю: {e}", parent=self.window)
+            return
+        if not self.revisions:
+            self.listbox.insert(tk.END, "История пуста: заметка еще не изменялась")
+            return
+        self.listbox.insert(tk.END, *(f"{format_timestamp(created_at)} — {title}"
+                                      for _, created_at, title in self.revisions))
+        self.listbox.selection_set(0)
+        self.show_selected()
+
+    def selected_revision(self) -> int:
+        """Номер выбранной версии или 0."""
+        selection = self.listbox.curselection()
+        if not selection or selection[0] >= len(self.revisions):
+            return 0
+        return self.revisions[selection[0]][0]
+
+    def show_selected(self, event: Optional[tk.Event] = None) -> None:
+        """Показ выбранной версии."""
+        revision = self.selected_revision()
+        if not revision:
+            return
+        try:
+            version = self.store.get_revision(self.note_id, revision)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить версию: {e}", parent=self.window)
+            return
+        if version is None:
+            return
+        _, content, spans = version
+        self.preview.configure(state="normal")
+        self.preview.delete("1.0", tk.END)
+        self.preview.insert("1.0", content)
+        apply_spans(self.preview, spans, content)
+        self.preview.configure(state="disabled")
+
+    def restore(self) -> None:
+        """Загрузка выбранной версии в редактор."""
+        revision = self.selected_revision()
+        if not revision:
+            return
+        try:
+            version = self.store.get_revision(self.note_id, revision)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить версию: {e}", parent=self.window)
+            return
+        if version is not None:
+            self.window.destroy()
+            self.on_restore(*version)
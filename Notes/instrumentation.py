@@ -0,0 +1,221 @@
+"""Встроенное профилирование: таймеры операций, журнал медленных запросов
+и обнаружение зависаний цикла событий Tk.
+
+По умолчанию профилирование выключено и ничего не оборачивает: методы
+и соединения подменяются только после profiler.enable(), поэтому в
+обычном режиме затрат нет.
+"""
+import functools
+import json
+import sqlite3
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Запросы дольше этого порога (мс) попадают в журнал медленных запросов вместе с планом
+SLOW_QUERY_MS = 20.0
+
+# Период (мс) контрольного вызова root.after и задержка сверх него, считающаяся зависанием
+HEARTBEAT_MS = 50
+STALL_MS = 100.0
+
+# Сколько последних замеров операции хранится для перцентилей
+SAMPLES_KEPT = 1000
+
+# Сколько последних медленных запросов и зависаний хранится
+LOG_KEPT = 200
+
+# Операторы, для которых запрашивается план выполнения
+PLANNED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class OperationStats:
+    """Счетчик и время выполнения одной операции."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=SAMPLES_KEPT)
+
+    def add(self, seconds: float) -> None:
+        """Учет одного выполнения."""
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        """Перцентиль по последним замерам (метод ближайшего ранга), в секундах."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(0, min(len(ordered), round(p / 100.0 * len(ordered) + 0.5)) - 1)]
+
+    def as_dict(self) -> Dict[str, float]:
+        """Сводка в миллисекундах для отчета."""
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "avg_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Profiler:
+    """Сбор замеров из потока Tk и фоновых потоков (под блокировкой)."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.slow_query_ms = SLOW_QUERY_MS
+        self.started = time.time()
+        self.operations: Dict[str, OperationStats] = {}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=LOG_KEPT)
+        self.stalls: Deque[Tuple[float, float]] = deque(maxlen=LOG_KEPT)  # (время, длительность в мс)
+        self.stall_count = 0
+        self._lock = threading.Lock()
+
+    def enable(self, slow_query_ms: float = SLOW_QUERY_MS) -> None:
+        """Включение профилирования (до создания соединений и интерфейса)."""
+        self.enabled = True
+        self.slow_query_ms = slow_query_ms
+
+    def reset(self) -> None:
+        """Сброс накопленных данных."""
+        with self._lock:
+            self.started = time.time()
+            self.operations.clear()
+            self.slow_queries.clear()
+            self.stalls.clear()
+            self.stall_count = 0
+
+    def record(self, name: str, seconds: float) -> None:
+        """Учет выполнения операции name."""
+        with self._lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = OperationStats()
+            stats.add(seconds)
+
+    def record_query(self, sql: str, seconds: float, plan: List[str]) -> None:
+        """Запись медленного запроса с планом выполнения."""
+        with self._lock:
+            self.slow_queries.append({"time": time.time(), "ms": seconds * 1000, "sql": sql, "plan": plan})
+
+    def record_stall(self, milliseconds: float) -> None:
+        """Запись зависания цикла событий."""
+        with self._lock:
+            self.stall_count += 1
+            self.stalls.append((time.time(), milliseconds))
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Обертка, замеряющая время каждого вызова func."""
+        @functools.wraps(func)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed
+
+    def instrument(self, obj: Any, names: Iterable[str], prefix: str) -> None:
+        """Подмена методов объекта замеряющими обертками (только при включенном профилировании).
+
+        Обертки ставятся атрибутами экземпляра, поэтому их нужно ставить
+        до того, как методы переданы в bind, after или trace.
+        """
+        if not self.enabled:
+            return
+        for name in names:
+            setattr(obj, name, self.wrap(prefix + name, getattr(obj, name)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Все собранные данные в виде, пригодном для JSON."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "duration_s": time.time() - self.started,
+                "operations": {name: stats.as_dict() for name, stats in sorted(self.operations.items())},
+                "slow_queries": list(self.slow_queries),
+                "stall_count": self.stall_count,
+                "stalls": [{"time": moment, "ms": ms} for moment, ms in self.stalls],
+            }
+
+    def export_json(self, path: str) -> None:
+        """Сохранение собранных данных в файл JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+
+profiler = Profiler()
+
+
+def normalize_sql(sql: str) -> str:
+    """Текст запроса в одну строку (ключ операции в статистике)."""
+    return " ".join(sql.split())
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Соединение, замеряющее execute/executemany.
+
+    Для SELECT замеряется подготовка и первый шаг выполнения; чтение
+    остальных строк учитывается таймерами операций NoteStore. Медленные
+    запросы записываются вместе с EXPLAIN QUERY PLAN.
+    """
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        self._record(sql, time.perf_counter() - start, parameters)
+        return cursor
+
+    def executemany(self, sql: str, parameters: Iterable[Any], /) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        cursor = super().executemany(sql, parameters)
+        self._record(sql, time.perf_counter() - start, None)
+        return cursor
+
+    def _record(self, sql: str, seconds: float, parameters: Any) -> None:
+        """Учет запроса и, если он медленный, его плана."""
+        text = normalize_sql(sql)
+        profiler.record("sql: " + text, seconds)
+        if seconds * 1000 < profiler.slow_query_ms:
+            return
+        plan: List[str] = []
+        if parameters is not None and text.upper().startswith(PLANNED_STATEMENTS):
+            try:
+                plan = [row[3] for row in super().execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+            except sqlite3.Error as e:
+                plan = [f"план недоступен: {e}"]
+        profiler.record_query(text, seconds, plan)
+
+
+class Heartbeat:
+    """Обнаружение зависаний цикла событий по опозданию контрольного root.after."""
+
+    def __init__(self, root: tk.Misc, interval_ms: int = HEARTBEAT_MS, stall_ms: float = STALL_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.stall_ms = stall_ms
+        self._last = time.perf_counter()
+        self._after_id: Optional[str] = root.after(interval_ms, self._tick)
+
+    def _tick(self) -> None:
+        """Контрольный вызов: задержка сверх интервала означает, что цикл событий был занят."""
+        now = time.perf_counter()
+        late = (now - self._last) * 1000 - self.interval_ms
+        if late >= self.stall_ms:
+            profiler.record_stall(late)
+        self._last = now
+        self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    def stop(self) -> None:
+        """Остановка контрольных вызовов."""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
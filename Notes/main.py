@@ -1,454 +1,1273 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog, font
-import sqlite3
-from datetime import datetime
-import os
-import re
-from typing import Optional, List, Tuple
-
-class NotesApp:
-    def __init__(self, root: tk.Tk):
-        """Инициализация приложения для заметок."""
-        self.root = root
-        self.root.title("Приложение для заметок")
-        self.root.geometry("1200x800")
-        self.theme = "light"  # Тема по умолчанию: светлая
-        self.current_note_id: Optional[int] = None  # ID текущей заметки
-        self.search_query = tk.StringVar()  # Переменная для поискового запроса
-        self.search_query.trace("w", self.search_notes)  # Отслеживание изменений в поиске
-
-        # Инициализация базы данных
-        self.init_database()
-
-        # Создание главного контейнера
-        self.main_frame = ttk.Frame(self.root)
-        self.main_frame.pack(fill="both", expand=True, padx=10, pady=10)
-
-        # Настройка элементов интерфейса
-        self.setup_menu()
-        self.setup_toolbar()
-        self.setup_main_layout()
-        self.load_categories()
-        self.load_notes()
-
-        # Настройка стилей и тем
-        self.style = ttk.Style()
-        self.configure_themes()
-
-        # Привязка горячих клавиш
-        self.bind_hotkeys()
-
-    def init_database(self) -> None:
-        """Инициализация базы данных SQLite и создание таблиц."""
-        try:
-            self.conn = sqlite3.connect("notes.db")
-            self.cursor = self.conn.cursor()
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS notes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    content TEXT,
-                    category_id INTEGER,
-                    created_at TEXT,
-                    updated_at TEXT,
-                    FOREIGN KEY (category_id) REFERENCES categories (id)
-                )
-            """)
-            self.conn.commit()
-            # Добавление категории по умолчанию, если она не существует
-            self.cursor.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", ("Общее",))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка базы данных", f"Не удалось инициализировать базу данных: {e}")
-            self.root.quit()
-
-    def configure_themes(self) -> None:
-        """Настройка светлой и темной тем."""
-        self.style.configure("TButton", padding=5)
-        self.style.configure("TEntry", padding=5)
-        self.style.configure("TCombobox", padding=5)
-        self.light_theme = {
-            "bg": "#ffffff",
-            "fg": "#000000",
-            "entry_bg": "#f0f0f0",
-            "text_bg": "#ffffff",
-            "text_fg": "#000000",
-            "highlight": "#0078d7"
-        }
-        self.dark_theme = {
-            "bg": "#2d2d2d",
-            "fg": "#ffffff",
-            "entry_bg": "#3c3c3c",
-            "text_bg": "#3c3c3c",
-            "text_fg": "#ffffff",
-            "highlight": "#1e90ff"
-        }
-        self.apply_theme(self.theme)
-
-    def apply_theme(self, theme: str) -> None:
-        """Применение выбранной темы к интерфейсу."""
-        theme_colors = self.light_theme if theme == "light" else self.dark_theme
-        self.root.configure(bg=theme_colors["bg"])
-        self.main_frame.configure(style="TFrame")
-        self.style.configure("TFrame", background=theme_colors["bg"])
-        self.style.configure("TLabel", background=theme_colors["bg"], foreground=theme_colors["fg"])
-        self.style.configure("TButton", background=theme_colors["entry_bg"], foreground=theme_colors["fg"])
-        self.style.configure("TEntry", fieldbackground=theme_colors["entry_bg"], foreground=theme_colors["fg"])
-        self.style.configure("TCombobox", fieldbackground=theme_colors["entry_bg"], foreground=theme_colors["fg"])
-        self.note_text.configure(bg=theme_colors["text_bg"], fg=theme_colors["text_fg"],
-                               insertbackground=theme_colors["fg"])
-        self.notes_list.configure(bg=theme_colors["text_bg"], fg=theme_colors["text_fg"])
-
-    def setup_menu(self) -> None:
-        """Настройка строки меню."""
-        menubar = tk.Menu(self.root)
-        self.root.config(menu=menubar)
-
-        # Меню "Файл"
-        file_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="Файл", menu=file_menu)
-        file_menu.add_command(label="Новая заметка", command=self.new_note, accelerator="Ctrl+N")
-        file_menu.add_command(label="Экспортировать заметку", command=self.export_note)
-        file_menu.add_separator()
-        file_menu.add_command(label="Выход", command=self.quit_app)
-
-        # Меню "Правка"
-        edit_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="Правка", menu=edit_menu)
-        edit_menu.add_command(label="Отменить", command=lambda: self.note_text.event_generate("<<Undo>>"),
-                            accelerator="Ctrl+Z")
-        edit_menu.add_command(label="Повторить", command=lambda: self.note_text.event_generate("<<Redo>>"),
-                            accelerator="Ctrl+Y")
-        edit_menu.add_separator()
-        edit_menu.add_command(label="Вырезать", command=lambda: self.note_text.event_generate("<<Cut>>"),
-                            accelerator="Ctrl+X")
-        edit_menu.add_command(label="Копировать", command=lambda: self.note_text.event_generate("<<Copy>>"),
-                            accelerator="Ctrl+C")
-        edit_menu.add_command(label="Вставить", command=lambda: self.note_text.event_generate("<<Paste>>"),
-                            accelerator="Ctrl+V")
-
-        # Меню "Вид"
-        view_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="Вид", menu=view_menu)
-        view_menu.add_command(label="Переключить тему", command=self.toggle_theme)
-
-    def setup_toolbar(self) -> None:
-        """Настройка панели инструментов с кнопками и поиском."""
-        toolbar = ttk.Frame(self.main_frame)
-        toolbar.pack(fill="x", pady=5)
-
-        # Кнопка "Новая заметка"
-        new_btn = ttk.Button(toolbar, text="Новая заметка", command=self.new_note)
-        new_btn.pack(side="left", padx=5)
-
-        # Кнопка "Сохранить заметку"
-        save_btn = ttk.Button(toolbar, text="Сохранить заметку", command=self.save_note)
-        save_btn.pack(side="left", padx=5)
-
-        # Кнопка "Удалить заметку"
-        delete_btn = ttk.Button(toolbar, text="Удалить заметку", command=self.delete_note)
-        delete_btn.pack(side="left", padx=5)
-
-        # Кнопки форматирования
-        bold_btn = ttk.Button(toolbar, text="Ж", command=self.toggle_bold, style="TButton")
-        bold_btn.pack(side="left", padx=5)
-        italic_btn = ttk.Button(toolbar, text="К", command=self.toggle_italic, style="TButton")
-        italic_btn.pack(side="left", padx=5)
-        underline_btn = ttk.Button(toolbar, text="П", command=self.toggle_underline, style="TButton")
-        underline_btn.pack(side="left", padx=5)
-
-        # Поле поиска
-        self.search_entry = ttk.Entry(toolbar, textvariable=self.search_query)
-        self.search_entry.pack(side="right", padx=5, fill="x", expand=True)
-        ttk.Label(toolbar, text="Поиск:").pack(side="right", padx=5)
-
-    def setup_main_layout(self) -> None:
-        """Настройка основного макета с списком заметок, категориями и редактором."""
-        paned = ttk.PanedWindow(self.main_frame, orient="horizontal")
-        paned.pack(fill="both", expand=True)
-
-        # Левая панель (категории и список заметок)
-        left_frame = ttk.Frame(paned)
-        paned.add(left_frame, weight=1)
-
-        # Категории
-        ttk.Label(left_frame, text="Категория:").pack(anchor="w", padx=5, pady=2)
-        self.category_combo = ttk.Combobox(left_frame, state="readonly")
-        self.category_combo.pack(fill="x", padx=5, pady=2)
-        self.category_combo.bind("<<ComboboxSelected>>", self.load_notes)
-
-        # Список заметок
-        ttk.Label(left_frame, text="Заметки:").pack(anchor="w", padx=5, pady=2)
-        self.notes_list = tk.Listbox(left_frame, height=20, width=30)
-        self.notes_list.pack(fill="both", expand=True, padx=5, pady=5)
-        self.notes_list.bind("<<ListboxSelect>>", self.load_selected_note)
-
-        # Правая панель (редактор заметок)
-        right_frame = ttk.Frame(paned)
-        paned.add(right_frame, weight=3)
-
-        # Поле для заголовка
-        ttk.Label(right_frame, text="Заголовок:").pack(anchor="w", padx=5, pady=2)
-        self.title_entry = ttk.Entry(right_frame)
-        self.title_entry.pack(fill="x", padx=5, pady=2)
-
-        # Текстовое поле для заметки
-        self.note_text = tk.Text(right_frame, height=20, wrap="word", undo=True)
-        self.note_text.pack(fill="both", expand=True, padx=5, pady=5)
-
-        # Настройка тегов форматирования
-        self.note_text.tag_configure("bold", font=("TkDefaultFont", 10, "bold"))
-        self.note_text.tag_configure("italic", font=("TkDefaultFont", 10, "italic"))
-        self.note_text.tag_configure("underline", font=("TkDefaultFont", 10, "underline"))
-
-    def bind_hotkeys(self) -> None:
-        """Приспользование горячих клавиш для быстрых действий."""
-        self.root.bind("<Control-n>", lambda event: self.new_note())
-        self.root.bind("<Control-s>", lambda event: self.save_note())
-        self.root.bind("<Control-d>", lambda event: self.delete_note())
-        self.root.bind("<Control-t>", lambda event: self.toggle_theme())
-        self.note_text.bind("<Control-b>", lambda event: self.toggle_bold())
-        self.note_text.bind("<Control-i>", lambda event: self.toggle_italic())
-        self.note_text.bind("<Control-u>", lambda event: self.toggle_underline())
-        self.root.bind("<Control-e>", lambda event: self.export_note())
-
-    def load_categories(self) -> None:
-        """Загрузка категорий из базы данных в выпадающий список."""
-        try:
-            self.cursor.execute("SELECT name FROM categories ORDER BY name")
-            categories = [row[0] for row in self.cursor.fetchall()]
-            self.category_combo["values"] = categories
-            if categories:
-                self.category_combo.set(categories[0])
-            else:
-                self.category_combo.set("Общее")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить категории: {e}")
-
-    def load_notes(self, event: Optional[tk.Event] = None) -> None:
-        """Загрузка заметок для выбранной категории."""
-        self.notes_list.delete(0, tk.END)
-        try:
-            category_name = self.category_combo.get()
-            if not category_name:
-                return
-            self.cursor.execute("SELECT id FROM categories WHERE name = ?", (category_name,))
-            result = self.cursor.fetchone()
-            if not result:
-                return
-            category_id = result[0]
-            query = "SELECT id, title FROM notes WHERE category_id = ? ORDER BY updated_at DESC"
-            self.cursor.execute(query, (category_id,))
-            notes = self.cursor.fetchall()
-            for note_id, title in notes:
-                self.notes_list.insert(tk.END, f"{note_id}: {title}")
-            self.clear_editor()
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить заметки: {e}")
-
-    def search_notes(self, *args) -> None:
-        """Поиск заметок по заголовку или содержимому."""
-        self.notes_list.delete(0, tk.END)
-        query = self.search_query.get().lower()
-        if not query:
-            self.load_notes()
-            return
-        try:
-            self.cursor.execute("""
-                SELECT id, title FROM notes
-                WHERE lower(title) LIKE ? OR lower(content) LIKE ?
-                ORDER BY updated_at DESC
-            """, (f"%{query}%", f"%{query}%"))
-            notes = self.cursor.fetchall()
-            for note_id, title in notes:
-                self.notes_list.insert(tk.END, f"{note_id}: {title}")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка базы данных", f"Не удалось выполнить поиск: {e}")
-
-    def load_selected_note(self, event: tk.Event) -> None:
-        """Загрузка выбранной заметки в редактор."""
-        selection = self.notes_list.curselection()
-        if not selection:
-            return
-        note_id = int(self.notes_list.get(selection[0]).split(":")[0])
-        try:
-            self.cursor.execute("SELECT title, content FROM notes WHERE id = ?", (note_id,))
-            title, content = self.cursor.fetchone()
-            self.current_note_id = note_id
-            self.title_entry.delete(0, tk.END)
-            self.title_entry.insert(0, title)
-            self.note_text.delete("1.0", tk.END)
-            self.note_text.insert("1.0", content)
-            # Применение тегов форматирования
-            self.apply_formatting_tags(content)
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить заметку: {e}")
-
-    def apply_formatting_tags(self, content: str) -> None:
-        """Применение тегов форматирования к тексту."""
-        try:
-            # Формат: *текст* для жирного, _текст_ для курсива, ~текст~ для подчеркивания
-            self.note_text.delete("1.0", tk.END)
-            self.note_text.insert("1.0", content)
-            for pattern, tag in [
-                (r"\*(.*?)\*", "bold"),
-                (r"_(.*?)_", "italic"),
-                (r"~(.*?)~", "underline")
-            ]:
-                for match in re.finditer(pattern, content):
-                    start = f"1.0 + {match.start()} chars"
-                    end = f"1.0 + {match.end()} chars"
-                    self.note_text.tag_add(tag, start, end)
-        except tk.TclError as e:
-            messagebox.showwarning("Ошибка форматирования", f"Ошибка при применении форматирования: {e}")
-
-    def new_note(self) -> None:
-        """Создание новой заметки."""
-        self.current_note_id = None
-        self.clear_editor()
-
-    def save_note(self) -> None:
-        """Сохранение текущей заметки."""
-        title = self.title_entry.get().strip()
-        if not title:
-            messagebox.showwarning("Ошибка ввода", "Заголовок не может быть пустым!")
-            return
-        content = self.note_text.get("1.0", tk.END).strip()
-        category_name = self.category_combo.get()
-        timestamp = datetime.now().isoformat()
-
-        try:
-            self.cursor.execute("SELECT id FROM categories WHERE name = ?", (category_name,))
-            result = self.cursor.fetchone()
-            if not result:
-                messagebox.showerror("Ошибка", "Выберите существующую категорию!")
-                return
-            category_id = result[0]
-
-            if self.current_note_id:
-                # Обновление существующей заметки
-                self.cursor.execute("""
-                    UPDATE notes SET title = ?, content = ?, category_id = ?, updated_at = ?
-                    WHERE id = ?
-                """, (title, content, category_id, timestamp, self.current_note_id))
-            else:
-                # Создание новой заметки
-                self.cursor.execute("""
-                    INSERT INTO notes (title, content, category_id, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (title, content, category_id, timestamp, timestamp))
-                self.current_note_id = self.cursor.lastrowid
-            self.conn.commit()
-            self.load_notes()
-            messagebox.showinfo("Успех", "Заметка успешно сохранена!")
-        except sqlite3.Error as e:
-            messagebox.showerror("Ошибка базы данных", f"Не удалось сохранить заметку: {e}")
-
-    def delete_note(self) -> None:
-        """Удаление текущей заметки."""
-        if not self.current_note_id:
-            messagebox.showwarning("Ошибка выбора", "Заметка не выбрана!")
-            return
-        if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить эту заметку?"):
-            try:
-                self.cursor.execute("DELETE FROM notes WHERE id = ?", (self.current_note_id,))
-                self.conn.commit()
-                self.current_note_id = None
-                self.clear_editor()
-                self.load_notes()
-                messagebox.showinfo("Успех", "Заметка успешно удалена!")
-            except sqlite3.Error as e:
-                messagebox.showerror("Ошибка базы данных", f"Не удалось удалить заметку: {e}")
-
-    def export_note(self) -> None:
-        """Экспорт текущей заметки в текстовый файл."""
-        if not self.current_note_id:
-            messagebox.showwarning("Ошибка выбора", "Заметка не выбрана!")
-            return
-        title = self.title_entry.get().strip()
-        content = self.note_text.get("1.0", tk.END).strip()
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".txt",
-            filetypes=[("Текстовые файлы", "*.txt"), ("Все файлы", "*.*")],
-            initialfile=f"{title}.txt"
-        )
-        if file_path:
-            try:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(f"Заголовок: {title}\n\n{content}")
-                messagebox.showinfo("Успех", "Заметка успешно экспортирована!")
-            except IOError as e:
-                messagebox.showerror("Ошибка файла", f"Не удалось экспортировать заметку: {e}")
-
-    def toggle_bold(self) -> None:
-        """Переключение жирного форматирования."""
-        if not self.note_text.tag_ranges("sel"):
-            messagebox.showwarning("Ошибка выбора", "Выделите текст для форматирования!")
-            return
-        try:
-            current_tags = self.note_text.tag_names("sel.first")
-            if "bold" in current_tags:
-                self.note_text.tag_remove("bold", "sel.first", "sel.last")
-            else:
-                self.note_text.tag_add("bold", "sel.first", "sel.last")
-        except tk.TclError as e:
-            messagebox.showerror("Ошибка форматирования", f"Не удалось применить форматирование: {e}")
-
-    def toggle_italic(self) -> None:
-        """Переключение курсивного форматирования."""
-        if not self.note_text.tag_ranges("sel"):
-            messagebox.showwarning("Ошибка выбора", "Выделите текст для форматирования!")
-            return
-        try:
-            current_tags = self.note_text.tag_names("sel.first")
-            if "italic" in current_tags:
-                self.note_text.tag_remove("italic", "sel.first", "sel.last")
-            else:
-                self.note_text.tag_add("italic", "sel.first", "sel.last")
-        except tk.TclError as e:
-            messagebox.showerror("Ошибка форматирования", f"Не удалось применить форматирование: {e}")
-
-    def toggle_underline(self) -> None:
-        """Переключение подчеркивания."""
-        if not self.note_text.tag_ranges("sel"):
-            messagebox.showwarning("Ошибка выбора", "Выделите текст для форматирования!")
-            return
-        try:
-            current_tags = self.note_text.tag_names("sel.first")
-            if "underline" in current_tags:
-                self.note_text.tag_remove("underline", "sel.first", "sel.last")
-            else:
-                self.note_text.tag_add("underline", "sel.first", "sel.last")
-        except tk.TclError as e:
-            messagebox.showerror("Ошибка форматирования", f"Не удалось применить форматирование: {e}")
-
-    def toggle_theme(self) -> None:
-        """Переключение между светлой и темной темами."""
-        self.theme = "dark" if self.theme == "light" else "light"
-        self.apply_theme(self.theme)
-
-    def clear_editor(self) -> None:
-        """Очистка редактора заметок."""
-        self.title_entry.delete(0, tk.END)
-        self.note_text.delete("1.0", tk.END)
-        self.current_note_id = None
-
-    def quit_app(self) -> None:
-        """Выход из приложения."""
-        if messagebox.askyesno("Подтверждение", "Вы хотите выйти?"):
-            try:
-                self.conn.close()
-            except (sqlite3.Error, AttributeError):
-                pass
-            self.root.quit()
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = NotesApp(root)
-    root.mainloop()
\ No newline at end of file
+import time
+
+# Начало запуска для отчета о времени загрузки (до импорта остальных модулей)
+STARTED = time.perf_counter()
+
+import tkinter as tk
+from tkinter import ttk, messagebox, font
+import argparse
+import queue
+import sqlite3
+import os
+import sys
+import threading
+import uuid
+from typing import Any, Callable, Dict, Iterator, Optional, List, Tuple
+
+from autosave import AutoSaver, SaveResult, Snapshot, replay_journal
+from bodies import CHUNK_BYTES
+from bulk import FORMATS, Progress, export_notes, import_notes
+from changes import CHANGE_POLL_MS, ChangeFeed, NoteChange
+from cache import PREFETCH_NEIGHBORS, CachedNote, NoteCache, Prefetcher, make_cached_note
+from formatting import MarkupHighlighter, Span, TagIndices, apply_indices, apply_spans, collect_spans
+from history import HistoryCompactor
+from diagnostics_view import DiagnosticsDialog
+from duplicates import DuplicateNote, find_duplicates, merge_notes
+from duplicates_view import DuplicatesDialog
+from history_view import HistoryDialog
+from instrumentation import SLOW_QUERY_MS, Heartbeat, profiler
+from note_list import NoteListView
+from quickopen import TitleIndex, TitleIndexBuilder
+from quickopen_view import QuickOpenDialog
+from search import SearchEngine
+from startup import StartupTimer
+from store import CategoryStats, NoteStore
+from sync_client import (Conflict, SyncReport, conflict_count, keep_both, keep_local, list_conflicts, server_url,
+                         set_server_url, sync_once, take_remote)
+from sync_view import ConflictsDialog
+
+# Период (мс) проверки фонового этапа запуска
+STARTUP_POLL_MS = 20
+
+# Больше стольких внешних изменений за один опрос список и кэши перечитываются целиком
+FULL_RELOAD_CHANGES = 500
+
+# Обработчики интерфейса и методы хранилища, замеряемые при профилировании
+PROFILED_CALLBACKS = (
+    "load_categories", "update_category_labels", "load_notes", "search_notes", "show_search_results",
+    "load_selected_note", "open_note", "load_note_chunk", "apply_formatting_tags", "save_note", "capture_note",
+    "on_note_saved", "delete_note", "clear_editor",
+)
+PROFILED_STORE_METHODS = (
+    "category_stats", "list_notes", "list_notes_before", "count_notes", "get_note", "get_note_header", "create_note",
+    "update_note", "delete_note", "revisions", "get_revision", "search",
+)
+
+
+def default_db_path() -> str:
+    """Путь к базе: переменная окружения NOTES_DB или notes.db рядом с программой."""
+    return os.environ.get("NOTES_DB") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "notes.db")
+
+
+class NotesApp:
+    def __init__(self, root: tk.Tk, db_path: Optional[str] = None,
+                 startup: Optional[StartupTimer] = None):
+        """Инициализация приложения для заметок.
+
+        Запуск разбит на этапы: сначала строится и отрисовывается окно,
+        затем в фоне проверяются схема базы и журнал автосохранения, и
+        только после этого загружаются категории и список заметок.
+        """
+        self.startup = startup or StartupTimer(STARTED)
+        self.startup.mark("импорт модулей и Tk")
+        self.root = root
+        # При профилировании обработчики подменяются до их передачи в bind и trace
+        profiler.instrument(self, PROFILED_CALLBACKS, "ui.")
+        self.heartbeat = Heartbeat(self.root) if profiler.enabled else None
+        self.root.title("Приложение для заметок")
+        self.root.geometry("1200x800")
+        self.theme = "light"  # Тема по умолчанию: светлая
+        self.current_note_id: Optional[int] = None  # ID текущей заметки
+        self.db_path = db_path or default_db_path()  # Путь к файлу базы данных
+        self.note_loader: Optional[Iterator[str]] = None  # Порции загружаемой заметки
+        self.note_loader_after: Optional[str] = None
+        self.loading_note: Optional[CachedNote] = None  # Загружаемая заметка, если она есть в кэше
+        self.loading_title = ""  # Заголовок и форматирование загружаемой заметки
+        self.loading_spans: List[Span] = []
+        self.current_category_id: Optional[int] = None  # Категория заметки в редакторе
+        self.draft_key = f"draft:{uuid.uuid4().hex}"  # Ключ автосохранения новой заметки
+        self.category_labels: Dict[str, int] = {}  # Подпись в списке категорий -> id категории
+        self.bulk_thread: Optional[threading.Thread] = None  # Фоновые выгрузка или загрузка
+        self.bulk_events: "queue.Queue[tuple]" = queue.Queue()
+        self.search_query = tk.StringVar()  # Переменная для поискового запроса
+        self.search_query.trace("w", self.search_notes)  # Отслеживание изменений в поиске
+        self.search_snippets: Dict[int, str] = {}  # Фрагменты текущих результатов поиска по id заметки
+
+        # Хранилище и зависящие от него фоновые службы создаются после отрисовки окна
+        self.store: Optional[NoteStore] = None
+        self.search_engine: Optional[SearchEngine] = None
+        self.history_compactor: Optional[HistoryCompactor] = None
+        # Индекс заголовков для быстрого перехода наполняется в фоне после открытия базы
+        self.title_index = TitleIndex()
+        self.title_index_builder: Optional[TitleIndexBuilder] = None
+        # Изменения базы другими окнами и процессами
+        self.change_feed: Optional[ChangeFeed] = None
+        self.journal_path = self.db_path + ".autosave"
+        self.startup_result: Tuple[int, Optional[Exception], Optional[Exception]] = (0, None, None)
+
+        # Кэш декодированных заметок и фоновая подгрузка соседей выбранной
+        self.note_cache = NoteCache()
+        self.prefetcher = Prefetcher(lambda: NoteStore(self.db_path), self.note_cache)
+
+        # Автосохранение в фоновом потоке со своим хранилищем
+        self.autosaver = AutoSaver(self.root, lambda: NoteStore(self.db_path), self.journal_path,
+                                   self.capture_note, self.on_note_saved, self.on_autosave_error)
+
+        # Создание главного контейнера
+        self.main_frame = ttk.Frame(self.root)
+        self.main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        # Настройка элементов интерфейса
+        self.setup_menu()
+        self.setup_toolbar()
+        self.setup_statusbar()
+        self.setup_main_layout()
+
+        # Настройка стилей и тем
+        self.style = ttk.Style()
+        self.configure_themes()
+
+        # Привязка горячих клавиш
+        self.bind_hotkeys()
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
+        self.startup.mark("интерфейс")
+
+        # Отрисовка окна выполняется обработчиками простоя, поставленными при
+        # его отображении; следующий этап ставится в очередь после них
+        self.status_var.set("Открытие базы данных...")
+        self.main_frame.bind("<Map>", self.on_first_map)
+
+    def on_first_map(self, event: tk.Event) -> None:
+        """Первое отображение окна: запуск загрузки после отрисовки."""
+        self.main_frame.unbind("<Map>")
+        self.root.after_idle(self.start_database)
+
+    def start_database(self) -> None:
+        """Фоновая подготовка базы после первой отрисовки окна."""
+        self.startup.mark("первая отрисовка")
+        thread = threading.Thread(target=self.prepare_database, name="startup", daemon=True)
+        thread.start()
+        self.root.after(STARTUP_POLL_MS, self.finish_startup, thread)
+
+    def prepare_database(self) -> None:
+        """Миграция схемы, проверка полнотекстового индекса и восстановление
+        правок из журнала автосохранения (выполняется в фоновом потоке)."""
+        try:
+            store = NoteStore(self.db_path)
+        except sqlite3.Error as e:
+            self.startup_result = (0, e, None)
+            return
+        try:
+            self.startup_result = (replay_journal(store, self.journal_path), None, None)
+        except (sqlite3.Error, OSError) as e:
+            self.startup_result = (0, None, e)
+        finally:
+            store.close()
+
+    def finish_startup(self, thread: threading.Thread) -> None:
+        """Открытие хранилища в потоке Tk и загрузка категорий и заметок."""
+        if thread.is_alive():
+            self.root.after(STARTUP_POLL_MS, self.finish_startup, thread)
+            return
+        self.startup.mark("проверка базы")
+        restored, open_error, replay_error = self.startup_result
+        if open_error is None:
+            try:
+                # Схема уже приведена к текущей версии: открытие сводится к проверкам
+                self.store = NoteStore(self.db_path)
+                profiler.instrument(self.store, PROFILED_STORE_METHODS, "store.")
+            except sqlite3.Error as e:
+                open_error = e
+        if open_error is not None:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось инициализировать базу данных: {open_error}")
+            self.root.quit()
+            return
+        if replay_error is not None:
+            messagebox.showerror("Ошибка базы данных",
+                                 f"Не удалось восстановить несохраненные заметки: {replay_error}")
+
+        # Фоновый поиск со своим соединением
+        self.search_engine = SearchEngine(self.root, self.store.open_connection, self.store.fts_enabled,
+                                          self.show_search_results, self.show_search_error)
+        # Уплотнение истории версий в фоне
+        self.history_compactor = HistoryCompactor(self.store.open_connection)
+        self.title_index_builder = TitleIndexBuilder(lambda: NoteStore(self.db_path), self.title_index)
+        # Отметка журнала ставится до загрузки списка: изменения во время загрузки не потеряются
+        try:
+            self.change_feed = ChangeFeed(self.store.conn)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось открыть журнал изменений: {e}")
+        else:
+            self.root.after(CHANGE_POLL_MS, self.poll_changes)
+        self.startup.mark("открытие хранилища")
+
+        self.load_categories()
+        self.startup.mark("категории")
+        self.load_notes()
+        self.startup.mark("список заметок")
+        if restored:
+            self.status_var.set(f"Восстановлено несохраненных заметок: {restored}")
+        else:
+            self.status_var.set("")
+        if self.search_query.get().strip():
+            # Запрос, введенный во время загрузки
+            self.search_notes()
+        self.startup.finish()
+
+    def configure_themes(self) -> None:
+        """Настройка светлой и темной тем."""
+        self.style.configure("TButton", padding=5)
+        self.style.configure("TEntry", padding=5)
+        self.style.configure("TCombobox", padding=5)
+        self.light_theme = {
+            "bg": "#ffffff",
+            "fg": "#000000",
+            "entry_bg": "#f0f0f0",
+            "text_bg": "#ffffff",
+            "text_fg": "#000000",
+            "highlight": "#0078d7"
+        }
+        self.dark_theme = {
+            "bg": "#2d2d2d",
+            "fg": "#ffffff",
+            "entry_bg": "#3c3c3c",
+            "text_bg": "#3c3c3c",
+            "text_fg": "#ffffff",
+            "highlight": "#1e90ff"
+        }
+        self.apply_theme(self.theme)
+
+    def apply_theme(self, theme: str) -> None:
+        """Применение выбранной темы к интерфейсу."""
+        theme_colors = self.light_theme if theme == "light" else self.dark_theme
+        self.root.configure(bg=theme_colors["bg"])
+        self.main_frame.configure(style="TFrame")
+        self.style.configure("TFrame", background=theme_colors["bg"])
+        self.style.configure("TLabel", background=theme_colors["bg"], foreground=theme_colors["fg"])
+        self.style.configure("TButton", background=theme_colors["entry_bg"], foreground=theme_colors["fg"])
+        self.style.configure("TEntry", fieldbackground=theme_colors["entry_bg"], foreground=theme_colors["fg"])
+        self.style.configure("TCombobox", fieldbackground=theme_colors["entry_bg"], foreground=theme_colors["fg"])
+        self.note_text.configure(bg=theme_colors["text_bg"], fg=theme_colors["text_fg"],
+                               insertbackground=theme_colors["fg"])
+        self.notes_list.listbox.configure(bg=theme_colors["text_bg"], fg=theme_colors["text_fg"])
+
+    def setup_menu(self) -> None:
+        """Настройка строки меню."""
+        menubar = tk.Menu(self.root)
+        self.root.config(menu=menubar)
+
+        # Меню "Файл"
+        file_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Файл", menu=file_menu)
+        file_menu.add_command(label="Новая заметка", command=self.new_note, accelerator="Ctrl+N")
+        file_menu.add_command(label="Быстрый переход...", command=self.quick_open, accelerator="Ctrl+P")
+        file_menu.add_command(label="Найти похожие заметки...", command=self.find_duplicate_notes)
+        file_menu.add_command(label="История версий...", command=self.show_history, accelerator="Ctrl+H")
+        file_menu.add_command(label="Экспортировать заметку", command=self.export_note)
+        file_menu.add_command(label="Экспортировать все заметки...", command=self.export_all_notes)
+        file_menu.add_command(label="Экспортировать все заметки в папку Markdown...",
+                              command=lambda: self.export_all_notes(directory=True))
+        file_menu.add_command(label="Импортировать заметки...", command=self.import_all_notes)
+        file_menu.add_command(label="Импортировать заметки из папки Markdown...",
+                              command=lambda: self.import_all_notes(directory=True))
+        file_menu.add_separator()
+        file_menu.add_command(label="Выход", command=self.quit_app)
+
+        # Меню "Правка"
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Правка", menu=edit_menu)
+        edit_menu.add_command(label="Отменить", command=lambda: self.note_text.event_generate("<<Undo>>"),
+                            accelerator="Ctrl+Z")
+        edit_menu.add_command(label="Повторить", command=lambda: self.note_text.event_generate("<<Redo>>"),
+                            accelerator="Ctrl+Y")
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Вырезать", command=lambda: self.note_text.event_generate("<<Cut>>"),
+                            accelerator="Ctrl+X")
+        edit_menu.add_command(label="Копировать", command=lambda: self.note_text.event_generate("<<Copy>>"),
+                            accelerator="Ctrl+C")
+        edit_menu.add_command(label="Вставить", command=lambda: self.note_text.event_generate("<<Paste>>"),
+                            accelerator="Ctrl+V")
+
+        # Меню "Вид"
+        view_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Вид", menu=view_menu)
+        view_menu.add_command(label="Переключить тему", command=self.toggle_theme)
+        view_menu.add_command(label="Диагностика...", command=self.show_diagnostics)
+
+        # Меню "Синхронизация"
+        sync_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Синхронизация", menu=sync_menu)
+        sync_menu.add_command(label="Синхронизировать", command=self.sync_now, accelerator="F5")
+        sync_menu.add_command(label="Конфликты...", command=self.show_conflicts)
+        sync_menu.add_command(label="Адрес сервера...", command=self.ask_server_url)
+
+    def setup_toolbar(self) -> None:
+        """Настройка панели инструментов с кнопками и поиском."""
+        toolbar = ttk.Frame(self.main_frame)
+        toolbar.pack(fill="x", pady=5)
+
+        # Кнопка "Новая заметка"
+        new_btn = ttk.Button(toolbar, text="Новая заметка", command=self.new_note)
+        new_btn.pack(side="left", padx=5)
+
+        # Кнопка "Сохранить заметку"
+        save_btn = ttk.Button(toolbar, text="Сохранить заметку", command=self.save_note)
+        save_btn.pack(side="left", padx=5)
+
+        # Кнопка "Удалить заметку"
+        delete_btn = ttk.Button(toolbar, text="Удалить заметку", command=self.delete_note)
+        delete_btn.pack(side="left", padx=5)
+
+        # Кнопки форматирования
+        bold_btn = ttk.Button(toolbar, text="Ж", command=self.toggle_bold, style="TButton")
+        bold_btn.pack(side="left", padx=5)
+        italic_btn = ttk.Button(toolbar, text="К", command=self.toggle_italic, style="TButton")
+        italic_btn.pack(side="left", padx=5)
+        underline_btn = ttk.Button(toolbar, text="П", command=self.toggle_underline, style="TButton")
+        underline_btn.pack(side="left", padx=5)
+
+        # Поле поиска
+        self.search_entry = ttk.Entry(toolbar, textvariable=self.search_query)
+        self.search_entry.pack(side="right", padx=5, fill="x", expand=True)
+        ttk.Label(toolbar, text="Поиск:").pack(side="right", padx=5)
+
+    def setup_statusbar(self) -> None:
+        """Настройка строки состояния (итоги автосохранения)."""
+        self.status_var = tk.StringVar()
+        ttk.Label(self.main_frame, textvariable=self.status_var, anchor="w").pack(side="bottom", fill="x")
+
+    def setup_main_layout(self) -> None:
+        """Настройка основного макета с списком заметок, категориями и редактором."""
+        paned = ttk.PanedWindow(self.main_frame, orient="horizontal")
+        paned.pack(fill="both", expand=True)
+
+        # Левая панель (категории и список заметок)
+        left_frame = ttk.Frame(paned)
+        paned.add(left_frame, weight=1)
+
+        # Категории
+        ttk.Label(left_frame, text="Категория:").pack(anchor="w", padx=5, pady=2)
+        self.category_combo = ttk.Combobox(left_frame, state="readonly")
+        self.category_combo.pack(fill="x", padx=5, pady=2)
+        self.category_combo.bind("<<ComboboxSelected>>", self.load_notes)
+
+        # Список заметок
+        ttk.Label(left_frame, text="Заметки:").pack(anchor="w", padx=5, pady=2)
+        self.notes_list = NoteListView(left_frame)
+        self.notes_list.frame.pack(fill="both", expand=True, padx=5, pady=5)
+        self.notes_list.listbox.bind("<<ListboxSelect>>", self.load_selected_note)
+
+        # Правая панель (редактор заметок)
+        right_frame = ttk.Frame(paned)
+        paned.add(right_frame, weight=3)
+
+        # Поле для заголовка
+        ttk.Label(right_frame, text="Заголовок:").pack(anchor="w", padx=5, pady=2)
+        self.title_var = tk.StringVar()
+        self.title_var.trace("w", lambda *args: self.autosaver.mark_dirty())
+        self.title_entry = ttk.Entry(right_frame, textvariable=self.title_var)
+        self.title_entry.pack(fill="x", padx=5, pady=2)
+
+        # Текстовое поле для заметки
+        self.note_text = tk.Text(right_frame, height=20, wrap="word", undo=True)
+        self.note_text.pack(fill="both", expand=True, padx=5, pady=5)
+        self.note_text.bind("<<Modified>>", self.on_text_modified)
+
+        # Настройка тегов форматирования
+        self.note_text.tag_configure("bold", font=("TkDefaultFont", 10, "bold"))
+        self.note_text.tag_configure("italic", font=("TkDefaultFont", 10, "italic"))
+        self.note_text.tag_configure("underline", font=("TkDefaultFont", 10, "underline"))
+        self.note_text.tag_configure("markup_bold", font=("TkDefaultFont", 10, "bold"))
+        self.note_text.tag_configure("markup_italic", font=("TkDefaultFont", 10, "italic"))
+        self.note_text.tag_configure("markup_underline", font=("TkDefaultFont", 10, "underline"))
+        # Подсветка разметки *жирный*, _курсив_, ~подчеркнутый~ только в изменённых строках
+        self.markup_highlighter = MarkupHighlighter(self.note_text)
+        profiler.instrument(self.markup_highlighter, ("refresh",), "ui.markup_")
+
+    def bind_hotkeys(self) -> None:
+        """Приспользование горячих клавиш для быстрых действий."""
+        self.root.bind("<Control-n>", lambda event: self.new_note())
+        self.root.bind("<Control-s>", lambda event: self.save_note())
+        self.root.bind("<Control-d>", lambda event: self.delete_note())
+        self.root.bind("<Control-t>", lambda event: self.toggle_theme())
+        self.note_text.bind("<Control-b>", lambda event: self.toggle_bold())
+        self.note_text.bind("<Control-i>", lambda event: self.toggle_italic())
+        self.note_text.bind("<Control-u>", lambda event: self.toggle_underline())
+        self.root.bind("<Control-e>", lambda event: self.export_note())
+        self.root.bind("<Control-h>", lambda event: self.show_history())
+        self.root.bind("<Control-p>", lambda event: self.quick_open())
+        self.root.bind("<F5>", lambda event: self.sync_now())
+
+    def load_categories(self) -> None:
+        """Загрузка категорий из базы данных в выпадающий список."""
+        try:
+            self.update_category_labels()
+            labels = list(self.category_labels)
+            if labels:
+                self.category_combo.set(labels[0])
+            else:
+                self.category_combo.set("Общее")
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить категории: {e}")
+
+    def update_category_labels(self) -> None:
+        """Подписи категорий с числом заметок (из category_stats) с сохранением выбора."""
+        selected = self.selected_category_id()
+        stats = self.store.category_stats()
+        self.category_labels = {}
+        for name in self.store.categories():
+            category_id = self.store.category_id(name)
+            count = stats.get(category_id, CategoryStats()).note_count
+            self.category_labels[f"{name} ({count})"] = category_id
+        self.category_combo["values"] = list(self.category_labels)
+        for label, category_id in self.category_labels.items():
+            if category_id == selected:
+                self.category_combo.set(label)
+
+    def selected_category_id(self) -> Optional[int]:
+        """ID категории, выбранной в выпадающем списке, или None."""
+        return self.category_labels.get(self.category_combo.get())
+
+    def load_notes(self, event: Optional[tk.Event] = None) -> None:
+        """Загрузка заметок для выбранной категории (постранично)."""
+        self.autosaver.flush()
+        self.notes_list.clear()
+        try:
+            category_id = self.selected_category_id()
+            if category_id is None:
+                return
+            self.notes_list.set_source(
+                lambda key, limit, backward: self.fetch_notes_page(category_id, key, limit, backward))
+            self.clear_editor()
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить заметки: {e}")
+
+    def fetch_notes_page(self, category_id: int, key: Optional[tuple], limit: int,
+                         backward: bool = False) -> List[Tuple[int, str, tuple]]:
+        """Страница заметок категории для списка: (id, подпись, ключ пагинации)
+        после ключа или, при backward, перед ним."""
+        rows = (self.store.list_notes_before(category_id, key, limit) if backward
+                else self.store.list_notes(category_id, key, limit))
+        return [(note_id, title, (updated_at, note_id)) for note_id, title, updated_at in rows]
+
+    def search_notes(self, *args) -> None:
+        """Поиск заметок по заголовку или содержимому (с задержкой, в фоне)."""
+        if self.search_engine is None:
+            return  # База еще открывается; запрос будет выполнен по её готовности
+        query = self.search_query.get().strip()
+        if not query:
+            self.search_engine.cancel()
+            self.load_notes()
+            return
+        self.search_engine.submit(query)
+
+    def show_search_results(self, results: List[Tuple[int, str, Optional[str]]]) -> None:
+        """Отображение результатов поиска в списке заметок."""
+        self.search_snippets = {note_id: " ".join(snippet.split()) for note_id, _, snippet in results if snippet}
+        self.notes_list.set_rows([(note_id, self.search_label(note_id, title)) for note_id, title, _ in results])
+
+    def search_label(self, note_id: int, title: str) -> str:
+        """Подпись результата поиска: заголовок и фрагмент с совпадением, если он есть."""
+        snippet = self.search_snippets.get(note_id)
+        return f"{title} — {snippet}" if snippet else title
+
+    def show_search_error(self, error: sqlite3.Error) -> None:
+        """Сообщение об ошибке фонового поиска."""
+        messagebox.showerror("Ошибка базы данных", f"Не удалось выполнить поиск: {error}")
+
+    def load_selected_note(self, event: tk.Event) -> None:
+        """Загрузка выбранной в списке заметки в редактор."""
+        note_id = self.notes_list.selected_note_id()
+        if note_id is not None:
+            self.open_note(note_id)
+
+    def open_note(self, note_id: int) -> None:
+        """Загрузка заметки в редактор.
+
+        Заметка берется из кэша, а при промахе читается из базы. Тело
+        вставляется порциями через root.after: первая порция видна
+        сразу, остальные догружаются, не блокируя интерфейс. До окончания
+        загрузки редактор доступен только для чтения. Соседние заметки
+        списка заранее подгружаются в кэш.
+        """
+        if note_id == self.current_note_id:
+            return
+        self.autosaver.flush()
+        # Заметка могла быть только что отправлена на запись: читаем уже записанную версию
+        self.autosaver.wait()
+        cached = self.note_cache.get(note_id)
+        try:
+            if cached is None:
+                header = self.store.get_note_header(note_id)
+                if header is None:
+                    return
+                title, category_id, spans = header
+                loader = self.store.iter_content(note_id)
+            else:
+                title, content, category_id, spans, _ = cached
+                loader = (content[start:start + CHUNK_BYTES] for start in range(0, len(content), CHUNK_BYTES))
+            self.cancel_note_loading()
+            self.current_note_id = note_id
+            self.current_category_id = category_id
+            self.title_entry.delete(0, tk.END)
+            self.title_entry.insert(0, title)
+            self.note_text.delete("1.0", tk.END)
+            self.note_loader = loader
+            self.loading_note = cached
+            self.loading_title = title
+            self.loading_spans = spans
+            self.note_text.configure(state="disabled")
+            self.autosaver.reset()
+            self.load_note_chunk()
+            self.prefetcher.request(self.notes_list.neighbor_ids(note_id, PREFETCH_NEIGHBORS))
+        except sqlite3.Error as e:
+            self.cancel_note_loading()
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить заметку: {e}")
+
+    def load_note_chunk(self) -> None:
+        """Вставка очередной порции загружаемой заметки."""
+        self.note_loader_after = None
+        try:
+            chunk = next(self.note_loader, None)
+        except sqlite3.Error as e:
+            self.cancel_note_loading()
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить заметку: {e}")
+            return
+        self.note_text.configure(state="normal")
+        if chunk is None:
+            self.note_loader = None
+            cached = self.loading_note
+            if cached is None:
+                cached = make_cached_note(self.loading_title, self.note_text.get("1.0", "end-1c"),
+                                          self.current_category_id, self.loading_spans)
+                self.note_cache.put(self.current_note_id, cached)
+            # Применение сохраненного форматирования
+            self.apply_formatting_tags(cached.indices)
+            self.note_text.edit_reset()
+            self.note_text.edit_modified(False)
+            self.autosaver.reset()
+            return
+        self.note_text.insert(tk.END, chunk)
+        self.note_text.configure(state="disabled")
+        self.note_loader_after = self.root.after(1, self.load_note_chunk)
+
+    def cancel_note_loading(self) -> None:
+        """Прерывание незавершенной загрузки заметки."""
+        if self.note_loader_after is not None:
+            self.root.after_cancel(self.note_loader_after)
+            self.note_loader_after = None
+        if self.note_loader is not None:
+            self.note_loader.close()
+            self.note_loader = None
+        self.note_text.configure(state="normal")
+
+    def apply_formatting_tags(self, indices: TagIndices) -> None:
+        """Применение сохраненного форматирования (индексы Tk по тегам)."""
+        try:
+            apply_indices(self.note_text, indices)
+        except tk.TclError as e:
+            messagebox.showwarning("Ошибка форматирования", f"Ошибка при применении форматирования: {e}")
+
+    def new_note(self) -> None:
+        """Создание новой заметки."""
+        self.autosaver.flush()
+        self.clear_editor()
+
+    def save_note(self) -> None:
+        """Немедленное сохранение текущей заметки (без ожидания автосохранения)."""
+        if self.note_loader is not None:
+            messagebox.showwarning("Заметка загружается", "Дождитесь окончания загрузки заметки!")
+            return
+        if not self.title_entry.get().strip():
+            messagebox.showwarning("Ошибка ввода", "Заголовок не может быть пустым!")
+            return
+        if self.current_category_id is None:
+            messagebox.showerror("Ошибка", "Выберите существующую категорию!")
+            return
+        self.autosaver.flush(force=True)
+
+    def capture_note(self) -> Optional[Snapshot]:
+        """Снимок редактора для автосохранения или None, если сохранять нечего."""
+        if self.note_loader is not None or self.current_category_id is None:
+            return None
+        title = self.title_entry.get().strip()
+        if not title:
+            return None
+        text = self.note_text.get("1.0", "end-1c")
+        content = text.strip()
+        # Смещения форматирования пересчитываются относительно обрезанного текста
+        lead = len(text) - len(text.lstrip())
+        spans = collect_spans(self.note_text, text, lead, lead + len(content))
+        key = f"note:{self.current_note_id}" if self.current_note_id else self.draft_key
+        if self.current_note_id:
+            # Кэш сразу получает новую версию: запись в базу выполняется в фоне
+            self.note_cache.invalidate(self.current_note_id)
+            self.note_cache.put(self.current_note_id,
+                                make_cached_note(title, content, self.current_category_id, spans))
+        return Snapshot(key, self.current_note_id, title, content, spans, self.current_category_id)
+
+    def on_note_saved(self, result: SaveResult) -> None:
+        """Обновление интерфейса после фоновой записи заметки."""
+        if result.key == self.draft_key and self.current_note_id is None:
+            self.current_note_id = result.note_id
+        self.search_engine.invalidate_results()
+        self.title_index.put(result.note_id, result.title, result.category_id)
+        self.update_note_row(result.note_id, result.title, result.category_id)
+        self.update_category_labels()
+        self.status_var.set(f"Сохранено: {result.title}")
+
+    def on_autosave_error(self, error: Exception) -> None:
+        """Сообщение об ошибке фоновой записи (запись будет повторена)."""
+        self.status_var.set(f"Не удалось сохранить заметку, повтор через несколько секунд: {error}")
+
+    def update_note_row(self, note_id: int, title: str, category_id: int) -> None:
+        """Обновление строки сохраненной заметки без перезагрузки списка."""
+        if self.search_query.get().strip():
+            self.notes_list.update_label(note_id, self.search_label(note_id, title))
+        elif category_id == self.selected_category_id():
+            # Список отсортирован по времени изменения: заметка поднимается наверх
+            self.notes_list.move_to_top(note_id, title)
+        else:
+            self.notes_list.remove(note_id)
+
+    def on_text_modified(self, event: tk.Event) -> None:
+        """Отметка изменения текста для автосохранения."""
+        if not self.note_text.edit_modified():
+            return
+        self.note_text.edit_modified(False)
+        if self.note_loader is None:
+            self.autosaver.mark_dirty()
+
+    def delete_note(self) -> None:
+        """Удаление текущей заметки."""
+        if not self.current_note_id:
+            messagebox.showwarning("Ошибка выбора", "Заметка не выбрана!")
+            return
+        if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить эту заметку?"):
+            try:
+                self.store.delete_note(self.current_note_id)
+                self.forget_deleted_notes([self.current_note_id])
+                messagebox.showinfo("Успех", "Заметка успешно удалена!")
+            except sqlite3.Error as e:
+                messagebox.showerror("Ошибка базы данных", f"Не удалось удалить заметку: {e}")
+
+    def forget_deleted_notes(self, note_ids: List[int]) -> None:
+        """Удаление заметок из кэша, индексов и списка после удаления из базы."""
+        for note_id in note_ids:
+            self.note_cache.invalidate(note_id)
+            self.title_index.remove(note_id)
+            self.notes_list.remove(note_id)
+        self.search_engine.invalidate_results()
+        self.update_category_labels()
+        if self.current_note_id in note_ids:
+            self.clear_editor()
+
+    def export_note(self) -> None:
+        """Экспорт текущей заметки в текстовый файл."""
+        if not self.current_note_id:
+            messagebox.showwarning("Ошибка выбора", "Заметка не выбрана!")
+            return
+        if self.note_loader is not None:
+            messagebox.showwarning("Заметка загружается", "Дождитесь окончания загрузки заметки!")
+            return
+        title = self.title_entry.get().strip()
+        content = self.note_text.get("1.0", tk.END).strip()
+        from tkinter import filedialog  # Модуль диалогов загружается при первом обращении
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            filetypes=[("Текстовые файлы", "*.txt"), ("Все файлы", "*.*")],
+            initialfile=f"{title}.txt"
+        )
+        if file_path:
+            try:
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(f"Заголовок: {title}\n\n{content}")
+                messagebox.showinfo("Успех", "Заметка успешно экспортирована!")
+            except IOError as e:
+                messagebox.showerror("Ошибка файла", f"Не удалось экспортировать заметку: {e}")
+
+    def quick_open(self) -> None:
+        """Окно быстрого перехода к заметке по заголовку (Ctrl+P)."""
+        if self.store is None:
+            return
+        try:
+            names = self.category_names()
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить категории: {e}")
+            return
+        QuickOpenDialog(self.root, self.title_index, names, self.jump_to_note)
+
+    def category_names(self) -> Dict[int, str]:
+        """Имена категорий по id."""
+        return {self.store.category_id(name): name for name in self.store.categories()}
+
+    def jump_to_note(self, note_id: int, category_id: int) -> None:
+        """Переход к заметке: выбор её категории (если не идет поиск), строки списка и загрузка."""
+        if not self.search_query.get().strip() and category_id != self.selected_category_id():
+            for label, label_category_id in self.category_labels.items():
+                if label_category_id == category_id:
+                    self.category_combo.set(label)
+                    self.load_notes()
+                    break
+        index = self.notes_list.index_of(note_id)
+        if index is not None:
+            self.notes_list.listbox.selection_clear(0, tk.END)
+            self.notes_list.listbox.selection_set(index)
+            self.notes_list.listbox.see(index)
+        self.open_note(note_id)
+
+    def find_duplicate_notes(self) -> None:
+        """Поиск групп похожих заметок (в фоне, с пулом процессов)."""
+        if self.store is None:
+            return
+        # Сигнатуры считаются по записанным версиям заметок
+        self.autosaver.flush()
+        self.autosaver.wait()
+        self.run_bulk_job("Проверка на похожие", lambda store, progress: find_duplicates(store, progress=progress),
+                          self.show_duplicates)
+
+    def show_duplicates(self, clusters: List[List[DuplicateNote]]) -> None:
+        """Окно найденных групп похожих заметок."""
+        if not clusters:
+            messagebox.showinfo("Похожие заметки", "Похожих заметок не найдено")
+            return
+        try:
+            names = self.category_names()
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить категории: {e}")
+            return
+        DuplicatesDialog(self.root, clusters, names, self.jump_to_note, self.merge_duplicates,
+                         self.delete_duplicates)
+
+    def merge_duplicates(self, keep_id: int, other_ids: List[int]) -> bool:
+        """Объединение похожих заметок в keep_id с удалением остальных."""
+        self.autosaver.flush()
+        self.autosaver.wait()
+        try:
+            if not merge_notes(self.store, keep_id, other_ids):
+                messagebox.showwarning("Ошибка", "Заметка уже удалена!")
+                return False
+            header = self.store.get_note_header(keep_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось объединить заметки: {e}")
+            return False
+        self.note_cache.invalidate(keep_id)
+        self.forget_deleted_notes(other_ids)
+        if header is not None:
+            title, category_id, _ = header
+            self.update_note_row(keep_id, title, category_id)
+        if self.current_note_id == keep_id:
+            # В редакторе устаревшая версия объединенной заметки
+            self.clear_editor()
+            self.open_note(keep_id)
+        return True
+
+    def delete_duplicates(self, note_ids: List[int]) -> bool:
+        """Удаление похожих заметок одной транзакцией."""
+        self.autosaver.flush()
+        self.autosaver.wait()
+        try:
+            self.store.bulk_delete(note_ids)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось удалить заметки: {e}")
+            return False
+        self.forget_deleted_notes(note_ids)
+        return True
+
+    def show_history(self) -> None:
+        """Окно истории версий текущей заметки."""
+        if not self.current_note_id:
+            messagebox.showwarning("Ошибка выбора", "Заметка не выбрана!")
+            return
+        # Последние правки должны попасть в историю до её открытия
+        self.autosaver.flush()
+        self.autosaver.wait()
+        HistoryDialog(self.root, self.store, self.current_note_id, self.title_entry.get().strip(),
+                      self.restore_revision)
+
+    def restore_revision(self, title: str, content: str, spans: List[Span]) -> None:
+        """Загрузка версии из истории в редактор с сохранением её как новой версии."""
+        self.cancel_note_loading()
+        self.title_entry.delete(0, tk.END)
+        self.title_entry.insert(0, title)
+        self.note_text.delete("1.0", tk.END)
+        self.note_text.insert("1.0", content)
+        try:
+            apply_spans(self.note_text, spans, content)
+        except tk.TclError as e:
+            messagebox.showwarning("Ошибка форматирования", f"Ошибка при применении форматирования: {e}")
+        self.autosaver.flush(force=True)
+
+    def show_diagnostics(self) -> None:
+        """Окно диагностики (данные собираются только при запуске с --profile)."""
+        if not profiler.enabled:
+            messagebox.showinfo("Диагностика", "Профилирование выключено. Запустите приложение с параметром "
+                                               "--profile или с переменной окружения NOTES_PROFILE=1.")
+            return
+        DiagnosticsDialog(self.root, profiler)
+
+    def ask_server_url(self) -> Optional[str]:
+        """Запрос и сохранение адреса сервера синхронизации; None при отмене."""
+        if self.store is None:
+            return None
+        from tkinter import simpledialog
+        try:
+            current = server_url(self.store)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось прочитать настройки синхронизации: {e}")
+            return None
+        url = simpledialog.askstring("Сервер синхронизации", "Адрес сервера (например, http://127.0.0.1:8765):",
+                                     initialvalue=current or "", parent=self.root)
+        if not url or not url.strip():
+            return None
+        try:
+            set_server_url(self.store, url.strip())
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось сохранить адрес сервера: {e}")
+            return None
+        return url.strip()
+
+    def sync_now(self) -> None:
+        """Синхронизация с сервером в фоне (F5).
+
+        Несохраненные правки сначала записываются: так они попадают в
+        журнал отправки и сравниваются с полученными версиями. Полученные
+        заметки применяются к интерфейсу через журнал изменений базы.
+        """
+        if self.store is None:
+            return
+        try:
+            url = server_url(self.store)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось прочитать настройки синхронизации: {e}")
+            return
+        url = url or self.ask_server_url()
+        if url is None:
+            return
+        self.autosaver.flush()
+        self.autosaver.wait()
+        self.run_bulk_job("Синхронизация", lambda store, progress: sync_once(store, url, progress),
+                          self.show_sync_report)
+
+    def show_sync_report(self, report: SyncReport) -> None:
+        """Итог синхронизации в строке состояния и предложение разрешить конфликты."""
+        self.status_var.set(f"Синхронизация: получено {report.pulled}, отправлено {report.pushed}")
+        try:
+            conflicts = conflict_count(self.store)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось прочитать конфликты: {e}")
+            return
+        if conflicts and messagebox.askyesno("Конфликты синхронизации",
+                                             f"Заметок, измененных и здесь, и на другом компьютере: {conflicts}. "
+                                             f"Они не отправляются, пока не выбрана версия. Открыть список?"):
+            self.show_conflicts()
+
+    def show_conflicts(self) -> None:
+        """Окно конфликтов синхронизации."""
+        if self.store is None:
+            return
+        try:
+            conflicts = list_conflicts(self.store)
+        except (sqlite3.Error, ValueError) as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось прочитать конфликты: {e}")
+            return
+        if not conflicts:
+            messagebox.showinfo("Конфликты синхронизации", "Конфликтов нет")
+            return
+        ConflictsDialog(self.root, self.store, conflicts, self.keep_local_version, self.take_remote_version,
+                        self.keep_both_versions)
+
+    def resolve_conflict(self, conflict: Conflict, resolve: Callable[[NoteStore, str], Optional[int]],
+                         open_in_editor: bool = False) -> bool:
+        """Разрешение конфликта и обновление списка, кэша и редактора по результату."""
+        self.autosaver.flush()
+        self.autosaver.wait()
+        try:
+            note_id = resolve(self.store, conflict.uid)
+            header = None if note_id is None else self.store.get_note_header(note_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось разрешить конфликт: {e}")
+            return False
+        # Запись шла через соединение этого окна, и журнал изменений её не покажет
+        if header is None:
+            if conflict.note_id is not None:
+                self.forget_deleted_notes([conflict.note_id])
+            return True
+        title, category_id, _ = header
+        self.note_cache.invalidate(note_id)
+        self.title_index.put(note_id, title, category_id)
+        self.update_note_row(note_id, title, category_id)
+        self.update_category_labels()
+        self.search_engine.invalidate_results()
+        if self.current_note_id == note_id:
+            self.clear_editor()
+            self.open_note(note_id)
+        elif open_in_editor:
+            self.jump_to_note(note_id, category_id)
+        return True
+
+    def keep_local_version(self, conflict: Conflict) -> bool:
+        """Конфликт: остается версия этого компьютера."""
+        return self.resolve_conflict(conflict, keep_local)
+
+    def take_remote_version(self, conflict: Conflict) -> bool:
+        """Конфликт: берется версия с другого компьютера."""
+        return self.resolve_conflict(conflict, take_remote)
+
+    def keep_both_versions(self, conflict: Conflict) -> bool:
+        """Конфликт: обе версии с разметкой открываются в редакторе для ручного объединения."""
+        return self.resolve_conflict(conflict, keep_both, open_in_editor=True)
+
+    def export_all_notes(self, directory: bool = False) -> None:
+        """Выгрузка всех заметок в JSONL, zip-архив или папку Markdown (в фоне)."""
+        from tkinter import filedialog
+        if directory:
+            path = filedialog.askdirectory(title="Папка для выгрузки", mustexist=False)
+        else:
+            path = filedialog.asksaveasfilename(
+                defaultextension=".jsonl",
+                filetypes=[("JSON Lines", "*.jsonl"), ("Zip-архив Markdown", "*.zip")],
+                initialfile="notes.jsonl"
+            )
+        if not path:
+            return
+        # Несохраненные правки должны попасть в выгрузку
+        self.autosaver.flush()
+        self.autosaver.wait()
+        fmt = "markdown" if directory else None
+        self.run_bulk_job("Выгрузка", lambda store, progress: export_notes(store, path, fmt, progress=progress))
+
+    def import_all_notes(self, directory: bool = False) -> None:
+        """Загрузка заметок из JSONL, zip-архива или папки Markdown (в фоне)."""
+        from tkinter import filedialog
+        if directory:
+            path = filedialog.askdirectory(title="Папка с заметками Markdown", mustexist=True)
+        else:
+            path = filedialog.askopenfilename(
+                filetypes=[("JSON Lines", "*.jsonl"), ("Zip-архив Markdown", "*.zip"), ("Все файлы", "*.*")]
+            )
+        if not path:
+            return
+        fmt = "markdown" if directory else None
+        self.run_bulk_job("Загрузка", lambda store, progress: import_notes(store, path, fmt, progress=progress))
+
+    def run_bulk_job(self, action: str, job: Callable[[NoteStore, Progress], Any],
+                     on_done: Optional[Callable[[Any], None]] = None) -> None:
+        """Запуск выгрузки, загрузки или поиска похожих в фоновом потоке со своим хранилищем.
+
+        on_done получает результат job; без него показывается число
+        обработанных заметок.
+        """
+        if self.bulk_thread is not None:
+            messagebox.showwarning("Операция выполняется", "Дождитесь окончания текущей выгрузки или загрузки!")
+            return
+
+        def work() -> None:
+            try:
+                store = NoteStore(self.db_path)
+                try:
+                    result = job(store, lambda done, elapsed: self.bulk_events.put(("progress", done, elapsed)))
+                finally:
+                    store.close()
+                self.bulk_events.put(("done", result, None))
+            except Exception as e:
+                # Любая ошибка (в том числе пула процессов или распаковки) должна
+                # завершить задачу, иначе bulk_thread не освободится
+                self.bulk_events.put(("error", 0, e))
+
+        self.bulk_thread = threading.Thread(target=work, name="bulk-job", daemon=True)
+        self.bulk_thread.start()
+        self.status_var.set(f"{action}...")
+        self.root.after(100, self.poll_bulk_job, action, on_done)
+
+    def poll_bulk_job(self, action: str, on_done: Optional[Callable[[Any], None]] = None) -> None:
+        """Отображение прогресса фоновой выгрузки или загрузки."""
+        while True:
+            try:
+                kind, done, detail = self.bulk_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                rate = done / detail if detail else 0.0
+                self.status_var.set(f"{action}: {done} заметок ({rate:.0f} заметок/с)")
+                continue
+            self.bulk_thread = None
+            if kind == "error":
+                self.status_var.set("")
+                messagebox.showerror("Ошибка", f"{action} не выполнена: {detail}")
+                return
+            if on_done is not None:
+                self.status_var.set("")
+                on_done(done)
+                return
+            # До окончания запуска категории и список загрузятся сами
+            if action == "Загрузка" and self.store is not None:
+                self.search_engine.invalidate_results()
+                # Загруженные заметки попадают в индекс заголовков при его перестроении
+                self.rebuild_title_index()
+                self.load_categories()
+                self.load_notes()
+            messagebox.showinfo("Успех", f"{action} завершена: {done} заметок")
+            return
+        self.root.after(100, self.poll_bulk_job, action, on_done)
+
+    def rebuild_title_index(self) -> None:
+        """Перестроение индекса заголовков в фоне."""
+        self.title_index_builder.close()
+        self.title_index = TitleIndex()
+        self.title_index_builder = TitleIndexBuilder(lambda: NoteStore(self.db_path), self.title_index)
+
+    def poll_changes(self) -> None:
+        """Применение изменений базы, сделанных другими окнами, скриптами и фоновыми потоками."""
+        try:
+            changes = self.change_feed.poll()
+            if self.change_feed.trim_due:
+                with self.store.transaction():
+                    self.change_feed.trim()
+            if changes is None or len(changes) > FULL_RELOAD_CHANGES:
+                self.reload_changed_data()
+            elif changes:
+                self.apply_changes(changes)
+        except sqlite3.Error as e:
+            self.status_var.set(f"Не удалось прочитать изменения базы: {e}")
+        self.root.after(CHANGE_POLL_MS, self.poll_changes)
+
+    def apply_changes(self, changes: List[NoteChange]) -> None:
+        """Обновление списка, кэша и индекса заголовков только по изменившимся заметкам.
+
+        Свои сохранения (через поток автосохранения) тоже приходят сюда;
+        повторное применение ничего не меняет.
+        """
+        known = set(self.category_labels.values())
+        for change in changes:
+            if change.deleted:
+                self.note_cache.invalidate(change.note_id)
+                self.title_index.remove(change.note_id)
+                self.notes_list.remove(change.note_id)
+                if change.note_id == self.current_note_id:
+                    self.clear_editor()
+                    self.status_var.set("Заметка удалена в другом окне")
+                continue
+            if change.category_id not in known:
+                self.store.reload_categories()
+                known.add(change.category_id)
+            self.title_index.put(change.note_id, change.title, change.category_id)
+            if change.note_id == self.current_note_id:
+                self.refresh_current_note()
+            else:
+                self.note_cache.invalidate(change.note_id)
+            self.update_note_row(change.note_id, change.title, change.category_id)
+        self.search_engine.invalidate_results()
+        self.update_category_labels()
+
+    def refresh_current_note(self) -> None:
+        """Перезагрузка открытой заметки, если её изменило другое окно.
+
+        Пока в редакторе есть несохраненные правки, заметка не
+        перезагружается: при сохранении правки заменят чужую версию, а та
+        останется в истории. Без правок редактор совпадает с последней
+        записанной этим окном версией, так что совпадение с базой означает
+        свое сохранение.
+        """
+        if not self.autosaver.idle or self.note_loader is not None:
+            return
+        note_id = self.current_note_id
+        note = self.store.get_note(note_id)
+        if note is None:
+            return
+        title, content, category_id, _ = note
+        if (title, content, category_id) == (self.title_entry.get().strip(),
+                                             self.note_text.get("1.0", "end-1c").strip(), self.current_category_id):
+            return
+        self.note_cache.invalidate(note_id)
+        self.clear_editor()
+        self.open_note(note_id)
+        self.status_var.set("Заметка обновлена: её изменили в другом окне")
+
+    def reload_changed_data(self) -> None:
+        """Перечитывание категорий, списка и кэшей после множества внешних изменений
+        (или если журнал изменений очищен дальше отметки этого окна)."""
+        self.store.reload_categories()
+        self.note_cache.clear()
+        self.rebuild_title_index()
+        self.update_category_labels()
+        self.search_engine.invalidate_results()
+        if self.search_query.get().strip():
+            self.search_notes()
+        else:
+            category_id = self.selected_category_id()
+            if category_id is not None:
+                self.notes_list.set_source(
+                    lambda key, limit, backward: self.fetch_notes_page(category_id, key, limit, backward))
+        if self.current_note_id is not None:
+            index = self.notes_list.index_of(self.current_note_id)
+            if index is not None:
+                self.notes_list.listbox.selection_set(index)
+            self.refresh_current_note()
+
+    def toggle_bold(self) -> None:
+        """Переключение жирного форматирования."""
+        if not self.note_text.tag_ranges("sel"):
+            messagebox.showwarning("Ошибка выбора", "Выделите текст для форматирования!")
+            return
+        try:
+            current_tags = self.note_text.tag_names("sel.first")
+            if "bold" in current_tags:
+                self.note_text.tag_remove("bold", "sel.first", "sel.last")
+            else:
+                self.note_text.tag_add("bold", "sel.first", "sel.last")
+            self.autosaver.mark_dirty()
+        except tk.TclError as e:
+            messagebox.showerror("Ошибка форматирования", f"Не удалось применить форматирование: {e}")
+
+    def toggle_italic(self) -> None:
+        """Переключение курсивного форматирования."""
+        if not self.note_text.tag_ranges("sel"):
+            messagebox.showwarning("Ошибка выбора", "Выделите текст для форматирования!")
+            return
+        try:
+            current_tags = self.note_text.tag_names("sel.first")
+            if "italic" in current_tags:
+                self.note_text.tag_remove("italic", "sel.first", "sel.last")
+            else:
+                self.note_text.tag_add("italic", "sel.first", "sel.last")
+            self.autosaver.mark_dirty()
+        except tk.TclError as e:
+            messagebox.showerror("Ошибка форматирования", f"Не удалось применить форматирование: {e}")
+
+    def toggle_underline(self) -> None:
+        """Переключение подчеркивания."""
+        if not self.note_text.tag_ranges("sel"):
+            messagebox.showwarning("Ошибка выбора", "Выделите текст для форматирования!")
+            return
+        try:
+            current_tags = self.note_text.tag_names("sel.first")
+            if "underline" in current_tags:
+                self.note_text.tag_remove("underline", "sel.first", "sel.last")
+            else:
+                self.note_text.tag_add("underline", "sel.first", "sel.last")
+            self.autosaver.mark_dirty()
+        except tk.TclError as e:
+            messagebox.showerror("Ошибка форматирования", f"Не удалось применить форматирование: {e}")
+
+    def toggle_theme(self) -> None:
+        """Переключение между светлой и темной темами."""
+        self.theme = "dark" if self.theme == "light" else "light"
+        self.apply_theme(self.theme)
+
+    def clear_editor(self) -> None:
+        """Очистка редактора заметок."""
+        self.cancel_note_loading()
+        self.title_entry.delete(0, tk.END)
+        self.note_text.delete("1.0", tk.END)
+        self.note_text.edit_modified(False)
+        self.current_note_id = None
+        self.current_category_id = self.selected_category_id()
+        self.draft_key = f"draft:{uuid.uuid4().hex}"
+        self.autosaver.reset()
+
+    def quit_app(self) -> None:
+        """Выход из приложения."""
+        if messagebox.askyesno("Подтверждение", "Вы хотите выйти?"):
+            # Несохраненные правки записываются до остановки потока записи
+            self.autosaver.flush()
+            self.autosaver.close()
+            self.prefetcher.close()
+            if self.heartbeat is not None:
+                self.heartbeat.stop()
+            if self.history_compactor is not None:
+                self.history_compactor.close()
+            if self.title_index_builder is not None:
+                self.title_index_builder.close()
+            if self.search_engine is not None:
+                self.search_engine.close()
+            try:
+                if self.store is not None:
+                    self.store.close()
+            except sqlite3.Error:
+                pass
+            self.root.quit()
+
+def run_cli(args: argparse.Namespace) -> int:
+    """Выгрузка, загрузка или синхронизация заметок из командной строки; возвращает код выхода."""
+    def progress(done: int, elapsed: float) -> None:
+        rate = done / elapsed if elapsed else 0.0
+        print(f"\r{done} заметок, {elapsed:.1f} с ({rate:.0f} заметок/с)", end="", file=sys.stderr)
+
+    try:
+        store = NoteStore(args.db)
+        try:
+            if args.command == "export":
+                category_id = None
+                if args.category is not None:
+                    category_id = store.category_id(args.category)
+                    if category_id is None:
+                        print(f"Категория не найдена: {args.category}", file=sys.stderr)
+                        return 1
+                export_notes(store, args.path, args.format, category_id, progress)
+            elif args.command == "sync":
+                if args.url is not None:
+                    set_server_url(store, args.url)
+                url = server_url(store)
+                if url is None:
+                    print("Адрес сервера не задан: укажите его аргументом", file=sys.stderr)
+                    return 1
+                report = sync_once(store, url, progress)
+                print(f"\nПолучено {report.pulled}, отправлено {report.pushed}, отклонено {report.rejected}, "
+                      f"конфликтов: {conflict_count(store)}", end="", file=sys.stderr)
+            else:
+                import_notes(store, args.path, args.format, progress, args.workers)
+        finally:
+            store.close()
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"\nОшибка: {e}", file=sys.stderr)
+        return 1
+    print(file=sys.stderr)
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Приложение для заметок")
+    parser.add_argument("--db", help="файл базы данных (по умолчанию $NOTES_DB или notes.db рядом с программой)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="вывести время этапов запуска интерфейса")
+    parser.add_argument("--profile", action="store_true",
+                        help="замерять операции и запросы (также при NOTES_PROFILE=1); см. Вид → Диагностика")
+    parser.add_argument("--slow-query-ms", type=float, default=SLOW_QUERY_MS,
+                        help=f"порог журнала медленных запросов, мс (по умолчанию {SLOW_QUERY_MS:g})")
+    parser.add_argument("--profile-out", help="сохранить данные профилирования в JSON при выходе")
+    commands = parser.add_subparsers(dest="command")
+    export_parser = commands.add_parser("export", help="выгрузка всех заметок")
+    export_parser.add_argument("path", help="файл .jsonl или .zip либо каталог для Markdown")
+    export_parser.add_argument("--format", choices=FORMATS, help="формат (по умолчанию по пути)")
+    export_parser.add_argument("--category", help="выгрузить только эту категорию")
+    import_parser = commands.add_parser("import", help="загрузка заметок")
+    import_parser.add_argument("path", help="файл .jsonl или .zip либо каталог с Markdown")
+    import_parser.add_argument("--format", choices=FORMATS, help="формат (по умолчанию по пути)")
+    import_parser.add_argument("--workers", type=int, help="процессов разбора (по умолчанию по числу ядер)")
+    sync_parser = commands.add_parser("sync", help="синхронизация с сервером (см. sync_server.py)")
+    sync_parser.add_argument("url", nargs="?", help="адрес сервера (запоминается; по умолчанию сохраненный)")
+    args = parser.parse_args()
+
+    if args.db is None:
+        args.db = default_db_path()
+    if args.profile or args.profile_out or os.environ.get("NOTES_PROFILE") == "1":
+        # До открытия первого соединения и создания окна
+        profiler.enable(args.slow_query_ms)
+    if args.command is not None:
+        code = run_cli(args)
+    else:
+        root = tk.Tk()
+        app = NotesApp(root, args.db, StartupTimer(STARTED, args.startup_report))
+        root.mainloop()
+        code = 0
+    if args.profile_out:
+        try:
+            profiler.export_json(args.profile_out)
+        except OSError as e:
+            print(f"Не удалось сохранить данные профилирования: {e}", file=sys.stderr)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
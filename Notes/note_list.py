@@ -0,0 +1,233 @@
+import tkinter as tk
+from array import array
+from tkinter import ttk, font
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+# Количество строк, подгружаемых сверх видимой области
+PREFETCH_ROWS = 100
+
+# Размер страницы при подгрузке во время прокрутки
+PAGE_SIZE = 200
+
+# Наибольшее число строк в списке: строки, ушедшие далеко за видимую
+# область, удаляются и при обратной прокрутке загружаются заново
+MAX_ROWS = 5 * PAGE_SIZE
+
+# Строка страницы: (id заметки, подпись, ключ для keyset-пагинации)
+PageRow = Tuple[int, str, Tuple[Any, ...]]
+# Источник строк: (ключ, лимит, backward) -> строки после ключа или, при
+# backward, перед ним; в обоих случаях в порядке списка
+PageFetcher = Callable[[Optional[Tuple[Any, ...]], int, bool], List[PageRow]]
+
+
+class NoteListView:
+    """Список заметок с постраничной подгрузкой.
+
+    Вместо загрузки всех заметок категории список запрашивает у источника
+    только видимую область с запасом, а по мере прокрутки — соседние
+    страницы по ключам первой и последней загруженных строк. В списке
+    держится не больше MAX_ROWS строк: при подгрузке строки с
+    противоположного края, далекие от видимой области, удаляются.
+    Соответствие строки списка и id заметки хранится в компактном массиве.
+    """
+
+    def __init__(self, parent: tk.Misc):
+        self.frame = ttk.Frame(parent)
+        self.listbox = tk.Listbox(self.frame, height=20, width=30, exportselection=False)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.listbox.yview)
+        self.listbox.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.ids = array("q")  # id заметки для каждой строки списка
+        # Ключ пагинации каждой строки; None — строка поднята наверх после
+        # сохранения, и её ключ неизвестен (такие строки всегда идут первыми)
+        self.keys: List[Optional[Tuple[Any, ...]]] = []
+        self._fetch: Optional[PageFetcher] = None
+        self._first_key: Optional[Tuple[Any, ...]] = None
+        self._last_key: Optional[Tuple[Any, ...]] = None
+        self._head_exhausted = True  # Выше первой строки заметок нет
+        self._exhausted = True  # Ниже последней строки заметок нет
+        self._load_pending = False
+
+    def set_source(self, fetch: PageFetcher) -> None:
+        """Замена источника строк и загрузка первой страницы."""
+        self.clear()
+        self._fetch = fetch
+        self._exhausted = False
+        self._load_page(self.visible_rows() + PREFETCH_ROWS)
+
+    def set_rows(self, rows: Sequence[Tuple[int, str]]) -> None:
+        """Отображение готового набора строк (например, результатов поиска)."""
+        self.clear()
+        self.ids.extend(note_id for note_id, _ in rows)
+        self.keys.extend(None for _ in rows)
+        if rows:
+            self.listbox.insert(tk.END, *(label for _, label in rows))
+
+    def clear(self) -> None:
+        """Очистка списка и сброс источника."""
+        self.listbox.delete(0, tk.END)
+        del self.ids[:]
+        del self.keys[:]
+        self._fetch = None
+        self._first_key = None
+        self._last_key = None
+        self._head_exhausted = True
+        self._exhausted = True
+
+    def visible_rows(self) -> int:
+        """Количество строк, помещающихся в видимой области."""
+        line_height = font.Font(font=self.listbox.cget("font")).metrics("linespace")
+        return max(int(self.listbox.cget("height")), self.listbox.winfo_height() // max(line_height, 1))
+
+    def selected_note_id(self) -> Optional[int]:
+        """ID заметки в выделенной строке."""
+        selection = self.listbox.curselection()
+        if not selection:
+            return None
+        return self.ids[selection[0]]
+
+    def index_of(self, note_id: int) -> Optional[int]:
+        """Номер строки заметки среди загруженных или None."""
+        try:
+            return self.ids.index(note_id)
+        except ValueError:
+            return None
+
+    def neighbor_ids(self, note_id: int, radius: int) -> List[int]:
+        """id соседних заметок в пределах radius строк, ближайшие (и нижние) первыми."""
+        index = self.index_of(note_id)
+        if index is None:
+            return []
+        neighbors = []
+        for distance in range(1, radius + 1):
+            for row in (index + distance, index - distance):
+                if 0 <= row < len(self.ids):
+                    neighbors.append(self.ids[row])
+        return neighbors
+
+    def move_to_top(self, note_id: int, label: str) -> None:
+        """Перемещение (или добавление) строки заметки в начало списка.
+
+        Если начало списка выгружено, строка просто удаляется: заметка
+        загрузится вместе с верхними строками при прокрутке.
+        """
+        index = self.index_of(note_id)
+        selected = index is not None and index in self.listbox.curselection()
+        if index is not None:
+            self._delete_rows(index, index + 1)
+        if not self._head_exhausted:
+            return
+        self.listbox.insert(0, label)
+        self.ids.insert(0, note_id)
+        self.keys.insert(0, None)
+        if selected:
+            self.listbox.selection_set(0)
+
+    def update_label(self, note_id: int, label: str) -> None:
+        """Замена подписи строки заметки на месте."""
+        index = self.index_of(note_id)
+        if index is None:
+            return
+        selected = index in self.listbox.curselection()
+        self.listbox.delete(index)
+        self.listbox.insert(index, label)
+        if selected:
+            self.listbox.selection_set(index)
+
+    def remove(self, note_id: int) -> None:
+        """Удаление строки заметки из списка."""
+        index = self.index_of(note_id)
+        if index is not None:
+            self._delete_rows(index, index + 1)
+
+    def _delete_rows(self, start: int, end: int) -> None:
+        """Удаление строк [start, end) из списка и массивов."""
+        self.listbox.delete(start, end - 1)
+        del self.ids[start:end]
+        del self.keys[start:end]
+
+    def _load_page(self, limit: int) -> None:
+        """Подгрузка следующей страницы из источника."""
+        if self._fetch is None or self._exhausted:
+            return
+        rows = self._fetch(self._last_key, limit, False)
+        if len(rows) < limit:
+            self._exhausted = True
+        if rows:
+            self.ids.extend(note_id for note_id, _, _ in rows)
+            self.keys.extend(key for _, _, key in rows)
+            self.listbox.insert(tk.END, *(label for _, label, _ in rows))
+            self._last_key = rows[-1][2]
+            if self._first_key is None:
+                self._first_key = rows[0][2]
+            self._trim_head()
+
+    def _load_previous_page(self, limit: int) -> None:
+        """Подгрузка страницы перед первой строкой (после выгрузки начала списка)."""
+        if self._fetch is None or self._head_exhausted:
+            return
+        rows = self._fetch(self._first_key, limit, True)
+        if len(rows) < limit:
+            self._head_exhausted = True
+        if rows:
+            top, _ = self._visible_range()
+            self.ids[0:0] = array("q", (note_id for note_id, _, _ in rows))
+            self.keys[0:0] = [key for _, _, key in rows]
+            self.listbox.insert(0, *(label for _, label, _ in rows))
+            self.listbox.yview(top + len(rows))
+            self._first_key = rows[0][2]
+            self._trim_tail()
+
+    def _trim_head(self) -> None:
+        """Выгрузка начала списка сверх MAX_ROWS, далекого от видимой области."""
+        top, _ = self._visible_range()
+        count = min(len(self.ids) - MAX_ROWS, top - PREFETCH_ROWS)
+        if count <= 0:
+            return
+        # Строки без ключа выгружаются вместе с остальными: ключ первой строки нужен для подгрузки
+        while count < len(self.keys) and self.keys[count] is None:
+            count += 1
+        if count >= len(self.keys):
+            return
+        self._delete_rows(0, count)
+        self.listbox.yview(max(top - count, 0))
+        self._first_key = self.keys[0]
+        self._head_exhausted = False
+
+    def _trim_tail(self) -> None:
+        """Выгрузка конца списка сверх MAX_ROWS, далекого от видимой области."""
+        _, bottom = self._visible_range()
+        count = min(len(self.ids) - MAX_ROWS, len(self.ids) - 1 - bottom - PREFETCH_ROWS)
+        if count <= 0 or self.keys[-count - 1] is None:
+            return
+        self._delete_rows(len(self.ids) - count, len(self.ids))
+        self._last_key = self.keys[-1]
+        self._exhausted = False
+
+    def _visible_range(self) -> Tuple[int, int]:
+        """Номера первой и последней видимых строк."""
+        first, last = self.listbox.yview()
+        return int(first * len(self.ids)), max(int(last * len(self.ids)) - 1, 0)
+
+    def _on_scroll(self, first: str, last: str) -> None:
+        """Обновление полосы прокрутки и подгрузка при приближении к краю."""
+        self.scrollbar.set(first, last)
+        above = float(first) * len(self.ids)
+        remaining = (1.0 - float(last)) * len(self.ids)
+        if self._load_pending:
+            return
+        if (not self._exhausted and remaining < PREFETCH_ROWS
+                or not self._head_exhausted and above < PREFETCH_ROWS):
+            # Подгрузка откладывается: yscrollcommand вызывается во время отрисовки
+            self._load_pending = True
+            self.listbox.after_idle(self._load_more)
+
+    def _load_more(self) -> None:
+        """Отложенная подгрузка страниц у краев, к которым приблизилась видимая область."""
+        self._load_pending = False
+        first, last = self.listbox.yview()
+        if not self._head_exhausted and first * len(self.ids) < PREFETCH_ROWS:
+            self._load_previous_page(PAGE_SIZE)
+        elif not self._exhausted and (1.0 - last) * len(self.ids) < PREFETCH_ROWS:
+            self._load_page(PAGE_SIZE)
@@ -0,0 +1,230 @@
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from store import NoteStore, TitleRow
+
+# Сколько заметок показывает окно быстрого перехода
+QUICK_OPEN_LIMIT = 50
+
+# Сколько заметок с наибольшим числом общих триграмм ранжируется точно
+CANDIDATES = 200
+
+# Сколько номеров записей из списков триграмм просматривается при подборе кандидатов
+POSTINGS_BUDGET = 50_000
+
+# Минимальная доля триграмм запроса, найденных в заголовке
+MIN_SIMILARITY = 0.3
+
+# Перестроение списков триграмм, когда удаленных записей больше половины (и не меньше этого числа)
+COMPACT_MIN_DEAD = 1024
+
+# Слово заголовка для разбиения на триграммы
+WORD_RE = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Заголовок или запрос без учета регистра и различия е/ё."""
+    return text.casefold().replace("ё", "е")
+
+
+def trigrams(text: str) -> Set[str]:
+    """Триграммы слов текста; слово дополняется пробелами, чтобы учитывались начала и концы слов."""
+    grams: Set[str] = set()
+    for word in WORD_RE.findall(fold(text)):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TitleIndex:
+    """Триграммный индекс заголовков всех заметок для нечеткого поиска.
+
+    Заголовки, id и категории хранятся в массивах по номеру записи, а для
+    каждой триграммы — массив номеров записей. Изменение заголовка
+    помечает старую запись удаленной и добавляет новую; списки триграмм
+    перестраиваются, когда удаленных записей становится больше половины.
+    Индекс наполняется фоновым потоком и меняется из потока Tk, поэтому
+    операции выполняются под блокировкой.
+    """
+
+    def __init__(self) -> None:
+        self.ids = array("q")  # id заметки записи (0 — запись удалена)
+        self.category_ids = array("q")
+        self.sizes = array("H")  # Число триграмм заголовка
+        self.titles: List[str] = []
+        self.loading = False
+        self._postings: Dict[str, array] = {}
+        self._slots: Dict[int, int] = {}  # id заметки -> номер записи
+        self._dead = 0
+        self._removed: Set[int] = set()  # Удаленные во время наполнения
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._slots)
+
+    def begin_load(self) -> None:
+        """Начало наполнения индекса из базы."""
+        with self._lock:
+            self.loading = True
+
+    def load(self, rows: Iterable[TitleRow]) -> None:
+        """Добавление заголовков, прочитанных из базы.
+
+        Заметки, уже измененные или удаленные в потоке Tk после начала
+        наполнения, пропускаются: их версия в индексе новее прочитанной.
+        """
+        prepared = [(note_id, title, category_id, trigrams(title)) for note_id, title, category_id in rows]
+        with self._lock:
+            for note_id, title, category_id, grams in prepared:
+                if note_id not in self._slots and note_id not in self._removed:
+                    self._append(note_id, title, category_id, grams)
+
+    def finish_load(self) -> None:
+        """Окончание наполнения индекса."""
+        with self._lock:
+            self.loading = False
+            self._removed.clear()
+
+    def put(self, note_id: int, title: str, category_id: int) -> None:
+        """Добавление или обновление заголовка заметки."""
+        with self._lock:
+            slot = self._slots.get(note_id)
+            if slot is not None:
+                if self.titles[slot] == title:
+                    self.category_ids[slot] = category_id
+                    return
+                self._kill(slot)
+            self._append(note_id, title, category_id, trigrams(title))
+            self._maybe_compact()
+
+    def remove(self, note_id: int) -> None:
+        """Удаление заметки из индекса."""
+        with self._lock:
+            if self.loading:
+                self._removed.add(note_id)
+            slot = self._slots.pop(note_id, None)
+            if slot is not None:
+                self._kill(slot)
+                self._maybe_compact()
+
+    def search(self, query: str, limit: int = QUICK_OPEN_LIMIT) -> List[TitleRow]:
+        """Заметки с заголовками, похожими на запрос, лучшие первыми.
+
+        Кандидаты подбираются по спискам самых редких триграмм запроса
+        (Counter.update обходит массивы без цикла на Python), пока не
+        исчерпан POSTINGS_BUDGET: частые триграммы мало что различают, а
+        их списки дороже всего. Затем несколько сотен лучших кандидатов
+        ранжируются по всем триграммам (если списки были просмотрены не
+        полностью, общие триграммы пересчитываются): совпадение подстроки и
+        начала заголовка важнее доли общих триграмм.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        folded = " ".join(WORD_RE.findall(fold(query)))
+        with self._lock:
+            postings = sorted((self._postings[gram] for gram in grams if gram in self._postings), key=len)
+            counts: Counter = Counter()
+            budget = POSTINGS_BUDGET
+            for slots in postings:
+                if budget <= 0:
+                    break
+                counts.update(slots if len(slots) <= budget else slots[:budget])
+                budget -= len(slots)
+            complete = budget >= 0
+            ranked = []
+            for slot, shared in counts.most_common(CANDIDATES):
+                if not self.ids[slot]:
+                    continue
+                if not complete:
+                    shared = len(grams & trigrams(self.titles[slot]))
+                similarity = shared / len(grams)
+                if similarity < MIN_SIMILARITY:
+                    continue
+                title = " ".join(WORD_RE.findall(fold(self.titles[slot])))
+                position = title.find(folded)
+                bonus = 0.0 if position < 0 else (2.0 if position == 0 else 1.0)
+                jaccard = shared / (len(grams) + self.sizes[slot] - shared)
+                ranked.append((bonus + similarity, jaccard, -len(title), slot))
+            ranked.sort(reverse=True)
+            return [(self.ids[slot], self.titles[slot], self.category_ids[slot])
+                    for _, _, _, slot in ranked[:limit]]
+
+    def _append(self, note_id: int, title: str, category_id: int, grams: Set[str]) -> None:
+        """Новая запись (вызывается под _lock)."""
+        slot = len(self.ids)
+        self.ids.append(note_id)
+        self.category_ids.append(category_id)
+        self.sizes.append(min(len(grams), 0xFFFF))
+        self.titles.append(title)
+        self._slots[note_id] = slot
+        for gram in grams:
+            slots = self._postings.get(gram)
+            if slots is None:
+                slots = self._postings[gram] = array("I")
+            slots.append(slot)
+
+    def _kill(self, slot: int) -> None:
+        """Пометка записи удаленной (вызывается под _lock)."""
+        self.ids[slot] = 0
+        self.titles[slot] = ""
+        self._dead += 1
+
+    def _maybe_compact(self) -> None:
+        """Перестроение без удаленных записей, если их много (вызывается под _lock)."""
+        if self._dead < COMPACT_MIN_DEAD or self._dead * 2 < len(self.ids):
+            return
+        live = [(self.ids[slot], self.titles[slot], self.category_ids[slot])
+                for slot in range(len(self.ids)) if self.ids[slot]]
+        self.ids = array("q")
+        self.category_ids = array("q")
+        self.sizes = array("H")
+        self.titles = []
+        self._postings = {}
+        self._slots = {}
+        self._dead = 0
+        for note_id, title, category_id in live:
+            self._append(note_id, title, category_id, trigrams(title))
+
+
+class TitleIndexBuilder:
+    """Фоновое наполнение индекса заголовков.
+
+    Поток со своим хранилищем читает заголовки порциями; индексом можно
+    пользоваться и во время наполнения (результаты будут неполными).
+    """
+
+    def __init__(self, open_store: Callable[[], NoteStore], index: TitleIndex):
+        self.open_store = open_store
+        self.index = index
+        self.error: Optional[sqlite3.Error] = None
+        self._stop = threading.Event()
+        index.begin_load()
+        self._thread = threading.Thread(target=self._run, name="title-index", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Чтение заголовков; при ошибке индекс остается неполным."""
+        try:
+            store = self.open_store()
+            try:
+                for rows in store.iter_titles():
+                    if self._stop.is_set():
+                        break
+                    self.index.load(rows)
+            finally:
+                store.close()
+        except sqlite3.Error as e:
+            self.error = e
+        finally:
+            self.index.finish_load()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Остановка наполнения (между порциями)."""
+        self._stop.set()
+        self._thread.join(timeout)
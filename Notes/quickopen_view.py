@@ -0,0 +1,77 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List
+
+from quickopen import TitleIndex
+from store import TitleRow
+
+# Обработчик выбора заметки: (id заметки, id категории)
+OpenHandler = Callable[[int, int], None]
+
+
+class QuickOpenDialog:
+    """Окно быстрого перехода: нечеткий поиск по заголовкам всех категорий."""
+
+    def __init__(self, parent: tk.Misc, index: TitleIndex, category_names: Dict[int, str],
+                 on_open: OpenHandler):
+        self.index = index
+        self.category_names = category_names
+        self.on_open = on_open
+        self.results: List[TitleRow] = []
+        self.window = tk.Toplevel(parent)
+        self.window.title("Быстрый переход")
+        self.window.geometry("600x400")
+        self.window.transient(parent)
+        self.window.grab_set()
+
+        self.query = tk.StringVar()
+        self.query.trace("w", self.update_results)
+        entry = ttk.Entry(self.window, textvariable=self.query)
+        entry.pack(fill="x", padx=5, pady=5)
+        self.listbox = tk.Listbox(self.window, exportselection=False)
+        self.listbox.pack(fill="both", expand=True, padx=5)
+        self.status_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.status_var).pack(anchor="w", padx=5, pady=2)
+
+        entry.bind("<Down>", lambda event: self.move_selection(1))
+        entry.bind("<Up>", lambda event: self.move_selection(-1))
+        self.window.bind("<Return>", lambda event: self.open_selected())
+        self.window.bind("<Escape>", lambda event: self.window.destroy())
+        self.listbox.bind("<Double-Button-1>", lambda event: self.open_selected())
+        entry.focus_set()
+        self.update_results()
+
+    def update_results(self, *args) -> None:
+        """Поиск по мере ввода."""
+        self.results = self.index.search(self.query.get())
+        self.listbox.delete(0, tk.END)
+        if self.results:
+            self.listbox.insert(tk.END, *(f"{title} — {self.category_names.get(category_id, '?')}"
+                                          for _, title, category_id in self.results))
+            self.listbox.selection_set(0)
+        if self.index.loading:
+            self.status_var.set("Индекс заголовков еще строится: найдены не все заметки")
+        elif self.query.get().strip():
+            self.status_var.set(f"Найдено: {len(self.results)}")
+        else:
+            self.status_var.set(f"Заметок: {len(self.index)}")
+
+    def move_selection(self, step: int) -> str:
+        """Перемещение выделения стрелками, не покидая поле ввода."""
+        if not self.results:
+            return "break"
+        selection = self.listbox.curselection()
+        row = min(max((selection[0] if selection else -1) + step, 0), len(self.results) - 1)
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(row)
+        self.listbox.see(row)
+        return "break"
+
+    def open_selected(self) -> None:
+        """Переход к выбранной заметке."""
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        note_id, _, category_id = self.results[selection[0]]
+        self.window.destroy()
+        self.on_open(note_id, category_id)
@@ -0,0 +1,301 @@
+import queue
+import re
+import sqlite3
+import threading
+import tkinter as tk
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from bodies import read_body
+
+# Максимальное количество результатов поиска, отдаваемых интерфейсу
+SEARCH_LIMIT = 500
+
+# Веса BM25 для столбцов (title, content): совпадение в заголовке важнее
+TITLE_WEIGHT = 5.0
+CONTENT_WEIGHT = 1.0
+
+# Задержка (мс) между последним нажатием клавиши и запуском поиска
+DEBOUNCE_MS = 250
+
+# Период (мс) опроса очереди результатов фонового поиска
+POLL_MS = 30
+
+# Маркеры подсветки совпадений во фрагментах
+HIGHLIGHT_START = "["
+HIGHLIGHT_END = "]"
+
+# Фрагмент строится только для заметок не длиннее этого числа символов:
+# время snippet() растет квадратично с числом совпадений в документе
+SNIPPET_MAX_CHARS = 16 * 1024
+
+FTS_TRIGGERS = {
+    "notes_fts_ai": """
+        CREATE TRIGGER notes_fts_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+    """,
+    "notes_fts_ad": """
+        CREATE TRIGGER notes_fts_ad AFTER DELETE ON notes BEGIN
+            DELETE FROM notes_fts WHERE rowid = old.id;
+        END
+    """,
+    "notes_fts_au": """
+        CREATE TRIGGER notes_fts_au AFTER UPDATE OF title, content ON notes BEGIN
+            UPDATE notes_fts SET title = new.title, content = new.content WHERE rowid = new.id;
+        END
+    """,
+}
+
+SearchResult = Tuple[int, str, Optional[str]]
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    """Проверка, собран ли SQLite с поддержкой FTS5."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def ensure_fts_index(conn: sqlite3.Connection) -> bool:
+    """Создание и синхронизация полнотекстового индекса заметок.
+
+    Возвращает True, если индекс FTS5 доступен. При первом запуске на
+    существующей базе индекс заполняется всеми заметками (однократная
+    миграция). Если FTS5 недоступен, триггеры удаляются, чтобы запись
+    в notes не падала, а индекс перестраивается при следующем запуске
+    со сборкой, поддерживающей FTS5.
+    """
+    names = ("notes_fts",) + tuple(FTS_TRIGGERS)
+    existing = {name for (name,) in conn.execute(
+        f"SELECT name FROM sqlite_master WHERE name IN ({', '.join('?' * len(names))})", names
+    )}
+    if not fts5_available(conn):
+        with conn:
+            for trigger in FTS_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        return False
+    if "notes_fts" in existing and all(trigger in existing for trigger in FTS_TRIGGERS):
+        return True
+    with conn:
+        conn.execute("BEGIN")
+        if "notes_fts" not in existing:
+            conn.execute("CREATE VIRTUAL TABLE notes_fts USING fts5(title, content)")
+        else:
+            # Триггеры отсутствовали, индекс мог устареть: перестраиваем его целиком
+            conn.execute("DELETE FROM notes_fts")
+        for trigger, sql in FTS_TRIGGERS.items():
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute(sql)
+        conn.execute("INSERT INTO notes_fts (rowid, title, content) SELECT id, title, content FROM notes")
+        # Тела больших заметок хранятся сжатыми вне notes и индексируются отдельно
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'note_bodies'").fetchone():
+            for (note_id,) in conn.execute("SELECT note_id FROM note_bodies").fetchall():
+                conn.execute("UPDATE notes_fts SET content = ? WHERE rowid = ?", (read_body(conn, note_id), note_id))
+    return True
+
+
+def build_match_query(text: str) -> str:
+    """Преобразование пользовательского ввода в безопасный запрос FTS5.
+
+    Каждое слово ищется как префикс, все слова должны присутствовать.
+    Возвращает пустую строку, если во вводе нет ни одного слова.
+    """
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", text))
+
+
+def search_notes(conn: sqlite3.Connection, text: str, use_fts: bool,
+                 limit: int = SEARCH_LIMIT,
+                 within: Optional[Sequence[int]] = None) -> List[SearchResult]:
+    """Поиск заметок: (id, заголовок, фрагмент с подсветкой или None).
+
+    С FTS5 результаты упорядочены по BM25, иначе — по дате изменения
+    (поиск подстроки через LIKE). Если передан within, поиск ведется
+    только среди заметок с указанными id.
+    """
+    scope = ""
+    if within is not None:
+        with conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS search_scope (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.search_scope")
+            conn.executemany("INSERT INTO temp.search_scope (id) VALUES (?)", ((i,) for i in within))
+        # Для FTS5 ограничение передается как "+rowid": иначе модуль выполняет
+        # отдельный MATCH для каждого id из области, что на порядки медленнее
+        scope = "AND {} IN temp.search_scope"
+    match_query = build_match_query(text) if use_fts else ""
+    if match_query:
+        # Столбцы результата вычисляются для каждого совпадения до сортировки,
+        # поэтому фрагменты строятся во внешнем запросе только для лучших
+        # limit заметок, отобранных подзапросом ("+rowid" — см. выше)
+        cursor = conn.execute(f"""
+            SELECT rowid, title,
+                   CASE WHEN length(content) <= ? THEN snippet(notes_fts, 1, ?, ?, '…', 8) END
+            FROM notes_fts
+            WHERE notes_fts MATCH ? AND +rowid IN (
+                SELECT rowid FROM notes_fts
+                WHERE notes_fts MATCH ? {scope.format("+rowid")}
+                ORDER BY bm25(notes_fts, {TITLE_WEIGHT}, {CONTENT_WEIGHT})
+                LIMIT ?
+            )
+            ORDER BY bm25(notes_fts, {TITLE_WEIGHT}, {CONTENT_WEIGHT})
+        """, (SNIPPET_MAX_CHARS, HIGHLIGHT_START, HIGHLIGHT_END, match_query, match_query, limit))
+        return cursor.fetchall()
+    pattern = f"%{text.lower()}%"
+    cursor = conn.execute(f"""
+        SELECT id, title, NULL FROM notes
+        WHERE (lower(title) LIKE ? OR lower(content) LIKE ?) {scope.format("id")}
+        ORDER BY updated_at DESC
+        LIMIT ?
+    """, (pattern, pattern, limit))
+    return cursor.fetchall()
+
+
+class SearchEngine:
+    """Фоновый поиск заметок вне потока Tk.
+
+    Ввод откладывается на DEBOUNCE_MS, запросы выполняются в отдельном
+    потоке со своим соединением, устаревший запрос прерывается через
+    Connection.interrupt, а результаты передаются интерфейсу через
+    root.after. Если новый запрос продолжает предыдущий, поиск ведется
+    только среди уже найденных заметок.
+    """
+
+    def __init__(self, root: tk.Misc, connect: Callable[[], sqlite3.Connection], use_fts: bool,
+                 on_results: Callable[[List[SearchResult]], None],
+                 on_error: Callable[[sqlite3.Error], None],
+                 delay_ms: int = DEBOUNCE_MS):
+        self.root = root
+        self.connect = connect
+        self.use_fts = use_fts
+        self.on_results = on_results
+        self.on_error = on_error
+        self.delay_ms = delay_ms
+        self._jobs: "queue.Queue[Optional[Tuple[int, str]]]" = queue.Queue()
+        self._pending = 0  # Заданий, ответ на которые еще не доставлен в поток Tk
+        self._results: "queue.Queue[Tuple[int, Optional[List[SearchResult]], Optional[sqlite3.Error]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._generation = 0  # Номер актуального запроса; всё, что старше, отбрасывается
+        self._conn: Optional[sqlite3.Connection] = None
+        self._running = False  # Выполняется ли сейчас запрос в рабочем потоке
+        self._after_id: Optional[str] = None
+        self._poll_id: Optional[str] = None
+        # Последний полный результат (запрос, id заметок) для сужения поиска
+        self._last: Optional[Tuple[str, List[int]]] = None
+        self._data_version = 0
+        self._worker = threading.Thread(target=self._work, name="search-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> None:
+        """Постановка запроса в очередь с задержкой; предыдущий запрос отменяется."""
+        generation = self._invalidate()
+        self._after_id = self.root.after(self.delay_ms, self._dispatch, generation, text)
+
+    def cancel(self) -> None:
+        """Отмена отложенного и выполняющегося запроса."""
+        self._invalidate()
+
+    def close(self) -> None:
+        """Остановка рабочего потока."""
+        self._invalidate()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._jobs.put(None)
+
+    def _invalidate(self) -> int:
+        """Увеличение номера поколения и прерывание устаревшей работы."""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        with self._lock:
+            self._generation += 1
+            if self._running and self._conn is not None:
+                self._conn.interrupt()
+            return self._generation
+
+    def invalidate_results(self) -> None:
+        """Сброс сохраненного результата после изменения заметок."""
+        with self._lock:
+            self._data_version += 1
+            self._last = None
+
+    def _dispatch(self, generation: int, text: str) -> None:
+        """Передача запроса рабочему потоку по истечении задержки."""
+        self._after_id = None
+        self._pending += 1
+        self._jobs.put((generation, text))
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_MS, self._poll)
+
+    def _poll(self) -> None:
+        """Доставка результатов актуального запроса в поток Tk."""
+        self._poll_id = None
+        while True:
+            try:
+                generation, results, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if generation != self._generation:
+                continue
+            if error is not None:
+                self.on_error(error)
+            else:
+                self.on_results(results)
+        if self._pending:
+            self._poll_id = self.root.after(POLL_MS, self._poll)
+
+    def _work(self) -> None:
+        """Цикл рабочего потока: на каждое задание отправляется ровно один ответ."""
+        conn: Optional[sqlite3.Connection] = None
+        connect_error: Optional[sqlite3.Error] = None
+        try:
+            conn = self.connect()
+        except sqlite3.Error as e:
+            connect_error = e
+        with self._lock:
+            self._conn = conn
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            generation, text = job
+            results: Optional[List[SearchResult]] = None
+            error = connect_error
+            with self._lock:
+                run = conn is not None and generation == self._generation
+                self._running = run
+            if run:
+                try:
+                    results = self._search(conn, text)
+                except sqlite3.Error as e:
+                    # В том числе "interrupted" для отмененного запроса
+                    error = e
+                finally:
+                    with self._lock:
+                        self._running = False
+            self._results.put((generation, results, error))
+        with self._lock:
+            self._conn = None
+        if conn is not None:
+            conn.close()
+
+    def _search(self, conn: sqlite3.Connection, text: str) -> List[SearchResult]:
+        """Поиск с сужением по предыдущему результату, если запрос его продолжает."""
+        with self._lock:
+            data_version = self._data_version
+            last = self._last
+        within = None
+        if (last is not None and text.startswith(last[0])
+                and bool(build_match_query(text)) == bool(build_match_query(last[0]))):
+            within = last[1]
+            if not within:
+                return []
+        results = search_notes(conn, text, self.use_fts, within=within)
+        with self._lock:
+            # Усеченный лимитом или устаревший результат не годится для сужения
+            if data_version == self._data_version:
+                self._last = (text, [row[0] for row in results]) if len(results) < SEARCH_LIMIT else None
+        return results
@@ -0,0 +1,34 @@
+import sys
+import time
+from typing import List, Optional, TextIO, Tuple
+
+
+class StartupTimer:
+    """Отметки этапов запуска для отчета о времени загрузки.
+
+    Время отсчитывается от started (отметка в начале main.py, до импорта
+    остальных модулей). Отчет печатается, только если он включен.
+    """
+
+    def __init__(self, started: float, enabled: bool = False):
+        self.started = started
+        self.enabled = enabled
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """Завершение этапа phase."""
+        self.marks.append((phase, time.perf_counter()))
+
+    def report(self) -> str:
+        """Таблица этапов: длительность этапа и время от начала запуска, в мс."""
+        lines = [f"{'этап':<24} {'этап, мс':>10} {'от начала, мс':>14}"]
+        previous = self.started
+        for phase, moment in self.marks:
+            lines.append(f"{phase:<24} {(moment - previous) * 1000:>10.1f} {(moment - self.started) * 1000:>14.1f}")
+            previous = moment
+        return "\n".join(lines)
+
+    def finish(self, stream: Optional[TextIO] = None) -> None:
+        """Печать отчета, если он включен."""
+        if self.enabled:
+            print(self.report(), file=stream or sys.stderr)
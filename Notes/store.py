@@ -0,0 +1,347 @@
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from bodies import CHUNK_BYTES, iter_body, read_body, split_body, write_body
+from database import begin_immediate, connect, migrate, now_ms
+from formatting import Span, pack_spans, unpack_spans
+from history import RevisionRow, get_revision, list_revisions, record_revision
+from search import SEARCH_LIMIT, SearchResult, ensure_fts_index, search_notes
+from sync import record_change, track_untracked
+
+# Количество строк в одном вызове executemany при пакетной вставке
+BULK_BATCH_SIZE = 1000
+
+# Строка списка заметок: (id, заголовок, updated_at)
+NoteRow = Tuple[int, str, int]
+
+# Заметка для выгрузки: (id, заголовок, содержимое, имя категории, форматирование, created_at, updated_at)
+ExportRow = Tuple[int, str, str, str, List[Span], int, int]
+
+# Заголовок для индекса быстрого перехода: (id, заголовок, id категории)
+TitleRow = Tuple[int, str, int]
+
+# Заметка для пакетной вставки: (заголовок, содержимое, id категории, форматирование, created_at, updated_at)
+ImportRow = Tuple[str, str, int, Sequence[Span], int, int]
+
+# Запросы вынесены в константы: одинаковый текст SQL попадает в кэш
+# подготовленных выражений соединения и не компилируется повторно
+SQL_LIST_FIRST = """
+    SELECT id, title, updated_at FROM notes
+    WHERE category_id = ?
+    ORDER BY updated_at DESC, id DESC
+    LIMIT ?
+"""
+SQL_LIST_AFTER = """
+    SELECT id, title, updated_at FROM notes
+    WHERE category_id = ? AND (updated_at, id) < (?, ?)
+    ORDER BY updated_at DESC, id DESC
+    LIMIT ?
+"""
+SQL_LIST_BEFORE = """
+    SELECT id, title, updated_at FROM notes
+    WHERE category_id = ? AND (updated_at, id) > (?, ?)
+    ORDER BY updated_at, id
+    LIMIT ?
+"""
+SQL_COUNT = "SELECT note_count FROM category_stats WHERE category_id = ?"
+SQL_GET = "SELECT title, content, category_id, format FROM notes WHERE id = ?"
+SQL_GET_HEADER = "SELECT title, category_id, format FROM notes WHERE id = ?"
+SQL_GET_CONTENT = "SELECT content FROM notes WHERE id = ?"
+SQL_INSERT = """
+    INSERT INTO notes (title, content, category_id, format, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+SQL_UPDATE = """
+    UPDATE notes SET title = ?, content = ?, category_id = ?, format = ?, updated_at = ?
+    WHERE id = ?
+"""
+SQL_DELETE = "DELETE FROM notes WHERE id = ?"
+SQL_EXPORT = """
+    SELECT notes.id, title, content, categories.name, format, created_at, updated_at
+    FROM notes JOIN categories ON categories.id = notes.category_id
+    ORDER BY notes.id
+"""
+SQL_EXPORT_CATEGORY = """
+    SELECT notes.id, title, content, categories.name, format, created_at, updated_at
+    FROM notes JOIN categories ON categories.id = notes.category_id
+    WHERE notes.category_id = ?
+    ORDER BY notes.id
+"""
+SQL_TITLES = "SELECT id, title, category_id FROM notes"
+SQL_CATEGORIES = "SELECT id, name FROM categories ORDER BY name"
+SQL_CATEGORY_STATS = "SELECT category_id, note_count, total_bytes, last_updated FROM category_stats"
+SQL_ADD_CATEGORY = "INSERT OR IGNORE INTO categories (name) VALUES (?)"
+
+
+class CategoryStats(NamedTuple):
+    """Агрегаты категории из category_stats (поддерживаются триггерами)."""
+    note_count: int = 0
+    total_bytes: int = 0
+    last_updated: int = 0
+
+
+class NoteStore:
+    """Слой данных заметок, не зависящий от интерфейса.
+
+    Соединение работает в режиме автокоммита, а изменения выполняются в
+    явных транзакциях (см. transaction). Соответствие имени категории и
+    её id кэшируется и сбрасывается при изменении категорий. Экземпляр
+    рассчитан на использование из одного потока; фоновым потокам нужны
+    свои соединения (open_connection) или свои экземпляры NoteStore.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = connect(path, isolation_level=None)
+        migrate(self.conn)
+        # Полнотекстовый индекс FTS5 (при его отсутствии поиск работает через LIKE)
+        self.fts_enabled = ensure_fts_index(self.conn)
+        self._category_ids: Optional[Dict[str, int]] = None
+
+    def open_connection(self) -> sqlite3.Connection:
+        """Открытие дополнительного соединения с той же базой (для других потоков)."""
+        return connect(self.path, isolation_level=None)
+
+    def close(self) -> None:
+        """Закрытие соединения."""
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Явная транзакция записи; вложенный вызов присоединяется к внешней.
+
+        Если база занята другим окном или процессом, начало транзакции
+        ждет и повторяется (см. database.begin_immediate).
+        """
+        if self.conn.in_transaction:
+            yield self.conn
+            return
+        begin_immediate(self.conn)
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.rollback()
+            # Кэш мог запомнить категории из отмененной транзакции
+            self._category_ids = None
+            raise
+        self.conn.commit()
+
+    # Категории
+
+    def _load_categories(self) -> Dict[str, int]:
+        """Кэш соответствия имени категории и её id."""
+        if self._category_ids is None:
+            self._category_ids = {name: category_id for category_id, name in self.conn.execute(SQL_CATEGORIES)}
+        return self._category_ids
+
+    def reload_categories(self) -> None:
+        """Сброс кэша категорий (их могли добавить другое окно или скрипт)."""
+        self._category_ids = None
+
+    def categories(self) -> List[str]:
+        """Имена категорий в алфавитном порядке."""
+        return sorted(self._load_categories())
+
+    def category_id(self, name: str) -> Optional[int]:
+        """ID категории по имени или None, если такой категории нет."""
+        return self._load_categories().get(name)
+
+    def category_stats(self) -> Dict[int, CategoryStats]:
+        """Агрегаты всех категорий по id; у категорий без заметок записи может не быть."""
+        return {category_id: CategoryStats(*stats)
+                for category_id, *stats in self.conn.execute(SQL_CATEGORY_STATS)}
+
+    def add_category(self, name: str) -> int:
+        """Создание категории (если её нет) и возврат её id."""
+        with self.transaction():
+            self.conn.execute(SQL_ADD_CATEGORY, (name,))
+        self._category_ids = None
+        return self._load_categories()[name]
+
+    # Заметки
+
+    def list_notes(self, category_id: int, after: Optional[Tuple[int, int]] = None,
+                   limit: int = 200) -> List[NoteRow]:
+        """Страница заметок категории после ключа (updated_at, id), новые сверху."""
+        if after is None:
+            return self.conn.execute(SQL_LIST_FIRST, (category_id, limit)).fetchall()
+        return self.conn.execute(SQL_LIST_AFTER, (category_id, after[0], after[1], limit)).fetchall()
+
+    def list_notes_before(self, category_id: int, before: Tuple[int, int],
+                          limit: int = 200) -> List[NoteRow]:
+        """Страница заметок категории перед ключом (updated_at, id), новые сверху."""
+        rows = self.conn.execute(SQL_LIST_BEFORE, (category_id, before[0], before[1], limit)).fetchall()
+        rows.reverse()
+        return rows
+
+    def count_notes(self, category_id: int) -> int:
+        """Количество заметок в категории (из category_stats, без подсчета строк)."""
+        row = self.conn.execute(SQL_COUNT, (category_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get_note(self, note_id: int) -> Optional[Tuple[str, str, int, List[Span]]]:
+        """Заметка по id: (заголовок, содержимое, id категории, форматирование) или None."""
+        row = self.conn.execute(SQL_GET, (note_id,)).fetchone()
+        if row is None:
+            return None
+        title, content, category_id, spans = row
+        if content is None:
+            content = read_body(self.conn, note_id) or ""
+        return title, content, category_id, unpack_spans(spans)
+
+    def get_note_header(self, note_id: int) -> Optional[Tuple[str, int, List[Span]]]:
+        """Заметка без тела: (заголовок, id категории, форматирование) или None."""
+        row = self.conn.execute(SQL_GET_HEADER, (note_id,)).fetchone()
+        if row is None:
+            return None
+        title, category_id, spans = row
+        return title, category_id, unpack_spans(spans)
+
+    def iter_content(self, note_id: int, chunk_size: int = CHUNK_BYTES) -> Iterator[str]:
+        """Тело заметки порциями, без загрузки сжатого тела целиком."""
+        row = self.conn.execute(SQL_GET_CONTENT, (note_id,)).fetchone()
+        if row is None:
+            return
+        content = row[0]
+        if content is None:
+            yield from iter_body(self.conn, note_id, chunk_size)
+            return
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
+    def create_note(self, title: str, content: str, category_id: int,
+                    spans: Sequence[Span] = (), track: bool = True) -> int:
+        """Создание заметки; возвращает её id.
+
+        track=False — заметка пришла при синхронизации и не ставится в
+        журнал отправки (то же для update_note и delete_note).
+        """
+        timestamp = now_ms()
+        inline, compressed, size = split_body(content)
+        with self.transaction():
+            cursor = self.conn.execute(
+                SQL_INSERT, (title, inline, category_id, pack_spans(spans), timestamp, timestamp)
+            )
+            if compressed is not None:
+                write_body(self.conn, cursor.lastrowid, content, compressed, size, self.fts_enabled)
+            if track:
+                record_change(self.conn, cursor.lastrowid)
+            return cursor.lastrowid
+
+    def update_note(self, note_id: int, title: str, content: str, category_id: int,
+                    spans: Sequence[Span] = (), track: bool = True) -> bool:
+        """Обновление заметки вместе с её форматированием; False, если заметки нет.
+
+        Новая версия добавляется в историю (см. history.record_revision).
+        """
+        inline, compressed, size = split_body(content)
+        timestamp = now_ms()
+        packed = pack_spans(spans)
+        with self.transaction():
+            record_revision(self.conn, note_id, title, content, packed, timestamp)
+            cursor = self.conn.execute(SQL_UPDATE, (title, inline, category_id, packed, timestamp, note_id))
+            if cursor.rowcount == 0:
+                return False
+            write_body(self.conn, note_id, content, compressed, size, self.fts_enabled)
+            if track:
+                record_change(self.conn, note_id)
+        return True
+
+    def delete_note(self, note_id: int, track: bool = True) -> None:
+        """Удаление заметки."""
+        with self.transaction():
+            if track:
+                record_change(self.conn, note_id, deleted=True)
+            self.conn.execute(SQL_DELETE, (note_id,))
+
+    def revisions(self, note_id: int) -> List[RevisionRow]:
+        """История версий заметки: (номер, время, заголовок), новые сверху."""
+        return list_revisions(self.conn, note_id)
+
+    def get_revision(self, note_id: int, revision: int) -> Optional[Tuple[str, str, List[Span]]]:
+        """Версия заметки из истории: (заголовок, содержимое, форматирование) или None."""
+        return get_revision(self.conn, note_id, revision)
+
+    def search(self, text: str, limit: int = SEARCH_LIMIT,
+               within: Optional[Sequence[int]] = None) -> List[SearchResult]:
+        """Поиск заметок (см. search.search_notes)."""
+        return search_notes(self.conn, text, self.fts_enabled, limit, within)
+
+    # Пакетные операции
+
+    def bulk_create(self, notes: Iterable[Tuple[str, str, int]]) -> int:
+        """Создание множества заметок (заголовок, содержимое, id категории) одной транзакцией."""
+        timestamp = now_ms()
+        return self.bulk_insert((title, content, category_id, (), timestamp, timestamp)
+                                for title, content, category_id in notes)
+
+    def bulk_insert(self, notes: Iterable[ImportRow]) -> int:
+        """Вставка множества заметок с форматированием и временем создания одной транзакцией.
+
+        Небольшие заметки вставляются пачками через executemany, большие —
+        по одной, со сжатым телом. notes может быть генератором: он
+        выполняется внутри транзакции.
+        """
+        created = 0
+        batch: List[Tuple[str, Optional[str], int, Optional[bytes], int, int]] = []
+        with self.transaction():
+            for title, content, category_id, spans, created_at, updated_at in notes:
+                inline, compressed, size = split_body(content)
+                row = (title, inline, category_id, pack_spans(spans), created_at, updated_at)
+                if compressed is None:
+                    batch.append(row)
+                    if len(batch) >= BULK_BATCH_SIZE:
+                        created += self.conn.executemany(SQL_INSERT, batch).rowcount
+                        batch.clear()
+                    continue
+                cursor = self.conn.execute(SQL_INSERT, row)
+                write_body(self.conn, cursor.lastrowid, content, compressed, size, self.fts_enabled)
+                created += 1
+            if batch:
+                created += self.conn.executemany(SQL_INSERT, batch).rowcount
+            track_untracked(self.conn)
+        return created
+
+    def iter_notes(self, category_id: Optional[int] = None,
+                   batch_size: int = BULK_BATCH_SIZE) -> Iterator[ExportRow]:
+        """Потоковое чтение всех заметок (или одной категории) в порядке id.
+
+        Строки выбираются курсором порциями по batch_size, сжатые тела
+        распаковываются по одному, так что память не растет с размером базы.
+        """
+        if category_id is None:
+            cursor = self.conn.execute(SQL_EXPORT)
+        else:
+            cursor = self.conn.execute(SQL_EXPORT_CATEGORY, (category_id,))
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for note_id, title, content, category, spans, created_at, updated_at in rows:
+                    if content is None:
+                        content = read_body(self.conn, note_id) or ""
+                    yield note_id, title, content, category, unpack_spans(spans), created_at, updated_at
+        finally:
+            cursor.close()
+
+    def iter_titles(self, batch_size: int = BULK_BATCH_SIZE) -> Iterator[List[TitleRow]]:
+        """Заголовки всех заметок порциями по batch_size (без чтения содержимого)."""
+        cursor = self.conn.execute(SQL_TITLES)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def bulk_delete(self, note_ids: Iterable[int]) -> int:
+        """Удаление множества заметок одной транзакцией."""
+        note_ids = list(note_ids)
+        with self.transaction():
+            for note_id in note_ids:
+                record_change(self.conn, note_id, deleted=True)
+            return self.conn.executemany(SQL_DELETE, ((note_id,) for note_id in note_ids)).rowcount
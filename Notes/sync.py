@@ -0,0 +1,105 @@
+"""Журнал исходящих изменений для синхронизации между компьютерами.
+
+У каждой заметки есть глобальный идентификатор uid (id в разных базах
+различаются) и версия — гибридные логические часы (HLC): время в мс,
+сдвинутое на HLC_COUNTER_BITS, плюс счетчик. Часы базы хранятся в
+sync_state и продвигаются внутри транзакции записи, поэтому версии
+монотонны для всех соединений и процессов над одной базой; при
+получении чужих изменений часы догоняют их версию.
+
+Каждое локальное изменение заметки (создание, сохранение, удаление)
+дописывает строку в sync_outbox. При отправке журнал лишь указывает,
+какие заметки изменились: отправляется их текущее состояние, а
+подтвержденные строки удаляются (см. sync_client.py).
+"""
+import sqlite3
+import time
+from typing import Optional
+
+# Младшие биты версии HLC — счетчик изменений в пределах одной миллисекунды
+HLC_COUNTER_BITS = 16
+
+# Ключи sync_state
+STATE_NODE = "node_id"
+STATE_CLOCK = "clock"
+STATE_PULLED = "pulled_seq"
+STATE_SERVER = "server_url"
+
+SQL_GET_STATE = "SELECT value FROM sync_state WHERE key = ?"
+SQL_SET_STATE = """
+    INSERT INTO sync_state (key, value) VALUES (?, ?)
+    ON CONFLICT (key) DO UPDATE SET value = excluded.value
+"""
+SQL_SYNC_BY_NOTE = "SELECT uid, hlc, node, synced_hlc FROM note_sync WHERE note_id = ?"
+SQL_TRACK = "INSERT INTO note_sync (uid, note_id, hlc, node) VALUES (lower(hex(randomblob(16))), ?, ?, ?)"
+SQL_SET_VERSION = "UPDATE note_sync SET hlc = ?, node = ?, note_id = ? WHERE uid = ?"
+SQL_OUTBOX_ADD = "INSERT INTO sync_outbox (uid, hlc) VALUES (?, ?)"
+SQL_TRACK_UNTRACKED = """
+    INSERT INTO note_sync (uid, note_id, hlc, node)
+    SELECT lower(hex(randomblob(16))), id, ? + row_number() OVER (ORDER BY id), ? FROM notes
+    WHERE id NOT IN (SELECT note_id FROM note_sync WHERE note_id IS NOT NULL)
+"""
+SQL_OUTBOX_UNTRACKED = "INSERT INTO sync_outbox (uid, hlc) SELECT uid, hlc FROM note_sync WHERE hlc > ? AND node = ?"
+
+
+def get_state(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    """Значение из sync_state или None."""
+    row = conn.execute(SQL_GET_STATE, (key,)).fetchone()
+    return None if row is None else row[0]
+
+
+def set_state(conn: sqlite3.Connection, key: str, value: str) -> None:
+    """Запись значения в sync_state."""
+    conn.execute(SQL_SET_STATE, (key, value))
+
+
+def tick(conn: sqlite3.Connection) -> int:
+    """Новая версия HLC для локального изменения (внутри транзакции записи)."""
+    last = int(get_state(conn, STATE_CLOCK) or 0)
+    version = max(int(time.time() * 1000) << HLC_COUNTER_BITS, last + 1)
+    set_state(conn, STATE_CLOCK, str(version))
+    return version
+
+
+def observe(conn: sqlite3.Connection, version: int) -> None:
+    """Продвижение часов до полученной версии (внутри транзакции записи)."""
+    if version > int(get_state(conn, STATE_CLOCK) or 0):
+        set_state(conn, STATE_CLOCK, str(version))
+
+
+def record_change(conn: sqlite3.Connection, note_id: int, deleted: bool = False) -> None:
+    """Отметка локального изменения заметки в журнале отправки (внутри транзакции записи).
+
+    Заметка, еще не известная синхронизации, получает uid; удаление
+    такой заметки никуда не отправляется.
+    """
+    row = conn.execute(SQL_SYNC_BY_NOTE, (note_id,)).fetchone()
+    if row is None and deleted:
+        return
+    if row is None:
+        version = tick(conn)
+        conn.execute(SQL_TRACK, (note_id, version, get_state(conn, STATE_NODE)))
+        conn.execute(SQL_OUTBOX_ADD, (conn.execute(SQL_SYNC_BY_NOTE, (note_id,)).fetchone()[0], version))
+    else:
+        record_uid_change(conn, row[0], None if deleted else note_id)
+
+
+def record_uid_change(conn: sqlite3.Connection, uid: str, note_id: Optional[int]) -> int:
+    """Новая локальная версия заметки uid (note_id None — удалена) и запись
+    в журнал отправки (внутри транзакции записи). Возвращает версию."""
+    version = tick(conn)
+    conn.execute(SQL_SET_VERSION, (version, get_state(conn, STATE_NODE), note_id, uid))
+    conn.execute(SQL_OUTBOX_ADD, (uid, version))
+    return version
+
+
+def track_untracked(conn: sqlite3.Connection) -> int:
+    """Постановка в журнал отправки заметок, созданных в обход record_change
+    (пакетная загрузка); внутри транзакции записи. Возвращает их количество."""
+    node = get_state(conn, STATE_NODE)
+    start = tick(conn)
+    count = conn.execute(SQL_TRACK_UNTRACKED, (start, node)).rowcount
+    if count:
+        conn.execute(SQL_OUTBOX_UNTRACKED, (start, node))
+        observe(conn, start + count)
+    return count
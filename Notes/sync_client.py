@@ -0,0 +1,346 @@
+"""Синхронизация базы с сервером (см. sync_server.py).
+
+Обмен идет сжатыми zlib пакетами JSON по HTTP. Сначала с сервера
+забираются изменения других узлов после отметки pulled_seq, затем
+отправляются свои: по журналу sync_outbox выбираются изменившиеся
+заметки, и каждая отправляется один раз в текущем состоянии с её
+версией HLC. Подтвержденные строки журнала удаляются; правки, сделанные
+во время отправки, остаются в журнале до следующего раза.
+
+Изменение с сервера для заметки, у которой есть неотправленные правки,
+— конфликт: обе версии сохраняются, чужая — в sync_conflicts, и
+заметка не отправляется, пока конфликт не разрешат (см. sync_view.py).
+Модуль загружается вместе с интерфейсом, поэтому urllib импортируется
+при первом обращении к серверу.
+"""
+import json
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from bulk import Progress, ProgressMeter
+from database import now_ms
+from formatting import Span
+from store import NoteStore
+from sync import STATE_NODE, STATE_PULLED, STATE_SERVER, get_state, observe, record_uid_change, set_state
+
+# Изменений в одном пакете отправки или получения
+SYNC_BATCH_SIZE = 200
+
+# Таймаут одного HTTP-запроса (с)
+SYNC_TIMEOUT = 30
+
+# Уровень сжатия пакетов
+COMPRESS_LEVEL = 6
+
+# Разметка конфликта при переносе обеих версий в редактор
+CONFLICT_OURS = "<<<<<<< эта версия\n"
+CONFLICT_SEPARATOR = "\n=======  версия с другого компьютера\n"
+CONFLICT_THEIRS = "\n>>>>>>>"
+
+SQL_SYNC_BY_UID = "SELECT note_id, hlc, node FROM note_sync WHERE uid = ?"
+SQL_BASE = "SELECT synced_hlc, synced_node FROM note_sync WHERE uid = ?"
+SQL_ADD_SYNC = "INSERT INTO note_sync (uid, note_id, hlc, node, synced_hlc, synced_node) VALUES (?, ?, ?, ?, ?, ?)"
+SQL_SET_SYNCED = """
+    UPDATE note_sync SET note_id = ?, hlc = ?, node = ?, synced_hlc = ?, synced_node = ? WHERE uid = ?
+"""
+SQL_ACKNOWLEDGE = "UPDATE note_sync SET synced_hlc = ?, synced_node = ? WHERE uid = ?"
+SQL_PENDING = """
+    SELECT uid, max(seq) FROM sync_outbox WHERE uid NOT IN (SELECT uid FROM sync_conflicts)
+    GROUP BY uid ORDER BY max(seq)
+"""
+SQL_HAS_PENDING = "SELECT 1 FROM sync_outbox WHERE uid = ? LIMIT 1"
+SQL_CLEAR_PENDING = "DELETE FROM sync_outbox WHERE uid = ? AND seq <= ?"
+SQL_CLEAR_ALL_PENDING = "DELETE FROM sync_outbox WHERE uid = ?"
+SQL_PENDING_COUNT = "SELECT count(DISTINCT uid) FROM sync_outbox"
+SQL_SAVE_CONFLICT = """
+    INSERT INTO sync_conflicts (uid, hlc, node, payload, detected_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (uid) DO UPDATE SET hlc = excluded.hlc, node = excluded.node,
+        payload = excluded.payload, detected_at = excluded.detected_at
+"""
+SQL_CONFLICTS = """
+    SELECT sync_conflicts.uid, note_sync.note_id, sync_conflicts.payload FROM sync_conflicts
+    JOIN note_sync ON note_sync.uid = sync_conflicts.uid ORDER BY detected_at
+"""
+SQL_CONFLICT = "SELECT payload FROM sync_conflicts WHERE uid = ?"
+SQL_CONFLICT_COUNT = "SELECT count(*) FROM sync_conflicts"
+SQL_DELETE_CONFLICT = "DELETE FROM sync_conflicts WHERE uid = ?"
+
+
+class SyncReport(NamedTuple):
+    """Итог синхронизации: получено и отправлено заметок, новых конфликтов,
+    отклонено сервером (отправятся после следующего получения)."""
+    pulled: int
+    pushed: int
+    conflicts: int
+    rejected: int
+
+
+class Conflict(NamedTuple):
+    """Конфликт: заметка этой базы (None, если удалена здесь) и версия с сервера."""
+    uid: str
+    note_id: Optional[int]
+    remote: Dict[str, Any]
+
+
+def encode(data: Any) -> bytes:
+    """Пакет для передачи: JSON, сжатый zlib."""
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), COMPRESS_LEVEL)
+
+
+def decode(packed: bytes) -> Any:
+    """Разбор пакета encode; ValueError для поврежденного пакета."""
+    try:
+        return json.loads(zlib.decompress(packed).decode("utf-8"))
+    except zlib.error as e:
+        raise ValueError(f"поврежденный пакет синхронизации: {e}") from None
+
+
+def request(url: str, path: str, params: Optional[Dict[str, Any]] = None, body: Any = None) -> Any:
+    """HTTP-запрос к серверу синхронизации: GET без body, иначе POST пакета.
+
+    Ошибки сети и HTTP — OSError (urllib.error.URLError).
+    """
+    import urllib.parse
+    import urllib.request
+    full_url = url.rstrip("/") + path
+    if params:
+        full_url += "?" + urllib.parse.urlencode(params)
+    data = None if body is None else encode(body)
+    req = urllib.request.Request(full_url, data=data, headers={
+        "Content-Type": "application/json", "Content-Encoding": "deflate", "Accept-Encoding": "deflate",
+    })
+    with urllib.request.urlopen(req, timeout=SYNC_TIMEOUT) as response:
+        return decode(response.read())
+
+
+def note_payload(store: NoteStore, uid: str, note_id: Optional[int], version: int,
+                 node: str) -> Dict[str, Any]:
+    """Изменение для отправки: текущее состояние заметки, её версия и версия
+    сервера, на которой основана правка (base; None — заметки еще нет на
+    сервере, узел None — неизвестен после обновления схемы)."""
+    synced_hlc, synced_node = store.conn.execute(SQL_BASE, (uid,)).fetchone()
+    change: Dict[str, Any] = {"uid": uid, "hlc": version, "node": node, "deleted": True,
+                              "base": [synced_hlc, synced_node] if synced_hlc else None}
+    note = None if note_id is None else store.get_note(note_id)
+    if note is not None:
+        title, content, category_id, spans = note
+        names = {store.category_id(name): name for name in store.categories()}
+        change.update(deleted=False, title=title, content=content, category=names.get(category_id, ""),
+                      format=[list(span) for span in spans])
+    return change
+
+
+def same_content(store: NoteStore, note_id: Optional[int], change: Dict[str, Any]) -> bool:
+    """Совпадает ли заметка этой базы с полученной версией (обе удалены — тоже совпадение)."""
+    note = None if note_id is None else store.get_note(note_id)
+    if note is None or change["deleted"]:
+        return note is None and change["deleted"]
+    title, content, category_id, _ = note
+    return (title, content, category_id) == (change["title"], change["content"],
+                                             store.category_id(change["category"]))
+
+
+def write_remote(store: NoteStore, uid: str, note_id: Optional[int], change: Dict[str, Any]) -> Optional[int]:
+    """Запись полученной версии в базу без постановки в журнал отправки
+    (внутри транзакции записи); возвращает id заметки или None.
+
+    Прежняя версия заметки остается в её истории.
+    """
+    if change["deleted"]:
+        if note_id is not None:
+            store.delete_note(note_id, track=False)
+        note_id = None
+    else:
+        category_id = store.add_category(change["category"] or "Без категории")
+        spans: List[Span] = [tuple(span) for span in change.get("format", ())]
+        if note_id is None or not store.update_note(note_id, change["title"], change["content"], category_id,
+                                                    spans, track=False):
+            note_id = store.create_note(change["title"], change["content"], category_id, spans, track=False)
+    store.conn.execute(SQL_SET_SYNCED, (note_id, change["hlc"], change["node"], change["hlc"], change["node"], uid))
+    return note_id
+
+
+def apply_remote(store: NoteStore, change: Dict[str, Any]) -> bool:
+    """Применение полученного изменения (внутри транзакции записи); False — конфликт.
+
+    Заметка с неотправленными правками не перезаписывается: если версии
+    различаются, полученная сохраняется как конфликт. Устаревшая версия
+    (не новее версии этой базы) пропускается.
+    """
+    uid, version, node = change["uid"], change["hlc"], change["node"]
+    observe(store.conn, version)
+    row = store.conn.execute(SQL_SYNC_BY_UID, (uid,)).fetchone()
+    if row is None:
+        store.conn.execute(SQL_ADD_SYNC, (uid, None, version, node, version, node))
+        write_remote(store, uid, None, change)
+        return True
+    note_id, local_version, local_node = row
+    if store.conn.execute(SQL_HAS_PENDING, (uid,)).fetchone() is not None:
+        if not same_content(store, note_id, change):
+            store.conn.execute(SQL_SAVE_CONFLICT, (uid, version, node, encode(change), now_ms()))
+            return False
+        # Одинаковая правка на обоих компьютерах: отправлять нечего
+        store.conn.execute(SQL_CLEAR_ALL_PENDING, (uid,))
+        store.conn.execute(SQL_DELETE_CONFLICT, (uid,))
+    elif (version, node) <= (local_version, local_node):
+        return True
+    write_remote(store, uid, note_id, change)
+    return True
+
+
+def pull(store: NoteStore, url: str, meter: ProgressMeter) -> Tuple[int, int]:
+    """Получение изменений других узлов; возвращает (применено, конфликтов)."""
+    node = get_state(store.conn, STATE_NODE)
+    applied = conflicts = 0
+    while True:
+        since = int(get_state(store.conn, STATE_PULLED) or 0)
+        batch = request(url, "/pull", {"since": since, "node": node, "limit": SYNC_BATCH_SIZE})
+        with store.transaction():
+            for change in batch["changes"]:
+                if apply_remote(store, change):
+                    applied += 1
+                else:
+                    conflicts += 1
+            set_state(store.conn, STATE_PULLED, str(batch["last"]))
+        meter.add(len(batch["changes"]))
+        if not batch["more"]:
+            return applied, conflicts
+
+
+def push(store: NoteStore, url: str, meter: ProgressMeter) -> Tuple[int, int]:
+    """Отправка изменившихся заметок пакетами; возвращает (принято, отклонено)."""
+    pending = store.conn.execute(SQL_PENDING).fetchall()
+    node = get_state(store.conn, STATE_NODE)
+    accepted = rejected = 0
+    for start in range(0, len(pending), SYNC_BATCH_SIZE):
+        changes, sent = [], {}
+        # Версия и содержимое читаются согласованно, внутри одной транзакции
+        with store.transaction():
+            for uid, seq in pending[start:start + SYNC_BATCH_SIZE]:
+                row = store.conn.execute(SQL_SYNC_BY_UID, (uid,)).fetchone()
+                if row is None:
+                    continue
+                note_id, version, change_node = row
+                changes.append(note_payload(store, uid, note_id, version, change_node))
+                sent[uid] = (seq, version, change_node)
+        if not changes:
+            continue
+        result = request(url, "/push", body={"node": node, "changes": changes})
+        with store.transaction():
+            for uid in result["accepted"]:
+                seq, version, change_node = sent[uid]
+                store.conn.execute(SQL_CLEAR_PENDING, (uid, seq))
+                store.conn.execute(SQL_ACKNOWLEDGE, (version, change_node, uid))
+        accepted += len(result["accepted"])
+        rejected += len(result["rejected"])
+        meter.add(len(changes))
+    return accepted, rejected
+
+
+def sync_once(store: NoteStore, url: str, progress: Optional[Progress] = None) -> SyncReport:
+    """Полный цикл синхронизации: получение, затем отправка.
+
+    Получение идет первым: конфликты обнаруживаются до отправки, и
+    сервер не отклоняет правки из-за еще не полученных версий.
+    """
+    meter = ProgressMeter(progress)
+    pulled, conflicts = pull(store, url, meter)
+    pushed, rejected = push(store, url, meter)
+    meter.finish()
+    return SyncReport(pulled, pushed, conflicts, rejected)
+
+
+def server_url(store: NoteStore) -> Optional[str]:
+    """Адрес сервера синхронизации этой базы или None."""
+    return get_state(store.conn, STATE_SERVER)
+
+
+def set_server_url(store: NoteStore, url: str) -> None:
+    """Сохранение адреса сервера синхронизации в базе."""
+    with store.transaction():
+        set_state(store.conn, STATE_SERVER, url)
+
+
+def pending_count(store: NoteStore) -> int:
+    """Число заметок с неотправленными правками."""
+    return store.conn.execute(SQL_PENDING_COUNT).fetchone()[0]
+
+
+def conflict_count(store: NoteStore) -> int:
+    """Число неразрешенных конфликтов."""
+    return store.conn.execute(SQL_CONFLICT_COUNT).fetchone()[0]
+
+
+def list_conflicts(store: NoteStore) -> List[Conflict]:
+    """Неразрешенные конфликты в порядке обнаружения."""
+    return [Conflict(uid, note_id, decode(payload))
+            for uid, note_id, payload in store.conn.execute(SQL_CONFLICTS).fetchall()]
+
+
+def _take_conflict(store: NoteStore, uid: str) -> Optional[Tuple[Optional[int], Dict[str, Any]]]:
+    """Удаление конфликта (внутри транзакции записи); (id заметки, полученная версия) или None."""
+    row = store.conn.execute(SQL_CONFLICT, (uid,)).fetchone()
+    if row is None:
+        return None
+    store.conn.execute(SQL_DELETE_CONFLICT, (uid,))
+    remote = decode(row[0])
+    observe(store.conn, remote["hlc"])
+    return store.conn.execute(SQL_SYNC_BY_UID, (uid,)).fetchone()[0], remote
+
+
+def keep_local(store: NoteStore, uid: str) -> Optional[int]:
+    """Разрешение конфликта в пользу версии этой базы; возвращает id заметки.
+
+    Заметка получает версию новее полученной и при отправке заменит её
+    на сервере.
+    """
+    with store.transaction():
+        taken = _take_conflict(store, uid)
+        if taken is None:
+            return None
+        note_id, remote = taken
+        record_uid_change(store.conn, uid, note_id)
+        store.conn.execute(SQL_ACKNOWLEDGE, (remote["hlc"], remote["node"], uid))
+        return note_id
+
+
+def take_remote(store: NoteStore, uid: str) -> Optional[int]:
+    """Разрешение конфликта в пользу полученной версии; возвращает id заметки
+    (None, если она удалена). Версия этой базы остается в истории заметки."""
+    with store.transaction():
+        taken = _take_conflict(store, uid)
+        if taken is None:
+            return None
+        note_id, remote = taken
+        store.conn.execute(SQL_CLEAR_ALL_PENDING, (uid,))
+        return write_remote(store, uid, note_id, remote)
+
+
+def keep_both(store: NoteStore, uid: str) -> Optional[int]:
+    """Разрешение конфликта переносом обеих версий в заметку с разметкой
+    <<<<<<< / ======= / >>>>>>>; возвращает id заметки.
+
+    Если одна из версий — удаление, остается другая.
+    """
+    with store.transaction():
+        row = store.conn.execute(SQL_CONFLICT, (uid,)).fetchone()
+        note_id = store.conn.execute(SQL_SYNC_BY_UID, (uid,)).fetchone()[0]
+        if row is None:
+            return note_id
+        remote = decode(row[0])
+        note = None if note_id is None else store.get_note(note_id)
+        if note is None:
+            return take_remote(store, uid)
+        if remote["deleted"]:
+            return keep_local(store, uid)
+        # Часы догоняют полученную версию до записи: объединенная версия будет новее
+        _take_conflict(store, uid)
+        title, content, category_id, spans = note
+        merged = CONFLICT_OURS + content + CONFLICT_SEPARATOR + remote["content"] + CONFLICT_THEIRS
+        # Смещения форматирования обеих версий переносятся в объединенный текст
+        theirs = len(CONFLICT_OURS) + len(content) + len(CONFLICT_SEPARATOR)
+        merged_spans = ([(offset + len(CONFLICT_OURS), length, style) for offset, length, style in spans]
+                        + [(offset + theirs, length, style) for offset, length, style in remote.get("format", ())])
+        store.update_note(note_id, title, merged, category_id, merged_spans)
+        store.conn.execute(SQL_ACKNOWLEDGE, (remote["hlc"], remote["node"], uid))
+        return note_id
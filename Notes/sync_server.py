@@ -0,0 +1,194 @@
+"""Эталонный сервер синхронизации заметок для локальной сети.
+
+Пример запуска:
+    python sync_server.py --port 8765 --db sync_server.db
+
+Сервер хранит последнюю версию каждой заметки (по uid) с номером
+изменения seq и отдает клиентам изменения после их отметки, кроме
+сделанных ими самими. Правка принимается, только если она сделана
+поверх хранимой версии (клиент присылает её в base); иначе клиент
+получает отказ и разрешает конфликт после следующего получения
+изменений.
+Удаления хранятся как версии без содержимого. Пакеты — JSON, сжатый
+zlib (см. sync_client.encode).
+"""
+import argparse
+import sqlite3
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+from sync_client import SYNC_BATCH_SIZE, decode, encode
+
+# Адрес и порт по умолчанию: только локальные подключения
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Наибольший размер пакета отправки (байт, в сжатом виде)
+MAX_PUSH_BYTES = 64 * 1024 * 1024
+
+SQL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS changes (
+        uid TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL UNIQUE,
+        hlc INTEGER NOT NULL,
+        node TEXT NOT NULL,
+        payload BLOB NOT NULL
+    )
+"""
+SQL_VERSION = "SELECT hlc, node FROM changes WHERE uid = ?"
+SQL_NEXT_SEQ = "SELECT coalesce(max(seq), 0) + 1 FROM changes"
+SQL_LAST_SEQ = "SELECT coalesce(max(seq), 0) FROM changes"
+SQL_STORE = """
+    INSERT INTO changes (uid, seq, hlc, node, payload) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (uid) DO UPDATE SET seq = excluded.seq, hlc = excluded.hlc, node = excluded.node,
+        payload = excluded.payload
+"""
+SQL_PULL = "SELECT seq, node, payload FROM changes WHERE seq > ? ORDER BY seq LIMIT ?"
+
+
+class SyncStorage:
+    """Хранилище версий сервера; одно соединение под блокировкой для всех потоков."""
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(SQL_SCHEMA)
+        self.conn.commit()
+
+    def push(self, changes: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+        """Сохранение изменений, основанных на хранимой версии; возвращает
+        (принятые, отклоненные) uid.
+
+        Изменение принимается, если его base — версия, хранимая сервером
+        (или заметки на сервере еще нет), либо хранимую версию прислал тот
+        же узел: других правок с тех пор не было. Иначе правка сделана
+        поверх устаревшей версии и отклоняется, даже если её HLC новее:
+        клиент получит чужую версию и разрешит конфликт. Повторно
+        присланная уже принятая версия тоже считается принятой: клиент
+        мог не получить прошлый ответ.
+        """
+        accepted, rejected = [], []
+        with self.lock, self.conn:
+            seq = self.conn.execute(SQL_NEXT_SEQ).fetchone()[0]
+            for change in changes:
+                uid, version = change["uid"], (change["hlc"], change["node"])
+                base = change.get("base")
+                row = self.conn.execute(SQL_VERSION, (uid,)).fetchone()
+                stored = None if row is None else tuple(row)
+                if stored is not None and stored != version:
+                    # Узел base неизвестен для заметок, синхронизированных до его учета
+                    based = (base is not None and base[0] == stored[0] and base[1] in (None, stored[1])
+                             or stored[1] == change["node"] and version > stored)
+                    if not based:
+                        rejected.append(uid)
+                        continue
+                if stored != version:
+                    self.conn.execute(SQL_STORE, (uid, seq, change["hlc"], change["node"], encode(change)))
+                    seq += 1
+                accepted.append(uid)
+        return accepted, rejected
+
+    def pull(self, since: int, node: str, limit: int) -> Dict[str, Any]:
+        """Изменения после since, кроме сделанных узлом node, не больше limit.
+
+        last — отметка для следующего запроса; more — есть ли еще изменения.
+        """
+        with self.lock:
+            rows = self.conn.execute(SQL_PULL, (since, limit)).fetchall()
+            last = rows[-1][0] if len(rows) == limit else self.conn.execute(SQL_LAST_SEQ).fetchone()[0]
+        changes = []
+        for seq, change_node, payload in rows:
+            if change_node != node:
+                change = decode(payload)
+                change["seq"] = seq
+                changes.append(change)
+        return {"changes": changes, "last": max(last, since), "more": len(rows) == limit}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов: GET /pull и POST /push."""
+
+    server: "SyncServer"
+
+    def send_packet(self, data: Any, status: int = 200) -> None:
+        """Ответ сжатым пакетом."""
+        body = encode(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "deflate")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/pull":
+            self.send_error(404)
+            return
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            since = int(query.get("since", ["0"])[0])
+            limit = min(max(int(query.get("limit", [str(SYNC_BATCH_SIZE)])[0]), 1), SYNC_BATCH_SIZE)
+        except ValueError:
+            self.send_error(400, "since и limit должны быть числами")
+            return
+        self.send_packet(self.server.storage.pull(since, query.get("node", [""])[0], limit))
+
+    def do_POST(self) -> None:
+        if self.path != "/push":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_PUSH_BYTES:
+            self.send_error(413)
+            return
+        try:
+            changes = decode(self.rfile.read(length))["changes"]
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400, "поврежденный пакет")
+            return
+        accepted, rejected = self.server.storage.push(changes)
+        self.send_packet({"accepted": accepted, "rejected": rejected})
+
+
+class SyncServer(ThreadingHTTPServer):
+    """HTTP-сервер синхронизации со своим хранилищем версий."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], db_path: str):
+        self.storage = SyncStorage(db_path)
+        super().__init__(address, SyncHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.storage.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сервер синхронизации заметок")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"адрес (по умолчанию {DEFAULT_HOST}; 0.0.0.0 — доступ из сети)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"порт (по умолчанию {DEFAULT_PORT})")
+    parser.add_argument("--db", default="sync_server.db", help="файл базы сервера (по умолчанию sync_server.db)")
+    args = parser.parse_args()
+
+    server = SyncServer((args.host, args.port), args.db)
+    print(f"Сервер синхронизации: http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import sqlite3
+import tkinter as tk
+from tkinter import ttk, messagebox
+from typing import Callable, List, Optional, Tuple
+
+from formatting import Span, apply_spans
+from store import NoteStore
+from sync_client import Conflict
+
+# Обработчик разрешения конфликта; возвращает True при успехе
+ResolveHandler = Callable[[Conflict], bool]
+
+
+class ConflictsDialog:
+    """Окно конфликтов синхронизации: обе версии заметки рядом и выбор решения."""
+
+    def __init__(self, parent: tk.Misc, store: NoteStore, conflicts: List[Conflict],
+                 on_keep_local: ResolveHandler, on_take_remote: ResolveHandler, on_keep_both: ResolveHandler):
+        self.store = store
+        self.conflicts = conflicts
+        self.on_keep_local = on_keep_local
+        self.on_take_remote = on_take_remote
+        self.on_keep_both = on_keep_both
+        self.window = tk.Toplevel(parent)
+        self.window.title("Конфликты синхронизации")
+        self.window.geometry("1000x600")
+        self.window.transient(parent)
+
+        self.listbox = tk.Listbox(self.window, height=6, exportselection=False)
+        self.listbox.pack(fill="x", padx=5, pady=5)
+        self.listbox.bind("<<ListboxSelect>>", self.show_selected)
+
+        panes = ttk.PanedWindow(self.window, orient="horizontal")
+        panes.pack(fill="both", expand=True, padx=5)
+        self.local_title, self.local_text = self.make_pane(panes, "Эта версия")
+        self.remote_title, self.remote_text = self.make_pane(panes, "Версия с другого компьютера")
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(fill="x", padx=5, pady=5)
+        ttk.Button(buttons, text="Закрыть", command=self.window.destroy).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Обе версии в редактор",
+                   command=lambda: self.resolve(self.on_keep_both)).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Взять другую",
+                   command=lambda: self.resolve(self.on_take_remote)).pack(side="right", padx=5)
+        ttk.Button(buttons, text="Оставить эту",
+                   command=lambda: self.resolve(self.on_keep_local)).pack(side="right", padx=5)
+
+        for conflict in conflicts:
+            self.listbox.insert(tk.END, conflict.remote.get("title") or "(удалена на другом компьютере)")
+        if conflicts:
+            self.listbox.selection_set(0)
+            self.show_selected()
+
+    def make_pane(self, panes: ttk.PanedWindow, caption: str) -> Tuple[tk.StringVar, tk.Text]:
+        """Колонка версии: подпись, заголовок и текст только для чтения."""
+        frame = ttk.Frame(panes)
+        panes.add(frame, weight=1)
+        ttk.Label(frame, text=caption).pack(anchor="w")
+        title = tk.StringVar()
+        ttk.Label(frame, textvariable=title, font=("TkDefaultFont", 10, "bold")).pack(anchor="w")
+        text = tk.Text(frame, wrap="word", state="disabled")
+        text.tag_configure("bold", font=("TkDefaultFont", 10, "bold"))
+        text.tag_configure("italic", font=("TkDefaultFont", 10, "italic"))
+        text.tag_configure("underline", font=("TkDefaultFont", 10, "underline"))
+        text.pack(fill="both", expand=True)
+        return title, text
+
+    @staticmethod
+    def show_version(title_var: tk.StringVar, text: tk.Text, title: str, content: str,
+                     spans: List[Span]) -> None:
+        """Вывод версии в колонку."""
+        title_var.set(title)
+        text.configure(state="normal")
+        text.delete("1.0", tk.END)
+        text.insert("1.0", content)
+        try:
+            apply_spans(text, spans, content)
+        except tk.TclError:
+            pass  # Просмотр без форматирования
+        text.configure(state="disabled")
+
+    def show_selected(self, event: Optional[tk.Event] = None) -> None:
+        """Показ обеих версий выбранного конфликта."""
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        conflict = self.conflicts[selection[0]]
+        try:
+            note = None if conflict.note_id is None else self.store.get_note(conflict.note_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Ошибка базы данных", f"Не удалось загрузить заметку: {e}", parent=self.window)
+            return
+        if note is None:
+            self.show_version(self.local_title, self.local_text, "(удалена на этом компьютере)", "", [])
+        else:
+            title, content, _, spans = note
+            self.show_version(self.local_title, self.local_text, title, content, spans)
+        remote = conflict.remote
+        if remote["deleted"]:
+            self.show_version(self.remote_title, self.remote_text, "(удалена на другом компьютере)", "", [])
+        else:
+            self.show_version(self.remote_title, self.remote_text, remote["title"], remote["content"],
+                              [tuple(span) for span in remote.get("format", ())])
+
+    def resolve(self, handler: ResolveHandler) -> None:
+        """Разрешение выбранного конфликта и удаление его из списка."""
+        selection = self.listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Ошибка выбора", "Выберите заметку!", parent=self.window)
+            return
+        index = selection[0]
+        if not handler(self.conflicts[index]):
+            return
+        del self.conflicts[index]
+        self.listbox.delete(index)
+        if not self.conflicts:
+            self.window.destroy()
+            return
+        self.listbox.selection_set(min(index, len(self.conflicts) - 1))
+        self.show_selected()
@@ -0,0 +1,42 @@
+import tkinter as tk
+import unittest
+
+from formatting import MarkupHighlighter
+
+
+class MarkupHighlighterTest(unittest.TestCase):
+    """Подсветка разметки при загрузке заметки порциями в конец текста (как load_note_chunk)."""
+
+    def setUp(self) -> None:
+        try:
+            self.root = tk.Tk()
+        except tk.TclError as e:
+            self.skipTest(f"нет дисплея для Tk: {e}")
+        self.root.withdraw()
+        self.text = tk.Text(self.root)
+        self.highlighter = MarkupHighlighter(self.text)
+
+    def tearDown(self) -> None:
+        self.root.destroy()
+
+    def load_chunks(self, *chunks: str) -> None:
+        for chunk in chunks:
+            self.text.insert(tk.END, chunk)
+            self.highlighter.refresh()
+
+    def ranges(self, tag: str) -> list:
+        return [str(index) for index in self.text.tag_ranges(tag)]
+
+    def test_first_line_markup(self) -> None:
+        self.load_chunks("*жирный* и _курсив_\nвторая ", "строка ~подчеркнуто~\n")
+        self.assertEqual(self.ranges("markup_bold"), ["1.0", "1.8"])
+        self.assertEqual(self.ranges("markup_italic"), ["1.11", "1.19"])
+        self.assertEqual(self.ranges("markup_underline"), ["2.14", "2.27"])
+
+    def test_markup_across_chunks(self) -> None:
+        self.load_chunks("начало *жир", "ный* конец")
+        self.assertEqual(self.ranges("markup_bold"), ["1.7", "1.15"])
+
+
+if __name__ == "__main__":
+    unittest.main()
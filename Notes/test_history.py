@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from store import NoteStore
+
+
+class RevisionHistoryTest(unittest.TestCase):
+    """Восстановление версий из истории (полные версии и разницы)."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "notes.db")
+        self.store = NoteStore(self.path)
+        self.category_id = self.store.add_category("Тест")
+
+    def tearDown(self) -> None:
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def assertRevisions(self, note_id: int, expected: list) -> None:
+        revisions = sorted(revision for revision, _, _ in self.store.revisions(note_id))
+        self.assertEqual([self.store.get_revision(note_id, revision)[1] for revision in revisions], expected)
+
+    def test_round_trip(self) -> None:
+        contents = ["".join(f"строка {line} правка {version}\n" if line % 7 == version % 7 else f"строка {line}\n"
+                            for line in range(40)) for version in range(61)]
+        note_id = self.store.create_note("заметка", contents[0], self.category_id)
+        for content in contents[1:]:
+            self.store.update_note(note_id, "заметка", content, self.category_id)
+        self.assertRevisions(note_id, contents)
+
+    def test_external_write(self) -> None:
+        note_id = self.store.create_note("заметка", "первая\n", self.category_id)
+        self.store.update_note(note_id, "заметка", "EXTERNAL\nx\ny\n", self.category_id)
+        # Запись из другого соединения в обход NoteStore.update_note
+        other = self.store.open_connection()
+        try:
+            with other:
+                other.execute("UPDATE notes SET content = ? WHERE id = ?", ("A\nB\nC\n", note_id))
+        finally:
+            other.close()
+        self.store.update_note(note_id, "заметка", "A\nB\nC\nD\n", self.category_id)
+        self.assertRevisions(note_id, ["первая\n", "EXTERNAL\nx\ny\n", "A\nB\nC\n", "A\nB\nC\nD\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()